@@ -0,0 +1,526 @@
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import tarfile
+import zipfile
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CATALOG_PATH, ConfigManager
+from control import RunControl
+from catalog import LibraryCatalog
+from file_ops import FileUtils
+from scheduler import LocalityScheduler
+
+ARCHIVE_FORMATS = ("zip", "tar")
+INDEX_SUFFIX = ".idx"
+PARTIAL_SUFFIX = ".partial"
+DEFAULT_WORKERS = 4
+# Bytes the reader threads may hold ahead of the writer.
+PREFETCH_BYTES = 256 << 20
+# Files larger than this are not prefetched; the writer copies them straight from disk.
+STREAM_THRESHOLD = 32 << 20
+COPY_CHUNK = 1 << 20
+ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+ZIP_EARLIEST = (1980, 1, 1, 0, 0, 0)
+
+
+def _crc_copy(src, dst, size: int, control: RunControl | None = None) -> int:
+    """Copy size bytes from src to dst (None: only read them) and return their CRC-32."""
+    crc, left = 0, size
+    while left:
+        if control and not control.checkpoint():
+            raise InterruptedError
+        chunk = src.read(min(COPY_CHUNK, left))
+        if not chunk:
+            raise OSError(f"Unexpected end of data, {left} bytes short")
+        crc = zlib.crc32(chunk, crc)
+        if dst is not None:
+            dst.write(chunk)
+        left -= len(chunk)
+    return crc
+
+
+def _fsync_path(path: str) -> None:
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+class ArchiveIndex:
+    """Sidecar index of a packed folder, stored next to the container as <archive>.idx.
+
+    members maps each relative path to (data offset, size, mtime_ns, mode, crc32),
+    so one member is read with a single seek into the container, without parsing
+    it; dirs maps folders (including "" for the packed folder itself) to
+    (mtime_ns, mode), so unpacking restores the exact tree, empty folders and
+    nanosecond timestamps included. The index is written last: an archive without
+    one is incomplete.
+    """
+
+    VERSION = 1
+
+    def __init__(self, archive_path: str, fmt: str, folder: str, members: dict | None = None,
+                 dirs: dict | None = None):
+        self.archive_path = os.path.abspath(archive_path)
+        self.format = fmt
+        self.folder = folder
+        self.members: dict[str, list] = members or {}
+        self.dirs: dict[str, list] = dirs or {}
+
+    @staticmethod
+    def path_for(archive_path: str) -> str:
+        return archive_path + INDEX_SUFFIX
+
+    @property
+    def folder_path(self) -> str:
+        return os.path.join(os.path.dirname(self.archive_path), self.folder)
+
+    @classmethod
+    def load(cls, archive_path: str) -> "ArchiveIndex":
+        with open(cls.path_for(archive_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != cls.VERSION:
+            raise ValueError(f"Unsupported archive index version: {data.get('version')}")
+        return cls(archive_path, data["format"], data["folder"], data["members"], data["dirs"])
+
+    def save(self) -> None:
+        path = self.path_for(self.archive_path)
+        tmp = path + PARTIAL_SUFFIX
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.VERSION, "format": self.format, "folder": self.folder,
+                       "created": time.time(), "dirs": self.dirs, "members": self.members}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def total_bytes(self) -> int:
+        return sum(m[1] for m in self.members.values())
+
+    def open(self):
+        return open(self.archive_path, 'rb')
+
+    def read(self, member: str, f=None) -> bytes:
+        """Content of one member, checked against its CRC-32."""
+        offset, size, _, _, crc = self.members[member]
+        own = f is None
+        f = f or self.open()
+        try:
+            f.seek(offset)
+            data = f.read(size)
+        finally:
+            if own:
+                f.close()
+        if len(data) != size or zlib.crc32(data) != crc:
+            raise OSError(f"Archive member is damaged: {member}")
+        return data
+
+    def extract(self, member: str, dest: str, f=None, control: RunControl | None = None) -> None:
+        """Write one member to dest with its original mode and mtime."""
+        offset, size, mtime_ns, mode, crc = self.members[member]
+        own = f is None
+        f = f or self.open()
+        try:
+            f.seek(offset)
+            with open(dest, 'xb') as out:
+                if _crc_copy(f, out, size, control) != crc:
+                    raise OSError(f"Archive member is damaged: {member}")
+        finally:
+            if own:
+                f.close()
+        os.chmod(dest, mode & 0o7777)
+        os.utime(dest, ns=(mtime_ns, mtime_ns))
+
+
+class FolderArchiver:
+    """Packs finished library folders into single uncompressed containers and back.
+
+    A folder like <library>/2019 becomes <library>/2019.zip (or .tar) plus its
+    ArchiveIndex. Files are read by a pool of threads in disk order, up to
+    PREFETCH_BYTES ahead of the writer, and streamed into the container in that
+    order; large files are copied by the writer directly. Before any original is
+    removed the container is read back and every member is checked against the
+    CRC taken while reading its source, and the catalog rows of the folder are
+    marked archived, so scrubs, pruning and duplicate checks leave them alone. A
+    file that changed while it was packed aborts the pack. Containers and indexes
+    carry no media extension, so library scans never look inside them.
+    """
+
+    def __init__(self, catalog: LibraryCatalog | None = None, fmt: str = "zip", max_workers: int = DEFAULT_WORKERS,
+                 control: RunControl | None = None, log_fn=print, progress_fn=None):
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format: {fmt}")
+        self.catalog = catalog
+        self.format = fmt
+        self.max_workers = max(max_workers, 1)
+        self.scheduler = LocalityScheduler(self.max_workers)
+        self.control = control or RunControl()
+        self.log_fn = log_fn or (lambda msg: None)
+        self.progress_fn = progress_fn
+
+    @classmethod
+    def from_config(cls, config: dict, catalog: LibraryCatalog | None = None, **kwargs) -> "FolderArchiver":
+        cfg = config.get("archive", {})
+        kwargs.setdefault("fmt", cfg.get("format", "zip"))
+        kwargs.setdefault("max_workers", cfg.get("workers", DEFAULT_WORKERS))
+        return cls(catalog, **kwargs)
+
+    def archive_path_for(self, folder: str) -> str:
+        return os.path.abspath(folder).rstrip("\\/") + "." + self.format
+
+    # -- pack -----------------------------------------------------------------
+
+    def pack(self, folder: str) -> str | None:
+        """Pack folder into a container next to it and remove the originals; returns the archive path."""
+        folder = os.path.abspath(folder).rstrip("\\/")
+        if not os.path.isdir(folder):
+            raise ValueError(f"Not a folder: {folder}")
+        archive_path = self.archive_path_for(folder)
+        if os.path.exists(ArchiveIndex.path_for(archive_path)):
+            # A previous pack finished the archive but was stopped while removing originals.
+            self.log_fn(f"{archive_path} already exists; removing the originals it holds.")
+            self._remove_originals(ArchiveIndex.load(archive_path))
+            return archive_path
+        if os.path.exists(archive_path):
+            raise ValueError(f"Archive already exists without an index: {archive_path}")
+
+        files, dirs = self._list_tree(folder)
+        total = sum(st[0] for st in files.values())
+        self.log_fn(f"Packing {len(files)} files ({total / (1 << 30):.2f} GB) from {folder}...")
+        index = ArchiveIndex(archive_path, self.format, os.path.basename(folder), dirs=dirs)
+        partial = archive_path + PARTIAL_SUFFIX
+        try:
+            crcs = self._write(folder, files, index, partial, total)
+            if crcs is None:
+                self.log_fn("Packing cancelled.")
+                return None
+            if self.format == "zip":
+                self._locate_zip_data(partial, index)
+            _fsync_path(partial)
+            if not self._verify(partial, index, crcs):
+                return None
+            os.replace(partial, archive_path)
+            index.save()
+        except InterruptedError:
+            self.log_fn("Packing cancelled.")
+            return None
+        except Exception as e:
+            self.log_fn(f"Packing {folder} failed: {e}")
+            return None
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        self.log_fn(f"Packed {len(files)} files into {archive_path}.")
+        self._remove_originals(index)
+        return archive_path
+
+    @staticmethod
+    def _list_tree(folder: str) -> tuple[dict, dict]:
+        """{rel: (size, mtime_ns, mode)} of the files and {rel: [mtime_ns, mode]} of the folders."""
+        files, dirs = {}, {}
+        for root, subdirs, names in FileUtils.fast_walk(folder):
+            rel_root = os.path.relpath(root, folder).replace(os.sep, "/")
+            rel_root = "" if rel_root == "." else rel_root
+            st = os.stat(root)
+            dirs[rel_root] = [st.st_mtime_ns, st.st_mode]
+            for name in names:
+                st = os.stat(os.path.join(root, name))
+                files[f"{rel_root}/{name}" if rel_root else name] = (st.st_size, st.st_mtime_ns, st.st_mode)
+        return files, dirs
+
+    def _write(self, folder: str, files: dict, index: ArchiveIndex, partial: str, total: int) -> dict | None:
+        """Stream all files into the container; returns {rel: crc32}, or None when cancelled."""
+        paths = {os.path.join(folder, rel.replace("/", os.sep)): rel for rel in files}
+        order = [paths[p] for p in self.scheduler.order_reads(list(paths))]
+        crcs, done = {}, 0
+
+        if self.format == "zip":
+            container = zipfile.ZipFile(partial, "w", zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            container = tarfile.open(partial, "w", format=tarfile.PAX_FORMAT)
+        with container, ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pack") as executor:
+            for rel in sorted(index.dirs):
+                if rel:
+                    self._add_dir(container, rel, *index.dirs[rel])
+
+            ahead, ahead_bytes, queued = deque(), 0, iter(order)
+            pending = next(queued, None)
+            while ahead or pending is not None:
+                while pending is not None and (not ahead or ahead_bytes < PREFETCH_BYTES):
+                    size = files[pending][0]
+                    future = None
+                    if size <= STREAM_THRESHOLD:
+                        future = executor.submit(self._read, os.path.join(folder, pending), files[pending])
+                        ahead_bytes += size
+                    ahead.append((pending, future))
+                    pending = next(queued, None)
+
+                rel, future = ahead.popleft()
+                if not self.control.checkpoint():
+                    for _, f in ahead:
+                        if f:
+                            f.cancel()
+                    return None
+                size, mtime_ns, mode = files[rel]
+                src = os.path.join(folder, rel.replace("/", os.sep))
+                if future:
+                    ahead_bytes -= size
+                    data, crc = future.result()
+                    offset = self._add_bytes(container, rel, data, mtime_ns, mode)
+                else:
+                    with open(src, 'rb') as f:
+                        offset, crc = self._add_stream(container, rel, f, size, mtime_ns, mode)
+                        self._check_unchanged(src, os.fstat(f.fileno()), files[rel])
+                index.members[rel] = [offset, size, mtime_ns, mode, crc]
+                crcs[rel] = crc
+                done += size
+                if self.progress_fn and total:
+                    self.progress_fn(int(done * 100 / total))
+        return crcs
+
+    @staticmethod
+    def _read(path: str, expected: tuple) -> tuple[bytes, int]:
+        with open(path, 'rb') as f:
+            data = f.read()
+            FolderArchiver._check_unchanged(path, os.fstat(f.fileno()), expected)
+        return data, zlib.crc32(data)
+
+    @staticmethod
+    def _check_unchanged(path: str, st: os.stat_result, expected: tuple) -> None:
+        if (st.st_size, st.st_mtime_ns) != expected[:2]:
+            raise OSError(f"{path} changed while it was being packed")
+
+    @staticmethod
+    def _zip_info(rel: str, mtime_ns: int, mode: int) -> zipfile.ZipInfo:
+        date_time = max(time.localtime(mtime_ns / 1e9)[:6], ZIP_EARLIEST)
+        info = zipfile.ZipInfo(rel, date_time=date_time)
+        info.compress_type = zipfile.ZIP_STORED
+        info.external_attr = (mode & 0xFFFF) << 16
+        return info
+
+    def _add_dir(self, container, rel: str, mtime_ns: int, mode: int) -> None:
+        if self.format == "zip":
+            info = self._zip_info(rel + "/", mtime_ns, mode)
+            info.external_attr |= 0x10
+            container.writestr(info, b"")
+        else:
+            info = tarfile.TarInfo(rel)
+            info.type, info.mode, info.mtime = tarfile.DIRTYPE, mode & 0o7777, mtime_ns / 1e9
+            container.addfile(info)
+
+    def _add_bytes(self, container, rel: str, data: bytes, mtime_ns: int, mode: int) -> int:
+        """Append one member and return its data offset (for ZIP, its header offset until _locate_zip_data)."""
+        if self.format == "zip":
+            info = self._zip_info(rel, mtime_ns, mode)
+            container.writestr(info, data)
+            return info.header_offset
+        info = tarfile.TarInfo(rel)
+        info.size, info.mode, info.mtime = len(data), mode & 0o7777, mtime_ns / 1e9
+        container.addfile(info, _BytesReader(data))
+        return container.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+    def _add_stream(self, container, rel: str, f, size: int, mtime_ns: int, mode: int) -> tuple[int, int]:
+        if self.format == "zip":
+            info = self._zip_info(rel, mtime_ns, mode)
+            info.file_size = size
+            with container.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+                crc = _crc_copy(f, dst, size, self.control)
+            return info.header_offset, crc
+        reader = _CrcReader(f)
+        info = tarfile.TarInfo(rel)
+        info.size, info.mode, info.mtime = size, mode & 0o7777, mtime_ns / 1e9
+        container.addfile(info, reader)
+        return container.offset - -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE, reader.crc
+
+    @staticmethod
+    def _locate_zip_data(path: str, index: ArchiveIndex) -> None:
+        """Turn ZIP local header offsets into data offsets (headers carry variable-length extras)."""
+        with open(path, 'rb') as f:
+            for member in index.members.values():
+                f.seek(member[0])
+                fields = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+                if fields[0] != zipfile.stringFileHeader:
+                    raise OSError("Bad ZIP local header")
+                member[0] += ZIP_LOCAL_HEADER.size + fields[-2] + fields[-1]
+
+    def _verify(self, path: str, index: ArchiveIndex, crcs: dict) -> bool:
+        """Read every member back through the index, in container order, and compare CRCs."""
+        self.log_fn("Verifying archive...")
+        with open(path, 'rb') as f:
+            for rel, (offset, size, *_) in sorted(index.members.items(), key=lambda m: m[1][0]):
+                if not self.control.checkpoint():
+                    self.log_fn("Packing cancelled.")
+                    return False
+                f.seek(offset)
+                if _crc_copy(f, None, size) != crcs[rel]:
+                    self.log_fn(f"Verification failed for {rel}; originals kept.")
+                    return False
+        return True
+
+    def _mark_archived(self, paths: list[str], archive_path: str | None) -> None:
+        if self.catalog:
+            self.catalog.set_archive(paths, archive_path)
+            self.catalog.flush()
+
+    def _remove_originals(self, index: ArchiveIndex) -> None:
+        """Delete the originals the archive holds, marking them archived in the catalog first.
+
+        Files changed since packing, and files added to the folder later, are left
+        in place and stay unarchived in the catalog.
+        """
+        folder = index.folder_path
+        kept, archived, present = 0, [], []
+        for rel, (_, size, mtime_ns, _, _) in index.members.items():
+            path = os.path.join(folder, rel.replace("/", os.sep))
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                archived.append(path)  # removed by an earlier, interrupted attempt
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self.log_fn(f"Kept {path}: it differs from the archived copy.")
+                kept += 1
+                continue
+            archived.append(path)
+            present.append(path)
+        self._mark_archived(archived, index.archive_path)
+        for path in present:
+            os.remove(path)
+        for rel in sorted(index.dirs, key=len, reverse=True):
+            try:
+                os.rmdir(os.path.join(folder, rel.replace("/", os.sep)) if rel else folder)
+            except OSError:
+                pass
+        if os.path.exists(folder):
+            self.log_fn(f"{folder} still holds {kept} changed or newly added entries; they were not archived.")
+
+    # -- unpack ---------------------------------------------------------------
+
+    def unpack(self, archive_path: str) -> str | None:
+        """Restore the packed folder exactly and remove the archive; returns the folder."""
+        archive_path = os.path.abspath(archive_path)
+        index = ArchiveIndex.load(archive_path)
+        folder = index.folder_path
+        clashes = [rel for rel in index.members if os.path.lexists(os.path.join(folder, rel.replace("/", os.sep)))]
+        if clashes:
+            raise ValueError(f"{os.path.join(folder, clashes[0])} already exists; move it away before unpacking")
+
+        total, done = index.total_bytes(), 0
+        self.log_fn(f"Unpacking {len(index.members)} files ({total / (1 << 30):.2f} GB) into {folder}...")
+        for rel in sorted(index.dirs):
+            os.makedirs(os.path.join(folder, rel.replace("/", os.sep)), exist_ok=True)
+        written = []
+        try:
+            with index.open() as f:
+                for rel, member in sorted(index.members.items(), key=lambda m: m[1][0]):
+                    dest = os.path.join(folder, rel.replace("/", os.sep))
+                    written.append(dest)
+                    index.extract(rel, dest, f, self.control)
+                    done += member[1]
+                    if self.progress_fn and total:
+                        self.progress_fn(int(done * 100 / total))
+        except (InterruptedError, OSError) as e:
+            for path in written:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.log_fn("Unpacking cancelled." if isinstance(e, InterruptedError) else f"Unpacking failed: {e}")
+            return None
+
+        # Folder times last: creating their entries above changed them.
+        for rel in sorted(index.dirs, key=len, reverse=True):
+            mtime_ns, mode = index.dirs[rel]
+            path = os.path.join(folder, rel.replace("/", os.sep))
+            os.chmod(path, mode & 0o7777)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        self._mark_archived(written, None)
+        os.remove(ArchiveIndex.path_for(archive_path))
+        os.remove(archive_path)
+        self.log_fn(f"Unpacked {len(index.members)} files into {folder}.")
+        return folder
+
+
+class _BytesReader:
+    """Minimal file object over bytes for TarFile.addfile, without copying them into a BytesIO."""
+
+    def __init__(self, data: bytes):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size < 0 else self._pos + size
+        chunk = self._view[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+
+class _CrcReader:
+    """File wrapper that keeps a running CRC-32 of what TarFile.addfile reads."""
+
+    def __init__(self, f):
+        self._f = f
+        self.crc = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._f.read(size)
+        self.crc = zlib.crc32(chunk, self.crc)
+        return chunk
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="archive", description="Pack finished library folders into indexed archives.")
+    parser.add_argument("--db", default=CATALOG_PATH, help="catalog database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("pack", help="pack folders (e.g. years) into archives and remove the originals")
+    p.add_argument("folders", nargs="+")
+    p.add_argument("--format", choices=ARCHIVE_FORMATS)
+    p.add_argument("--workers", type=int, help="reader threads")
+    p = sub.add_parser("unpack", help="restore archived folders")
+    p.add_argument("archives", nargs="+")
+    p = sub.add_parser("list", help="list the files in an archive")
+    p.add_argument("archive")
+    p = sub.add_parser("extract", help="copy single files out of an archive")
+    p.add_argument("archive")
+    p.add_argument("members", nargs="+", help="paths relative to the archived folder")
+    p.add_argument("-o", "--output", default=".", help="destination folder")
+
+    args = parser.parse_args(argv)
+    if args.command in ("list", "extract"):
+        index = ArchiveIndex.load(args.archive)
+        if args.command == "list":
+            for rel, (_, size, mtime_ns, _, _) in sorted(index.members.items()):
+                print(f"{size}\t{time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime_ns / 1e9))}\t{rel}")
+            return 0
+        missing = [m for m in args.members if m.replace(os.sep, "/") not in index.members]
+        if missing:
+            print(f"Not in archive: {missing[0]}")
+            return 1
+        with index.open() as f:
+            for member in args.members:
+                dest = os.path.join(args.output, os.path.basename(member))
+                index.extract(member.replace(os.sep, "/"), dest, f)
+                print(dest)
+        return 0
+
+    catalog = LibraryCatalog(args.db)
+    try:
+        kwargs = {k: v for k, v in (("fmt", getattr(args, "format", None)),
+                                    ("max_workers", getattr(args, "workers", None))) if v}
+        archiver = FolderArchiver.from_config(ConfigManager.load(), catalog, **kwargs)
+        failed = 0
+        if args.command == "pack":
+            for folder in args.folders:
+                failed += archiver.pack(folder) is None
+        else:
+            for archive in args.archives:
+                failed += archiver.unpack(archive) is None
+        return 1 if failed else 0
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
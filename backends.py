@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import concurrent.futures
+from multiprocessing import cpu_count
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import psutil
+
+from config import BACKEND_BENCH_PATH, file_exts, ConfigManager
+from file_ops import FileUtils
+from rules import ScanRules
+
+BACKENDS = ("process", "thread", "interpreter")
+# How long the one-off check that extraction workers can start in a subinterpreter may take.
+INTERPRETER_PROBE_SECONDS = 30
+# Sampling period of the benchmark's memory probe.
+RSS_SAMPLE_SECONDS = 0.1
+
+
+def free_threaded() -> bool:
+    """True on a free-threaded (3.13t+) build running with the GIL disabled."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return bool(is_gil_enabled) and not is_gil_enabled()
+
+
+def interpreter_key() -> str:
+    """Identifies this interpreter build on this machine; benchmark results are kept per key."""
+    return f"{sys.implementation.cache_tag}{'t' if free_threaded() else ''}-{platform.machine()}-{cpu_count()}"
+
+
+class ExtractBackend:
+    """Where FileGatherer.extract_paths runs its extraction chunks.
+
+    "process" (the default) runs them in worker processes: full parallelism for
+    header parsing under the GIL, at the cost of pickling every path and result
+    and one interpreter's memory per worker. "thread" runs them in this process,
+    sharing the caller's place index and events; it wins on free-threaded builds,
+    where parsing runs in parallel, and on I/O-bound libraries (network shares,
+    card readers) where workers mostly wait. "interpreter" uses subinterpreters
+    (Python 3.14+), isolated like processes but without process start-up; it
+    needs every extension module imported by the workers to support them, so it
+    counts as available only once a worker has imported the extraction modules.
+
+    "auto" takes threads on a free-threaded build, otherwise the fastest backend
+    measured by `python backends.py <library> --save` for this interpreter, and
+    processes when nothing was measured.
+    """
+
+    default = "auto"
+    _interpreter_ok: bool | None = None
+
+    @classmethod
+    def configure(cls, config: dict) -> None:
+        cls.default = config.get("extract_backend", "auto")
+
+    @classmethod
+    def available(cls, name: str) -> bool:
+        if name == "interpreter":
+            if cls._interpreter_ok is None:
+                cls._interpreter_ok = cls._probe_interpreter()
+            return cls._interpreter_ok
+        return name in BACKENDS
+
+    @staticmethod
+    def _probe_interpreter() -> bool:
+        """Whether a subinterpreter worker can import the extraction modules (PySide6, Pillow, psutil...)."""
+        if not hasattr(concurrent.futures, "InterpreterPoolExecutor"):
+            return False
+        try:
+            with concurrent.futures.InterpreterPoolExecutor(max_workers=1) as executor:
+                return executor.submit(_import_extraction).result(timeout=INTERPRETER_PROBE_SECONDS)
+        except Exception:
+            return False
+
+    @staticmethod
+    def measured() -> dict:
+        try:
+            with open(BACKEND_BENCH_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f).get(interpreter_key(), {})
+        except Exception:
+            return {}
+
+    @classmethod
+    def resolve(cls, name: str | None = None) -> str:
+        name = name or cls.default
+        if name == "auto":
+            if free_threaded():
+                return "thread"
+            name = cls.measured().get("backend", "process")
+        return name if cls.available(name) else "process"
+
+    @staticmethod
+    def max_workers(name: str) -> int:
+        if name == "thread":
+            # Threads mostly wait on reads under the GIL, so more of them than cores still helps.
+            return min(cpu_count() + 4, 16)
+        return min(cpu_count(), 4)
+
+    @staticmethod
+    def executor(name: str, max_workers: int, initializer, initargs: tuple):
+        """A pool for the backend; thread pools take no initializer (each chunk carries its context)."""
+        if name == "thread":
+            return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract")
+        if name == "interpreter":
+            return concurrent.futures.InterpreterPoolExecutor(max_workers=max_workers, initializer=initializer,
+                                                               initargs=initargs)
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+
+
+def _import_extraction() -> bool:
+    # Everything extract_chunk needs comes in with metadata, including config's PySide6 import.
+    import metadata
+    return metadata is not None
+
+
+class _RssProbe:
+    """Peak resident memory of this process and its children while a benchmark runs."""
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-probe", daemon=True)
+
+    def _run(self) -> None:
+        me = psutil.Process()
+        while True:
+            total = 0
+            for proc in [me] + me.children(recursive=True):
+                try:
+                    total += proc.memory_info().rss
+                except psutil.Error:
+                    continue
+            self.peak = max(self.peak, total)
+            if self._stop.wait(RSS_SAMPLE_SECONDS):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Read-only benchmark: date the same sample of a library with each extraction backend."""
+    from metadata import FileGatherer
+
+    p = argparse.ArgumentParser(prog="backends", description="Compare extraction backends on a library without changing it.")
+    p.add_argument("base_dir")
+    p.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated backends to compare")
+    p.add_argument("--limit", type=int, default=2000, help="date at most this many files per backend")
+    p.add_argument("--save", action="store_true", help="let \"auto\" use the fastest backend from now on")
+    args = p.parse_args(argv)
+
+    rules = ScanRules.from_config(ConfigManager.load())
+    paths = []
+    for root, _, files in FileUtils.fast_walk(args.base_dir, rules=rules):
+        paths += [os.path.join(root, f) for f in files if os.path.splitext(f)[1].lower() in file_exts]
+        if len(paths) >= args.limit:
+            break
+    paths = paths[:args.limit]
+    if not paths:
+        print("No media files found.")
+        return 1
+    print(f"{interpreter_key()}: {len(paths)} files, GIL {'disabled' if free_threaded() else 'enabled'}")
+    # Untimed pass so every backend reads from a warm page cache.
+    for _ in FileGatherer.extract_paths(paths, backend="thread"):
+        pass
+
+    results = {}
+    for name in args.backends.split(","):
+        if not ExtractBackend.available(name):
+            print(f"{name:>11}: not available here")
+            continue
+        started = time.perf_counter()
+        try:
+            with _RssProbe() as probe:
+                dated = sum(1 for _, iso, _ in FileGatherer.extract_paths(paths, backend=name) if iso)
+        except Exception as e:
+            print(f"{name:>11}: failed ({type(e).__name__}: {e})")
+            continue
+        elapsed = time.perf_counter() - started
+        results[name] = len(paths) / elapsed
+        print(f"{name:>11}: {dated} dated in {elapsed:.2f}s, {results[name]:.0f} files/s, "
+              f"{ExtractBackend.max_workers(name)} workers, peak RSS {probe.peak / (1 << 20):.0f} MB")
+
+    if args.save and results:
+        best = max(results, key=results.get)
+        try:
+            with open(BACKEND_BENCH_PATH, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except Exception:
+            saved = {}
+        saved[interpreter_key()] = {"backend": best, "files_per_sec": results, "measured": time.time()}
+        with open(BACKEND_BENCH_PATH, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, indent=4)
+        print(f"\"auto\" now uses {best} on this interpreter.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,464 @@
+import io
+import os
+import heapq
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from PySide6.QtCore import Qt, QObject, QAbstractListModel, QModelIndex, QSize, QTimer, QUrl, Signal
+from PySide6.QtGui import QDesktopServices, QIcon, QImage, QPixmap
+from PySide6.QtWidgets import (QAbstractItemView, QLabel, QListView, QSplitter, QTreeWidget, QTreeWidgetItem,
+                               QVBoxLayout, QWidget)
+
+from config import THUMB_CACHE_DIR, VIDEO_EXTS, file_exts
+from extractors import SNIFF_BYTES, embedded_previews
+from file_ops import FolderNameGenerator
+
+THUMB_SIZE = 160
+THUMB_QUALITY = 80
+DEFAULT_CACHE_MB = 512
+DEFAULT_WORKERS = 4
+# Embedded previews below this are usually the 160x120 EXIF thumbnail; a larger one is preferred.
+MIN_PREVIEW_BYTES = 24 * 1024
+# Larger "previews" are full-size images or the raw data itself.
+MAX_PREVIEW_BYTES = 8 * 1024 * 1024
+# Grid rows beyond each edge of the viewport that are loaded ahead at lower priority.
+PREFETCH_ROWS = 2
+# Decoded thumbnails kept in memory per browser.
+MEMORY_THUMBS = 2000
+# RAW files are organized into this subfolder of their date folder; the browser shows them with it.
+RAW_FOLDER = "Raw"
+
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+class ThumbnailCache:
+    """Size-bounded on-disk cache of JPEG thumbnails keyed by (path, mtime, size).
+
+    An edited or replaced file gets a new key, so stale thumbnails are never served;
+    they simply stop being read. Each hit bumps the entry's mtime, and when the cache
+    outgrows max_bytes the least recently used entries are deleted down to TRIM_TO.
+    """
+
+    TRIM_TO = 0.8
+
+    def __init__(self, root: str = THUMB_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MB << 20):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._used: int | None = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ThumbnailCache":
+        return cls(max_bytes=int(config.get("thumbnail_cache_mb", DEFAULT_CACHE_MB)) << 20)
+
+    @staticmethod
+    def key(path: str, st: os.stat_result) -> str:
+        raw = f"{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}"
+        return hashlib.sha1(raw.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".jpg")
+
+    def get(self, key: str) -> bytes | None:
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._file(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._used = self._measure() if self._used is None else self._used + len(data)
+            if self._used > self.max_bytes:
+                self._trim()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        try:
+            buckets = [e.path for e in os.scandir(self.root) if e.is_dir()]
+        except OSError:
+            return entries
+        for bucket in buckets:
+            try:
+                with os.scandir(bucket) as it:
+                    for entry in it:
+                        if entry.name.endswith(".jpg"):
+                            st = entry.stat()
+                            entries.append((st.st_mtime, st.st_size, entry.path))
+            except OSError:
+                continue
+        return entries
+
+    def _measure(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _trim(self) -> None:
+        entries = sorted(self._entries())
+        used = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * self.TRIM_TO)
+        for _, size, path in entries:
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                pass
+        self._used = used
+
+
+class PreviewExtractor:
+    @staticmethod
+    def thumbnail(path: str, size: int = THUMB_SIZE) -> bytes | None:
+        """JPEG-encoded thumbnail of a photo, without decoding it at full size.
+
+        RAW files use the best embedded preview, JPEGs are decoded with draft()
+        (DCT scaling to the nearest 1/2, 1/4 or 1/8), and other formats Pillow can
+        open are reduced with thumbnail(). Videos and unreadable files give None.
+        """
+        if os.path.splitext(path)[1].lower() in VIDEO_EXTS:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                img = PreviewExtractor._embedded(f, f.read(SNIFF_BYTES), size)
+                if img is None:
+                    f.seek(0)
+                    img = Image.open(f)
+                    if img.format == "JPEG":
+                        img.draft("RGB", (size, size))
+                    img = ImageOps.exif_transpose(img)
+                img = img.convert("RGB")
+                img.thumbnail((size, size), reducing_gap=2.0)
+        except (UnidentifiedImageError, OSError, ValueError):
+            return None
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=THUMB_QUALITY)
+        return out.getvalue()
+
+    @staticmethod
+    def _embedded(f, head: bytes, size: int) -> Image.Image | None:
+        spans, orientation = embedded_previews(f, head)
+        # Smallest preview that is not a tiny EXIF thumbnail first, then the largest of those.
+        large = sorted((s for s in spans if MIN_PREVIEW_BYTES <= s[1] <= MAX_PREVIEW_BYTES), key=lambda s: s[1])
+        small = sorted((s for s in spans if s[1] < MIN_PREVIEW_BYTES), key=lambda s: -s[1])
+        for offset, length in large + small:
+            f.seek(offset)
+            try:
+                img = Image.open(io.BytesIO(f.read(length)))
+                if img.format != "JPEG":
+                    continue
+                img.draft("RGB", (size, size))
+                img.load()
+            except (UnidentifiedImageError, OSError):
+                continue
+            if orientation in ORIENTATION_TRANSPOSE:
+                img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+            return img
+        return None
+
+
+class ThumbnailLoader(QObject):
+    """Loads thumbnails on worker threads, serving the most urgent requests first.
+
+    Requests carry a priority (VISIBLE before PREFETCH). retain() replaces the
+    whole wanted set as the view scrolls: queued requests for cells that are no
+    longer near the viewport are dropped before any work is done on them.
+    Results go through the disk cache and are emitted as QImages; a null image
+    means the file has no thumbnail.
+    """
+
+    loaded = Signal(str, QImage)
+
+    VISIBLE, PREFETCH = 0, 1
+
+    def __init__(self, cache: ThumbnailCache, workers: int = DEFAULT_WORKERS):
+        super().__init__()
+        self.cache = cache
+        self._heap: list[tuple[int, int, str]] = []
+        self._queued: dict[str, int] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._run, name=f"thumbnail-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+    def request(self, path: str, priority: int = VISIBLE) -> None:
+        with self._cond:
+            self._push(path, priority)
+
+    def retain(self, wanted: dict[str, int]) -> None:
+        """Keep only the given {path: priority} requests queued, adding any that are missing."""
+        with self._cond:
+            self._queued = {p: q for p, q in self._queued.items() if p in wanted}
+            for path, priority in wanted.items():
+                self._push(path, priority)
+            if len(self._heap) > 4 * len(self._queued) + 64:
+                self._heap = [e for e in self._heap if self._queued.get(e[2]) == e[0]]
+                heapq.heapify(self._heap)
+
+    def _push(self, path: str, priority: int) -> None:
+        if self._queued.get(path, priority + 1) <= priority:
+            return
+        self._queued[path] = priority
+        heapq.heappush(self._heap, (priority, next(self._seq), path))
+        self._cond.notify()
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._queued.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+
+    def _next(self) -> str | None:
+        with self._cond:
+            while not self._stopped:
+                while self._heap:
+                    priority, _, path = heapq.heappop(self._heap)
+                    # Entries whose request was dropped or re-prioritized are skipped lazily.
+                    if self._queued.get(path) == priority:
+                        del self._queued[path]
+                        return path
+                self._cond.wait()
+            return None
+
+    def _run(self) -> None:
+        while True:
+            path = self._next()
+            if path is None:
+                return
+            image = self._load(path)
+            if not self._stopped:
+                self.loaded.emit(path, image)
+
+    def _load(self, path: str) -> QImage:
+        try:
+            key = ThumbnailCache.key(path, os.stat(path))
+        except OSError:
+            return QImage()
+        data = self.cache.get(key)
+        if data is None:
+            data = PreviewExtractor.thumbnail(path)
+            if data is None:
+                return QImage()
+            self.cache.put(key, data)
+        return QImage.fromData(data)
+
+
+class FolderModel(QAbstractListModel):
+    """The files of one date folder (and its Raw subfolder), with thumbnails fetched as rows are painted."""
+
+    def __init__(self, loader: ThumbnailLoader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self._paths: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._thumbs: OrderedDict[str, QPixmap | None] = OrderedDict()
+        icon = QIcon.fromTheme("image-x-generic")
+        self._placeholder = icon.pixmap(THUMB_SIZE // 2) if not icon.isNull() else QPixmap()
+        loader.loaded.connect(self._on_loaded)
+
+    def set_folder(self, folder: str | None) -> None:
+        self.beginResetModel()
+        self._paths = self.list_files(folder) if folder else []
+        self._rows = {p: i for i, p in enumerate(self._paths)}
+        self.endResetModel()
+
+    @staticmethod
+    def list_files(folder: str) -> list[str]:
+        files = []
+        for directory in (folder, os.path.join(folder, RAW_FOLDER)):
+            try:
+                with os.scandir(directory) as it:
+                    files.extend(e.path for e in it
+                                 if e.is_file() and os.path.splitext(e.name)[1].lower() in file_exts)
+            except OSError:
+                continue
+        return sorted(files, key=lambda p: os.path.basename(p).lower())
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._paths)
+
+    def path(self, row: int) -> str:
+        return self._paths[row]
+
+    def has_thumbnail(self, path: str) -> bool:
+        return path in self._thumbs
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self._paths[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.ToolTipRole:
+            return path
+        if role == Qt.DecorationRole:
+            if path in self._thumbs:
+                self._thumbs.move_to_end(path)
+                return self._thumbs[path] or self._placeholder
+            self.loader.request(path)
+            return self._placeholder
+        return None
+
+    def _on_loaded(self, path: str, image: QImage) -> None:
+        row = self._rows.get(path)
+        if row is None:
+            return
+        self._thumbs[path] = QPixmap.fromImage(image) if not image.isNull() else None
+        while len(self._thumbs) > MEMORY_THUMBS:
+            self._thumbs.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class LibraryBrowser(QWidget):
+    """Date folders of an organized library beside a virtualized thumbnail grid.
+
+    The folder tree follows the levels FolderNameGenerator produces for the chosen
+    structure and is listed one level at a time as nodes are expanded. The grid only
+    creates thumbnails for cells in and just around the viewport.
+    """
+
+    def __init__(self, base_dir: str, structure: str, cache: ThumbnailCache | None = None,
+                 workers: int = DEFAULT_WORKERS, parent=None):
+        super().__init__(parent)
+        self.base_dir = base_dir
+        self.depth = FolderNameGenerator.depth(structure)
+        self.loader = ThumbnailLoader(cache or ThumbnailCache(), workers)
+        self.model = FolderModel(self.loader, self)
+        self.setWindowTitle(f"Library - {base_dir}")
+        self.resize(1000, 650)
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.itemExpanded.connect(self._expand)
+        self.tree.currentItemChanged.connect(self._show_folder)
+
+        self.view = QListView()
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setMovement(QListView.Static)
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.Batched)
+        self.view.setBatchSize(500)
+        self.view.setIconSize(QSize(THUMB_SIZE, THUMB_SIZE))
+        self.view.setGridSize(QSize(THUMB_SIZE + 24, THUMB_SIZE + 36))
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self._open)
+
+        self.status_label = QLabel()
+        splitter = QSplitter()
+        splitter.addWidget(self.tree)
+        splitter.addWidget(self.view)
+        splitter.setSizes([250, 750])
+        layout = QVBoxLayout(self)
+        layout.addWidget(splitter)
+        layout.addWidget(self.status_label)
+
+        # Scrolling re-targets the queue once it settles, not on every pixel.
+        self._visible_timer = QTimer(self)
+        self._visible_timer.setSingleShot(True)
+        self._visible_timer.setInterval(60)
+        self._visible_timer.timeout.connect(self._update_visible)
+        self.view.verticalScrollBar().valueChanged.connect(lambda _: self._visible_timer.start())
+        self.model.modelReset.connect(self._visible_timer.start)
+
+        self._add_children(self.tree.invisibleRootItem(), base_dir, 1)
+
+    def _add_children(self, parent: QTreeWidgetItem, folder: str, level: int) -> None:
+        try:
+            with os.scandir(folder) as it:
+                names = sorted(e.name for e in it if e.is_dir(follow_symlinks=False)
+                               and not e.name.startswith(".") and e.name != RAW_FOLDER)
+        except OSError:
+            names = []
+        for name in names:
+            item = QTreeWidgetItem(parent, [name])
+            item.setData(0, Qt.UserRole, (os.path.join(folder, name), level))
+            if level < self.depth:
+                item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+
+    def _expand(self, item: QTreeWidgetItem) -> None:
+        if item.childCount():
+            return
+        folder, level = item.data(0, Qt.UserRole)
+        self._add_children(item, folder, level + 1)
+        if not item.childCount():
+            item.setChildIndicatorPolicy(QTreeWidgetItem.DontShowIndicatorWhenChildless)
+
+    def _show_folder(self, item: QTreeWidgetItem | None) -> None:
+        folder = item.data(0, Qt.UserRole)[0] if item else None
+        self.loader.retain({})
+        self.model.set_folder(folder)
+        self.view.scrollToTop()
+        count = self.model.rowCount()
+        self.status_label.setText(f"{count} file{'s' if count != 1 else ''} in {folder}" if folder else "")
+
+    def _visible_rows(self) -> tuple[int, int] | None:
+        count = self.model.rowCount()
+        if not count:
+            return None
+        height = self.view.viewport().height()
+
+        def first_row(below):
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if below(self.view.visualRect(self.model.index(mid))):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            return lo
+
+        first = first_row(lambda r: r.bottom() >= 0)
+        last = first_row(lambda r: r.top() > height) - 1
+        return (first, last) if first <= last else None
+
+    def _update_visible(self) -> None:
+        rows = self._visible_rows()
+        if rows is None:
+            self.loader.retain({})
+            return
+        first, last = rows
+        per_row = max(1, self.view.viewport().width() // self.view.gridSize().width())
+        ahead = per_row * PREFETCH_ROWS
+        wanted = {}
+        for row in range(max(0, first - ahead), min(self.model.rowCount(), last + ahead + 1)):
+            path = self.model.path(row)
+            if not self.model.has_thumbnail(path):
+                wanted[path] = ThumbnailLoader.VISIBLE if first <= row <= last else ThumbnailLoader.PREFETCH
+        self.loader.retain(wanted)
+
+    def _open(self, index) -> None:
+        QDesktopServices.openUrl(QUrl.fromLocalFile(self.model.path(index.row())))
+
+    def closeEvent(self, event):
+        self.loader.shutdown()
+        super().closeEvent(event)
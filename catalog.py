@@ -0,0 +1,524 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+
+from config import CATALOG_PATH, PHOTO_EXTS, RAW_EXTS, VIDEO_EXTS, file_exts, ConfigManager
+from file_ops import FileUtils
+from rules import ScanRules
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path         TEXT PRIMARY KEY,
+    dir          TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    stem         TEXT NOT NULL,
+    ext          TEXT NOT NULL,
+    size         INTEGER,
+    mtime        REAL,
+    capture_date TEXT,
+    capture_day  TEXT,
+    capture_year INTEGER,
+    kind         TEXT,
+    hash         TEXT,
+    hash_tier    TEXT,
+    camera       TEXT,
+    source_path  TEXT,
+    phash        TEXT,
+    verified_at  REAL,
+    verify_status TEXT,
+    archive      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_year_kind ON files (capture_year, kind);
+CREATE INDEX IF NOT EXISTS idx_files_day_kind ON files (capture_day, kind, ext);
+CREATE INDEX IF NOT EXISTS idx_files_stem ON files (stem);
+CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir);
+CREATE INDEX IF NOT EXISTS idx_files_source ON files (source_path);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files (size);
+"""
+
+COLUMNS = ("path", "dir", "name", "stem", "ext", "size", "mtime", "capture_date", "capture_day",
+           "capture_year", "kind", "hash", "hash_tier", "camera", "source_path", "phash", "verified_at",
+           "verify_status", "archive")
+# Columns added after the first release; created on open for older catalogs.
+ADDED_COLUMNS = (("phash", "TEXT"), ("verified_at", "REAL"), ("verify_status", "TEXT"), ("archive", "TEXT"))
+# Indexes on added columns, created once the columns exist.
+ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_files_verified ON files (COALESCE(verified_at, 0), path);
+"""
+# Scrub outcomes that need attention.
+PROBLEM_STATUSES = ("mismatch", "missing", "unreadable")
+
+_UPSERT = (
+    f"INSERT INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+    "ON CONFLICT(path) DO UPDATE SET "
+    + ", ".join(f"{c} = COALESCE(excluded.{c}, {c})" for c in COLUMNS[1:])
+)
+# Upsert after a move: the moved row keeps its hash baseline and original source over the mover's.
+_MOVE_UPSERT = (
+    f"INSERT INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+    "ON CONFLICT(path) DO UPDATE SET "
+    + ", ".join(f"{c} = COALESCE({c}, excluded.{c})" if c in ("hash", "hash_tier", "source_path")
+                else f"{c} = COALESCE(excluded.{c}, {c})" for c in COLUMNS[1:])
+)
+
+
+def _subtree(root: str) -> tuple[str, tuple]:
+    """WHERE clause matching rows in root or below it, as an index-friendly range scan."""
+    prefix = root.rstrip(os.sep) + os.sep
+    return "(dir = ? OR (dir >= ? AND dir < ?))", (root, prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+
+
+def file_kind(ext: str) -> str:
+    ext = ext.lower()
+    if ext in RAW_EXTS:
+        return "raw"
+    if ext in PHOTO_EXTS:
+        return "photo"
+    if ext in VIDEO_EXTS:
+        return "video"
+    return "other"
+
+
+class LibraryCatalog:
+    """SQLite (WAL) index of the organized library, updated in batched transactions.
+
+    Writers call record()/remove()/rename(); rows are buffered and flushed every
+    FLUSH_ROWS records or FLUSH_INTERVAL seconds, whichever comes first.
+    """
+
+    FLUSH_ROWS = 500
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, db_path: str = CATALOG_PATH):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._add_missing_columns()
+        self._conn.executescript(ADDED_INDEXES)
+        self._lock = threading.RLock()
+        self._pending_upserts: list[tuple] = []
+        self._pending_ops: list[tuple[str, tuple]] = []
+        self._last_flush = time.monotonic()
+
+    def _add_missing_columns(self) -> None:
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for column, decl in ADDED_COLUMNS:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {decl}")
+
+    # -- writes ---------------------------------------------------------------
+
+    def record(self, path: str, capture_iso: str | None = None, camera: str | None = None,
+               source_path: str | None = None, hash_value: str | None = None, hash_tier: str | None = None,
+               phash: int | None = None, verified_at: float | None = None) -> None:
+        """Upsert a file; verified_at marks hash_value as a full-content hash just read from the file."""
+        row = self._row(path, capture_iso, camera, source_path, hash_value, hash_tier, phash, verified_at)
+        with self._lock:
+            self._pending_upserts.append(row)
+        self._maybe_flush()
+
+    @staticmethod
+    def _row(path: str, capture_iso: str | None = None, camera: str | None = None,
+             source_path: str | None = None, hash_value: str | None = None, hash_tier: str | None = None,
+             phash: int | None = None, verified_at: float | None = None) -> tuple:
+        path = os.path.abspath(path)
+        name = os.path.basename(path)
+        stem, ext = os.path.splitext(name)
+        try:
+            st = os.stat(path)
+            size, mtime = st.st_size, st.st_mtime
+        except OSError:
+            size = mtime = None
+        row = (
+            path, os.path.dirname(path), name, stem.lower(), ext.lower(), size, mtime,
+            capture_iso, capture_iso[:10] if capture_iso else None,
+            int(capture_iso[:4]) if capture_iso else None,
+            file_kind(ext), hash_value, hash_tier, camera,
+            os.path.abspath(source_path) if source_path else None,
+            f"{phash:016x}" if phash is not None else None,
+            verified_at, "ok" if verified_at is not None else None, None,
+        )
+        return row
+
+    def record_move(self, src: str, dest: str, capture_iso: str | None = None, camera: str | None = None) -> None:
+        """Called by the mover once a file has landed at its destination; a tracked src row moves with it."""
+        src, dest = os.path.abspath(src), os.path.abspath(dest)
+        row = self._row(dest, capture_iso, camera, source_path=src,
+                        hash_value=FileUtils.quick_file_hash(dest) or None, hash_tier="quick")
+        with self._lock:
+            self._flush_upserts()
+            self._pending_ops += self._move_row(src, dest)
+            self._pending_ops.append((_MOVE_UPSERT, [row]))
+        self._maybe_flush()
+
+    def record_verification(self, path: str, status: str, verified_at: float, hash_value: str | None = None,
+                            size: int | None = None, mtime: float | None = None) -> None:
+        """Result of re-reading a file; a new hash_value (with its size and mtime) replaces the baseline."""
+        with self._lock:
+            self._flush_upserts()
+            self._pending_ops.append((
+                "UPDATE files SET verified_at = ?, verify_status = ?, hash = COALESCE(?, hash), "
+                "hash_tier = CASE WHEN ? IS NULL THEN hash_tier ELSE 'full' END, "
+                "size = COALESCE(?, size), mtime = COALESCE(?, mtime) WHERE path = ?",
+                (verified_at, status, hash_value, hash_value, size, mtime, path)))
+        self._maybe_flush()
+
+    def remove(self, path: str) -> None:
+        path = os.path.abspath(path)
+        with self._lock:
+            self._flush_upserts()
+            clause, params = _subtree(path)
+            self._pending_ops.append((f"DELETE FROM files WHERE path = ? OR {clause}", (path, *params)))
+        self._maybe_flush()
+
+    def rename(self, src: str, dest: str) -> None:
+        """Follow a file renamed outside the organizer, adding it if it only now has a tracked extension."""
+        src, dest = os.path.abspath(src), os.path.abspath(dest)
+        if os.path.splitext(dest)[1].lower() not in file_exts:
+            self.remove(src)
+            return
+        with self._lock:
+            self._flush_upserts()
+            self._pending_ops += self._move_row(src, dest)
+        # Upserts into the renamed row, or inserts it when src wasn't tracked (x.part -> x.jpg).
+        self.record(dest)
+
+    @staticmethod
+    def _move_row(src: str, dest: str) -> list[tuple[str, tuple]]:
+        """Ops that re-key src's row to dest; a stale row left at dest by a deleted file is dropped first.
+
+        Without a src row nothing changes, so a move reported twice (by the mover and
+        by the watcher) leaves the row the first report moved alone.
+        """
+        name = os.path.basename(dest)
+        stem, ext = os.path.splitext(name)
+        return [
+            ("DELETE FROM files WHERE path = ? AND path <> ? AND EXISTS (SELECT 1 FROM files WHERE path = ?)",
+             (dest, src, src)),
+            ("UPDATE files SET path = ?, dir = ?, name = ?, stem = ?, ext = ?, kind = ?, "
+             "source_path = COALESCE(source_path, path) WHERE path = ?",
+             (dest, os.path.dirname(dest), name, stem.lower(), ext.lower(), file_kind(ext), src)),
+        ]
+
+    def rename_tree(self, src: str, dest: str) -> None:
+        src, dest = os.path.abspath(src), os.path.abspath(dest)
+        with self._lock:
+            self._flush_upserts()
+            clause, params = _subtree(src)
+            n = len(src) + 1
+            self._pending_ops.append((
+                f"UPDATE files SET path = ? || substr(path, ?), dir = ? || substr(dir, ?), "
+                f"source_path = COALESCE(source_path, path) WHERE {clause}",
+                (dest, n, dest, n, *params)))
+        self._maybe_flush()
+
+    def set_archive(self, paths: list[str], archive_path: str | None) -> None:
+        """Mark the rows of paths as packed into archive_path (None: unpacked again)."""
+        archive_path = os.path.abspath(archive_path) if archive_path else None
+        with self._lock:
+            self._flush_upserts()
+            self._pending_ops.append(("UPDATE files SET archive = ? WHERE path = ?",
+                                      [(archive_path, os.path.abspath(p)) for p in paths]))
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        with self._lock:
+            pending = len(self._pending_upserts) + len(self._pending_ops)
+            if pending >= self.FLUSH_ROWS or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+                self.flush()
+
+    def _flush_upserts(self) -> None:
+        # Keeps upserts ordered before subsequent deletes/renames of the same path.
+        if self._pending_upserts:
+            self._pending_ops.append((_UPSERT, self._pending_upserts))
+            self._pending_upserts = []
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_upserts()
+            ops, self._pending_ops = self._pending_ops, []
+            self._last_flush = time.monotonic()
+            if not ops:
+                return
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                for sql, params in ops:
+                    if isinstance(params, list):
+                        if params:
+                            conn.executemany(sql, params)
+                    else:
+                        conn.execute(sql, params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+    # -- queries --------------------------------------------------------------
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        self.flush()
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def count(self, year: int | None = None, kind: str | None = None) -> int:
+        clauses, params = [], []
+        if year is not None:
+            clauses.append("capture_year = ?")
+            params.append(year)
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f"SELECT COUNT(*) FROM files{where}", tuple(params))[0][0]
+
+    def counts_by_year(self, kind: str | None = None) -> list[tuple[int, int]]:
+        where = " WHERE kind = ?" if kind else ""
+        return self._query(
+            f"SELECT capture_year, COUNT(*) FROM files{where} GROUP BY capture_year ORDER BY capture_year",
+            (kind,) if kind else ())
+
+    def days_with_raw_without_jpeg(self) -> list[str]:
+        rows = self._query(
+            "SELECT capture_day FROM files WHERE capture_day IS NOT NULL AND kind IN ('raw', 'photo') "
+            "GROUP BY capture_day "
+            "HAVING SUM(kind = 'raw') > 0 AND SUM(kind = 'photo' AND ext IN ('.jpg', '.jpeg')) = 0 "
+            "ORDER BY capture_day")
+        return [r[0] for r in rows]
+
+    def locate(self, name: str) -> list[tuple[str, str | None, str | None]]:
+        """Current path, original source path and containing archive for a file name or stem (case-insensitive)."""
+        stem = os.path.splitext(name)[0].lower() if os.path.splitext(name)[1] else name.lower()
+        rows = self._query("SELECT path, source_path, name, archive FROM files WHERE stem = ?", (stem,))
+        if os.path.splitext(name)[1]:
+            rows = [r for r in rows if r[2].lower() == name.lower()]
+        return [(r[0], r[1], r[3]) for r in rows]
+
+    def paths_with_size(self, size: int) -> list[str]:
+        """Paths of files with this size, leaving out archived ones (they cannot be opened in place)."""
+        return [r[0] for r in self._query("SELECT path FROM files WHERE size = ? AND archive IS NULL", (size,))]
+
+    def phashes(self, root: str | None = None) -> dict[str, tuple[int, float, int]]:
+        """Stored perceptual hashes as {path: (size, mtime, phash)}, optionally only under root."""
+        sql, params = "SELECT path, size, mtime, phash FROM files WHERE phash IS NOT NULL", ()
+        if root:
+            clause, params = _subtree(os.path.abspath(root))
+            sql += f" AND {clause}"
+        return {path: (size, mtime, int(ph, 16)) for path, size, mtime, ph in self._query(sql, params)}
+
+    def find_by_source(self, source_path: str) -> str | None:
+        rows = self._query("SELECT path FROM files WHERE source_path = ?", (os.path.abspath(source_path),))
+        return rows[0][0] if rows else None
+
+    def least_recently_verified(self, root: str | None, due_before: float, budget_bytes: int,
+                                page: int = 2000) -> list[tuple]:
+        """(path, size, mtime, hash, hash_tier) rows last verified before due_before, never-verified first,
+        until their sizes add up to budget_bytes."""
+        where, params = "COALESCE(verified_at, 0) < ? AND archive IS NULL", (due_before,)
+        if root:
+            clause, sub = _subtree(os.path.abspath(root))
+            where, params = f"{where} AND {clause}", params + sub
+        rows, total, last = [], 0, (-1.0, "")
+        while total < budget_bytes:
+            batch = self._query(
+                f"SELECT path, size, mtime, hash, hash_tier, COALESCE(verified_at, 0) FROM files "
+                f"WHERE {where} AND (COALESCE(verified_at, 0), path) > (?, ?) "
+                f"ORDER BY COALESCE(verified_at, 0), path LIMIT ?", params + last + (page,))
+            for row in batch:
+                if total >= budget_bytes:
+                    break
+                rows.append(row[:5])
+                total += row[1] or 0
+            if len(batch) < page:
+                break
+            last = (batch[-1][5], batch[-1][0])
+        return rows
+
+    def total_bytes(self, root: str | None = None, verified_since: float | None = None) -> int:
+        """Size of the unarchived files under root, optionally only those verified since the given time."""
+        clauses, params = ["archive IS NULL"], ()
+        if root:
+            clause, params = _subtree(os.path.abspath(root))
+            clauses.append(clause)
+        if verified_since is not None:
+            clauses.append("COALESCE(verified_at, 0) >= ?")
+            params += (verified_since,)
+        return self._query(f"SELECT COALESCE(SUM(size), 0) FROM files WHERE {' AND '.join(clauses)}", params)[0][0]
+
+    def subtree_stats(self, root: str) -> tuple[int, int]:
+        """(file count, total bytes) of the unarchived files under root."""
+        clause, params = _subtree(os.path.abspath(root))
+        return self._query(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE archive IS NULL AND {clause}",
+                           params)[0]
+
+    def verification_summary(self, root: str | None = None) -> dict:
+        """File counts per scrub status ("never": unverified, "archived": packed) and the oldest verification time."""
+        sql, params = ("SELECT CASE WHEN archive IS NULL THEN COALESCE(verify_status, 'never') ELSE 'archived' END, "
+                       "COUNT(*), MIN(verified_at) FROM files"), ()
+        if root:
+            clause, params = _subtree(os.path.abspath(root))
+            sql += f" WHERE {clause}"
+        rows = self._query(sql + " GROUP BY 1", params)
+        oldest = [r[2] for r in rows if r[2] is not None and r[0] != "archived"]
+        return {"counts": {status: count for status, count, _ in rows}, "oldest": min(oldest) if oldest else None}
+
+    def verification_problems(self, root: str | None = None) -> list[tuple[str, str, float]]:
+        """(path, status, verified_at) of files whose last scrub found a mismatch, a missing or unreadable file."""
+        sql = (f"SELECT path, verify_status, verified_at FROM files "
+               f"WHERE archive IS NULL AND verify_status IN ({', '.join('?' * len(PROBLEM_STATUSES))})")
+        params = PROBLEM_STATUSES
+        if root:
+            clause, sub = _subtree(os.path.abspath(root))
+            sql, params = f"{sql} AND {clause}", params + sub
+        return self._query(sql + " ORDER BY path", params)
+
+    def stats(self) -> dict:
+        rows = self._query("SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM files GROUP BY kind")
+        return {kind: {"count": count, "bytes": size} for kind, count, size in rows}
+
+    # -- maintenance ----------------------------------------------------------
+
+    def index_tree(self, root: str, excluded_folders: list[str] | None = None, log_fn=print,
+                   rules: ScanRules | None = None) -> int:
+        """(Re)index an existing library, extracting capture dates for every file under root."""
+        from metadata import FileGatherer
+
+        count = 0
+        for path, iso_dt, info in FileGatherer.gather_files_with_metadata(root, file_exts, excluded_folders,
+                                                                                rules=rules):
+            self.record(path, iso_dt, info.get("camera"))
+            count += 1
+            if log_fn and count % 10000 == 0:
+                log_fn(f"Indexed {count} files...")
+        self.flush()
+        return count
+
+    def prune_missing(self, root: str | None = None) -> int:
+        """Drop rows whose files no longer exist (optionally only under root); archived files are kept."""
+        if root:
+            root = os.path.abspath(root)
+            clause, params = _subtree(root)
+            rows = self._query(f"SELECT path FROM files WHERE archive IS NULL AND {clause}", params)
+        else:
+            rows = self._query("SELECT path FROM files WHERE archive IS NULL")
+        missing = [(r[0],) for r in rows if not os.path.exists(r[0])]
+        with self._lock:
+            self._pending_ops.append(("DELETE FROM files WHERE path = ?", missing))
+            self.flush()
+        return len(missing)
+
+
+class CatalogSync(FileSystemEventHandler):
+    """Keeps the catalog in step with changes made to watched libraries outside the organizer.
+
+    One observer thread serves every watched root. Moves the organizer makes itself
+    are reported here as well; they only refresh rows record_move already updated.
+    """
+
+    def __init__(self, catalog: LibraryCatalog):
+        super().__init__()
+        self.catalog = catalog
+        self.roots: set[str] = set()
+        self._observer: Observer | None = None
+
+    def watch(self, root: str) -> bool:
+        """Start following root; False if it is missing or already covered by a watched root."""
+        root = os.path.abspath(root)
+        if not os.path.isdir(root) or any(root == r or root.startswith(r.rstrip(os.sep) + os.sep)
+                                           for r in self.roots):
+            return False
+        if self._observer is None:
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.start()
+        self._observer.schedule(self, root, recursive=True)
+        self.roots.add(root)
+        return True
+
+    def stop(self) -> None:
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        self.roots.clear()
+        self.catalog.flush()
+
+    def on_created(self, event) -> None:
+        if not event.is_directory and os.path.splitext(event.src_path)[1].lower() in file_exts:
+            self.catalog.record(event.src_path)
+
+    def on_deleted(self, event) -> None:
+        self.catalog.remove(event.src_path)
+
+    def on_moved(self, event) -> None:
+        if event.is_directory:
+            self.catalog.rename_tree(event.src_path, event.dest_path)
+        else:
+            self.catalog.rename(event.src_path, event.dest_path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="catalog", description="Query the photo library catalog.")
+    parser.add_argument("--db", default=CATALOG_PATH, help="catalog database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("count", help="count files, optionally by year and kind")
+    p.add_argument("--year", type=int)
+    p.add_argument("--kind", choices=("photo", "raw", "video", "other"))
+    p = sub.add_parser("years", help="file counts per capture year")
+    p.add_argument("--kind", choices=("photo", "raw", "video", "other"))
+    sub.add_parser("raw-only-days", help="days that have RAW files but no JPEG")
+    p = sub.add_parser("where", help="locate a file by name or stem")
+    p.add_argument("name")
+    sub.add_parser("stats", help="file counts and sizes per kind")
+    p = sub.add_parser("index", help="index an existing library tree")
+    p.add_argument("root")
+    ScanRules.add_arguments(p)
+    p = sub.add_parser("prune", help="drop entries for files that no longer exist")
+    p.add_argument("root", nargs="?")
+
+    args = parser.parse_args(argv)
+    catalog = LibraryCatalog(args.db)
+    try:
+        if args.command == "count":
+            print(catalog.count(args.year, args.kind))
+        elif args.command == "years":
+            for year, count in catalog.counts_by_year(args.kind):
+                print(f"{year if year is not None else 'unknown'}\t{count}")
+        elif args.command == "raw-only-days":
+            for day in catalog.days_with_raw_without_jpeg():
+                print(day)
+        elif args.command == "where":
+            matches = catalog.locate(args.name)
+            for path, source, archive in matches:
+                print(f"{path}" + (f"\t(from {source})" if source else "") + (f"\t(in {archive})" if archive else ""))
+            if not matches:
+                print(f"No catalog entry for {args.name}")
+                return 1
+        elif args.command == "stats":
+            for kind, s in sorted(catalog.stats().items()):
+                print(f"{kind}\t{s['count']}\t{s['bytes'] / (1 << 30):.2f} GB")
+        elif args.command == "index":
+            rules = ScanRules.from_args(args, ConfigManager.load())
+            print(f"Indexed {catalog.index_tree(args.root, rules=rules)} files.")
+        elif args.command == "prune":
+            print(f"Removed {catalog.prune_missing(args.root)} missing entries.")
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
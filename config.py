@@ -2,11 +2,23 @@ import os
 import json
 from PySide6.QtGui import QIcon
 
-PHOTO_EXTS = ('.jpg', '.jpeg', '.png')
-RAW_EXTS = ('.cr2', '.nef', '.arw', '.dng', '.orf', '.rw2')
+PHOTO_EXTS = ('.jpg', '.jpeg', '.png', '.heic', '.heif', '.avif', '.webp')
+RAW_EXTS = ('.cr2', '.cr3', '.nef', '.arw', '.dng', '.orf', '.rw2')
 VIDEO_EXTS = ('.mp4', '.mov', '.avi', '.mkv', '.mts', '.m2ts', '.wmv')
+# Edit/metadata sidecars; they are never scanned alone, only moved with a file of the same stem.
+SIDECAR_EXTS = ('.xmp', '.aae', '.thm')
 
 CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".photo_organizer_config.json")
+CATALOG_PATH = os.path.join(os.path.expanduser("~"), ".photo_organizer_catalog.db")
+SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".photo_organizer_snapshots")
+THUMB_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".photo_organizer_thumbs")
+RUN_STATS_PATH = os.path.join(os.path.expanduser("~"), ".photo_organizer_run_stats.json")
+BACKEND_BENCH_PATH = os.path.join(os.path.expanduser("~"), ".photo_organizer_backends.json")
+CHECKPOINT_PATH = os.path.join(os.path.expanduser("~"), ".photo_organizer_checkpoint.json")
+DAEMON_LOCK_PATH = os.path.join(os.path.expanduser("~"), ".photo_organizer_daemon.lock")
+GUI_LOCK_PATH = os.path.join(os.path.expanduser("~"), ".photo_organizer_gui.lock")
+# Local socket (named pipe on Windows) of the organizer daemon; per user so accounts never share one.
+DAEMON_SOCKET_NAME = "photo-organizer-" + os.path.basename(os.path.expanduser("~"))
 REG_NAME = "PhotoWatchdog"
 WINDOWS_RUN_KEY = r"Software\Microsoft\Windows\CurrentVersion\Run"
 
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+
+from config import CHECKPOINT_PATH
+
+
+class RunControl:
+    """Cancellation token plus pause gate shared by every stage of a run.
+
+    Backed by multiprocessing events so the same token can be handed to
+    extraction worker processes and checked between individual files.
+    """
+
+    def __init__(self):
+        self._cancel = multiprocessing.Event()
+        self._running = multiprocessing.Event()
+        self._running.set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+        self._running.set()
+
+    def pause(self) -> None:
+        if not self._cancel.is_set():
+            self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def is_paused(self) -> bool:
+        return not self._running.is_set()
+
+    def checkpoint(self) -> bool:
+        """Block while paused; return False once the run has been cancelled."""
+        self._running.wait()
+        return not self._cancel.is_set()
+
+    def events(self) -> tuple:
+        return self._cancel, self._running
+
+    def reset(self) -> None:
+        """Clear a cancellation so the token can serve another run (used by long-lived pools)."""
+        self._cancel.clear()
+        self._running.set()
+
+
+class RunCheckpoint:
+    """Persisted progress of an organize run so a stopped run can pick up where it left off."""
+
+    SAVE_INTERVAL = 2.0
+
+    def __init__(self, base_dir: str, folder_structure: str, path: str = CHECKPOINT_PATH,
+                 source_dirs: list[str] | None = None):
+        self.path = path
+        self.key = {"base_dir": os.path.abspath(base_dir), "folder_structure": folder_structure}
+        extra = sorted({os.path.abspath(d) for d in source_dirs or []} - {self.key["base_dir"]})
+        if extra:
+            # A run over other sources is a different run; single-source keys stay as they were.
+            self.key["sources"] = extra
+        self.metadata: dict[str, str | None] = {}
+        self.done: set[str] = set()
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            return False
+        if data.get("key") != self.key:
+            return False
+        with self._lock:
+            self.metadata = dict(data.get("metadata", {}))
+            self.done = set(data.get("done", []))
+        return bool(self.metadata or self.done)
+
+    def record_metadata(self, path: str, iso_dt: str | None) -> None:
+        with self._lock:
+            self.metadata[path] = iso_dt
+            self._dirty = True
+        self._maybe_save()
+
+    def record_done(self, path: str) -> None:
+        with self._lock:
+            self.done.add(path)
+            self._dirty = True
+        self._maybe_save()
+
+    def is_done(self, path: str) -> bool:
+        with self._lock:
+            return path in self.done
+
+    def _maybe_save(self) -> None:
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"key": self.key, "metadata": self.metadata, "done": sorted(self.done)}
+            self._dirty = False
+            self._last_save = time.monotonic()
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except Exception:
+                self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.metadata.clear()
+            self.done.clear()
+            self._dirty = False
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
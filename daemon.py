@@ -0,0 +1,701 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from datetime import datetime
+from multiprocessing import cpu_count
+
+from PySide6.QtCore import QObject, Signal, QLockFile, QCoreApplication, QThread, QTimer
+from PySide6.QtNetwork import QLocalServer, QLocalSocket
+
+import flatten
+from config import ConfigManager, DAEMON_LOCK_PATH, DAEMON_SOCKET_NAME
+from control import RunCheckpoint, RunControl
+from governor import ResourceGovernor
+from events import EventClusterer
+from geocode import PlaceIndex
+from rules import ScanRules
+from netio import AsyncIOEngine
+from catalog import LibraryCatalog, CatalogSync
+from snapshot import DirectorySnapshot
+from file_ops import FileUtils
+from metadata import WarmExtractPool
+from backends import ExtractBackend
+from organizer import PhotoOrganizer
+from tasks import TaskManager
+from scrub import LibraryScrubber
+from worker import WorkerThread
+
+# Protocol: one JSON object per line in each direction. Requests carry an "id" and
+# an "op"; replies echo the id with "ok" and a "result" or "error". Job events are
+# broadcast to every connected client as {"event": kind, "job": id, "value": ...}.
+CONNECT_TIMEOUT_MS = 500
+REPLY_TIMEOUT_MS = 5000
+# Job id carried by scrub events; organize jobs count from 1.
+SCRUB_JOB = 0
+DEFAULT_SCRUB_AT = "03:00"
+SCRUB_CHECK_MS = 10 * 60 * 1000
+# Catalog rows from watched-library changes are committed at least this often.
+CATALOG_FLUSH_MS = 5000
+STRUCTURES = ("day", "year_month_day", "year_month", "year_day", "events", "year_location", "location_day")
+
+
+def _encode(msg: dict) -> bytes:
+    return json.dumps(msg, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _split_lines(buffer: bytes, data: bytes) -> tuple[list[bytes], bytes]:
+    *lines, rest = (buffer + data).split(b"\n")
+    return [line for line in lines if line.strip()], rest
+
+
+class InstanceLock:
+    """Pidfile lock held by the one running instance of a role (daemon or GUI).
+
+    QLockFile records the owner's pid and host; a lock left by a process that is
+    gone counts as stale and is taken over, so a crash never blocks the next start.
+    """
+
+    def __init__(self, path: str):
+        self._lock = QLockFile(path)
+        self._lock.setStaleLockTime(0)
+
+    def acquire(self) -> bool:
+        return self._lock.tryLock(0)
+
+    def release(self) -> None:
+        if self._lock.isLocked():
+            self._lock.unlock()
+
+    def owner_pid(self) -> int | None:
+        """Pid of another live process holding the lock, or None."""
+        if self._lock.isLocked():
+            return os.getpid()
+        if self._lock.tryLock(0):
+            self._lock.unlock()
+            return None
+        info = self._lock.getLockInfo()
+        return (info[0] or None) if info else None
+
+
+class JobThread(WorkerThread):
+    def __init__(self, organizer: PhotoOrganizer, prune_empty: bool = False):
+        super().__init__(organizer)
+        self.prune_empty = prune_empty
+
+    def run(self) -> None:
+        super().run()
+        if self.prune_empty and not self.organizer.is_cancelled():
+            flatten.prune_empty_folders(self.organizer.base_dir, self.organizer.log_msg.emit,
+                                        control=self.organizer.control)
+
+
+class ScrubThread(QThread):
+    log_msg = Signal(str)
+    progress = Signal(int)
+
+    def __init__(self, catalog: LibraryCatalog, roots: list[str], config: dict):
+        super().__init__()
+        self.control = RunControl()
+        self.scrubbers = [LibraryScrubber.from_config(config, catalog, root, control=self.control,
+                                                      log_fn=self.log_msg.emit, progress_fn=self.progress.emit)
+                          for root in roots]
+
+    def run(self) -> None:
+        for scrubber in self.scrubbers:
+            if self.control.is_cancelled():
+                break
+            scrubber.run()
+
+
+class OrganizerDaemon(QObject):
+    """Single-instance background organizer serving jobs over a local socket.
+
+    The daemon holds DAEMON_LOCK_PATH for its lifetime and listens on
+    DAEMON_SOCKET_NAME (a Unix socket, or a named pipe on Windows). Jobs run one at
+    a time in submission order; between them the process keeps its catalog
+    connection, governor, directory snapshots, place index and extraction worker
+    pool, so a job submitted by the GUI starts warm instead of cold. Libraries it
+    has organized (and those under "catalog.watch" in the config) are watched, so
+    files added, moved or deleted outside the organizer reach the catalog.
+
+    When idle after the configured time of day, the daemon also runs that day's
+    scrub slice over the configured roots. A submitted job stops the scrub, which
+    picks up where it left off next time, and starts once it has wound down.
+    """
+
+    log_msg = Signal(str)
+    job_finished = Signal(int, bool)
+
+    def __init__(self):
+        super().__init__()
+        self.lock = InstanceLock(DAEMON_LOCK_PATH)
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self._accept)
+        self._buffers: dict[QLocalSocket, bytes] = {}
+        self._ids = itertools.count(1)
+        self.queue: list[dict] = []
+        self.current: dict | None = None
+        self.organizer: PhotoOrganizer | None = None
+        self.worker_thread: JobThread | None = None
+        self.catalog: LibraryCatalog | None = None
+        self.catalog_sync: CatalogSync | None = None
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(CATALOG_FLUSH_MS)
+        self._governor: ResourceGovernor | None = None
+        self._governor_key = None
+        self._snapshots: dict[str, DirectorySnapshot] = {}
+        self.scrub_thread: ScrubThread | None = None
+        self._last_scrub_day = None
+        self._scrub_timer = QTimer(self)
+        self._scrub_timer.setInterval(SCRUB_CHECK_MS)
+        self._scrub_timer.timeout.connect(self._maybe_scrub)
+        self.started = time.time()
+
+    def start(self) -> bool:
+        """Take the instance lock and start listening; False if another daemon is running."""
+        if not self.lock.acquire():
+            return False
+        # The lock proves no daemon is alive, so a leftover socket file is from a crash.
+        QLocalServer.removeServer(DAEMON_SOCKET_NAME)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        if not self.server.listen(DAEMON_SOCKET_NAME):
+            self.lock.release()
+            return False
+        self.catalog = LibraryCatalog()
+        self.catalog_sync = CatalogSync(self.catalog)
+        for root in ConfigManager.load().get("catalog", {}).get("watch", []):
+            self.catalog_sync.watch(root)
+        self._flush_timer.timeout.connect(self.catalog.flush)
+        self._flush_timer.start()
+        WarmExtractPool.enable()
+        self._scrub_timer.start()
+        self.log_msg.emit(f"Organizer daemon listening on {self.server.fullServerName()}")
+        return True
+
+    def stop(self) -> None:
+        self.queue.clear()
+        if self.organizer and self.worker_thread and self.worker_thread.isRunning():
+            self.organizer.cancel()
+            self.worker_thread.wait()
+        self._scrub_timer.stop()
+        if self.scrub_thread:
+            self.scrub_thread.control.cancel()
+            self.scrub_thread.wait()
+        self.server.close()
+        for sock in list(self._buffers):
+            sock.disconnectFromServer()
+        WarmExtractPool.shutdown()
+        self._flush_timer.stop()
+        if self.catalog_sync:
+            self.catalog_sync.stop()
+            self.catalog_sync = None
+        if self.catalog:
+            self.catalog.close()
+            self.catalog = None
+        self.lock.release()
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "current": self.current,
+            "paused": bool(self.organizer and self.current and self.organizer.is_paused()),
+            "queued": self.queue,
+            "scrubbing": self.scrub_thread is not None,
+        }
+
+    # --- connections ---
+
+    def _accept(self) -> None:
+        while self.server.hasPendingConnections():
+            sock = self.server.nextPendingConnection()
+            self._buffers[sock] = b""
+            sock.readyRead.connect(lambda s=sock: self._read(s))
+            sock.disconnected.connect(lambda s=sock: self._drop(s))
+
+    def _drop(self, sock: QLocalSocket) -> None:
+        self._buffers.pop(sock, None)
+        sock.deleteLater()
+
+    def _read(self, sock: QLocalSocket) -> None:
+        lines, self._buffers[sock] = _split_lines(self._buffers.get(sock, b""), bytes(sock.readAll()))
+        for line in lines:
+            self._send(sock, self._handle(line))
+
+    def _handle(self, line: bytes) -> dict:
+        msg = {}
+        try:
+            msg = json.loads(line)
+            handler = getattr(self, f"_op_{msg.get('op')}", None)
+            if handler is None:
+                raise ValueError(f"Unknown operation: {msg.get('op')!r}")
+            return {"id": msg.get("id"), "ok": True, "result": handler(msg)}
+        except Exception as e:
+            return {"id": msg.get("id") if isinstance(msg, dict) else None, "ok": False, "error": str(e)}
+
+    def _send(self, sock: QLocalSocket, msg: dict) -> None:
+        if sock.state() == QLocalSocket.ConnectedState:
+            sock.write(_encode(msg))
+            sock.flush()
+
+    def _broadcast(self, kind: str, job_id: int, value=None) -> None:
+        data = _encode({"event": kind, "job": job_id, "value": value})
+        for sock in list(self._buffers):
+            if sock.state() == QLocalSocket.ConnectedState:
+                sock.write(data)
+
+    # --- operations ---
+
+    def _op_ping(self, msg: dict) -> dict:
+        return {"pid": os.getpid()}
+
+    def _op_status(self, msg: dict) -> dict:
+        return self.status()
+
+    def _op_submit(self, msg: dict) -> int:
+        spec = msg.get("job") or {}
+        base_dir = os.path.abspath(spec.get("base_dir") or "")
+        if not os.path.isdir(base_dir):
+            raise ValueError(f"Invalid base directory: {base_dir}")
+        structure = spec.get("folder_structure", "day")
+        if structure not in STRUCTURES:
+            raise ValueError(f"Unknown folder structure: {structure}")
+        sources = [os.path.abspath(s) for s in spec.get("sources", [])]
+        roots = [base_dir] + sources
+        for i, root in enumerate(roots):
+            if not os.path.isdir(root):
+                raise ValueError(f"Invalid source directory: {root}")
+            for other in roots[i + 1:]:
+                # The library may sit inside a source: the organizer leaves it out of that source's scan.
+                target_inside = root == base_dir and base_dir.startswith(other.rstrip(os.sep) + os.sep)
+                if TaskManager.overlaps(root, other) and not target_inside:
+                    raise ValueError(f"Source directories overlap: {root}")
+        for job in ([self.current] if self.current else []) + self.queue:
+            for root in [job["base_dir"]] + job["sources"]:
+                if any(TaskManager.overlaps(root, r) for r in roots):
+                    raise ValueError(f"Job {job['id']} is already organizing {root}")
+
+        job = {
+            "id": next(self._ids),
+            "base_dir": base_dir,
+            "sources": sources,
+            "folder_structure": structure,
+            "separate_videos": bool(spec.get("separate_videos", False)),
+            "excluded_folders": list(spec.get("excluded_folders", [])),
+            "prune_empty": bool(spec.get("prune_empty", False)),
+            "state": "queued",
+            "total": 0, "moved": 0, "skipped": 0, "progress": 0,
+        }
+        self.queue.append(job)
+        if self.scrub_thread:
+            self.scrub_thread.control.cancel()
+        # Start after the reply goes out, so the client knows the job id before its first event.
+        QTimer.singleShot(0, self._start_next)
+        return job["id"]
+
+    def _op_cancel(self, msg: dict) -> bool:
+        job_id = msg.get("job")
+        self.queue = [j for j in self.queue if job_id is not None and j["id"] != job_id]
+        if self.scrub_thread and job_id in (None, SCRUB_JOB):
+            self.scrub_thread.control.cancel()
+        if self.current and job_id in (None, self.current["id"]):
+            self.organizer.cancel()
+        return True
+
+    def _op_pause(self, msg: dict) -> bool:
+        if not self.current:
+            return False
+        self.organizer.pause()
+        return True
+
+    def _op_resume(self, msg: dict) -> bool:
+        if not self.current:
+            return False
+        self.organizer.resume()
+        return True
+
+    def _op_scrub(self, msg: dict) -> bool:
+        roots = msg.get("roots") or ConfigManager.load().get("scrub", {}).get("roots", [])
+        if not roots:
+            raise ValueError("No scrub roots given or configured")
+        if self.scrub_thread:
+            raise ValueError("A scrub is already running")
+        if self.current or self.queue:
+            raise ValueError("Jobs are running; scrub once they finish")
+        self._start_scrub([os.path.abspath(r) for r in roots])
+        return True
+
+    def _op_shutdown(self, msg: dict) -> bool:
+        QTimer.singleShot(0, self._quit)
+        return True
+
+    def _quit(self) -> None:
+        self.stop()
+        QCoreApplication.quit()
+
+    # --- jobs ---
+
+    def _start_next(self) -> None:
+        if self.current or not self.queue or self.scrub_thread:
+            return
+        job = self.current = self.queue.pop(0)
+        job["state"] = "running"
+        FileUtils.reset_seen()
+        # From now on, changes made to this library between jobs reach the catalog too.
+        self.catalog_sync.watch(job["base_dir"])
+        self.organizer = organizer = self._build_organizer(job, ConfigManager.load())
+        job_id = job["id"]
+        organizer.progress.connect(lambda v: self._on_progress(job_id, v))
+        organizer.log_msg.connect(lambda m: self._on_log(job_id, m))
+        organizer.total_files.connect(lambda v: self._on_count(job_id, "total", v))
+        organizer.moved_files.connect(lambda v: self._on_count(job_id, "moved", v))
+        organizer.skipped_files.connect(lambda v: self._on_count(job_id, "skipped", v))
+        organizer.budget_usage.connect(lambda u: self._broadcast("budget", job_id, u))
+        organizer.estimate.connect(lambda s: self._on_estimate(job_id, s))
+
+        self._broadcast("started", job_id, job)
+        self.worker_thread = JobThread(organizer, job["prune_empty"])
+        self.worker_thread.finished.connect(self._job_done)
+        self.worker_thread.start()
+
+    # --- scrub ---
+
+    def _maybe_scrub(self) -> None:
+        cfg = ConfigManager.load().get("scrub", {})
+        now = datetime.now()
+        if not cfg.get("roots") or now.strftime("%H:%M") < cfg.get("at", DEFAULT_SCRUB_AT):
+            return
+        if self._last_scrub_day == now.date() or self.current or self.queue or self.scrub_thread:
+            return
+        self._last_scrub_day = now.date()
+        self._start_scrub(cfg["roots"])
+
+    def _start_scrub(self, roots: list[str]) -> None:
+        self.scrub_thread = ScrubThread(self.catalog, roots, ConfigManager.load())
+        self.scrub_thread.log_msg.connect(lambda m: self._on_log(SCRUB_JOB, m))
+        self.scrub_thread.progress.connect(lambda v: self._broadcast("progress", SCRUB_JOB, v))
+        self.scrub_thread.finished.connect(self._scrub_done)
+        self._broadcast("started", SCRUB_JOB, {"scrub": roots})
+        self.scrub_thread.start()
+
+    def _scrub_done(self) -> None:
+        cancelled = self.scrub_thread.control.is_cancelled()
+        self.scrub_thread.deleteLater()
+        self.scrub_thread = None
+        self._broadcast("finished", SCRUB_JOB, {"state": "cancelled" if cancelled else "done", "scrub": True})
+        self._start_next()
+
+    def _build_organizer(self, job: dict, config: dict) -> PhotoOrganizer:
+        base_dir = job["base_dir"]
+        ExtractBackend.configure(config)
+        snapshot = self._snapshots.get(base_dir)
+        if snapshot is None:
+            snapshot = self._snapshots[base_dir] = DirectorySnapshot(
+                base_dir, full_verify_every=config.get("full_rescan_every", DirectorySnapshot.FULL_VERIFY_EVERY))
+        return PhotoOrganizer(
+            base_dir=base_dir,
+            folder_structure=job["folder_structure"],
+            max_workers=min(8, cpu_count()),
+            separate_videos=job["separate_videos"],
+            excluded_folders=job["excluded_folders"],
+            checkpoint=RunCheckpoint(base_dir, job["folder_structure"], source_dirs=job["sources"]),
+            governor=self._governor_for(config),
+            catalog=self.catalog,
+            record_hashes=config.get("scrub", {}).get("hash_on_organize", True),
+            source_dirs=[base_dir] + job["sources"],
+            snapshot=snapshot,
+            event_clusterer=EventClusterer.from_config(config),
+            place_index=PlaceIndex.from_config(config),
+            scan_rules=ScanRules.from_config(config),
+            io_engine=AsyncIOEngine.from_config(config, base_dir),
+        )
+
+    def _governor_for(self, config: dict) -> ResourceGovernor | None:
+        """The daemon's governor, rebuilt only when its settings change (the warm pool is keyed on it)."""
+        key = json.dumps(config.get("governor"), sort_keys=True)
+        if key != self._governor_key:
+            self._governor_key = key
+            self._governor = ResourceGovernor.from_config(config) if config.get("governor") else None
+        return self._governor
+
+    def _on_progress(self, job_id: int, value: int) -> None:
+        if self.current and self.current["id"] == job_id:
+            self.current["progress"] = value
+        self._broadcast("progress", job_id, value)
+
+    def _on_estimate(self, job_id: int, summary: dict) -> None:
+        if self.current and self.current["id"] == job_id:
+            self.current["estimate"] = summary
+        self._broadcast("estimate", job_id, summary)
+
+    def _on_log(self, job_id: int, msg: str) -> None:
+        self.log_msg.emit(msg)
+        self._broadcast("log", job_id, msg)
+
+    def _on_count(self, job_id: int, field: str, value: int) -> None:
+        if self.current and self.current["id"] == job_id:
+            self.current[field] = value if field == "total" else self.current[field] + value
+        self._broadcast(field, job_id, value)
+
+    def _job_done(self) -> None:
+        job, cancelled = self.current, self.organizer.is_cancelled()
+        job["state"] = "cancelled" if cancelled else "done"
+        self.current = None
+        self.worker_thread.deleteLater()
+        self.worker_thread = None
+        self._broadcast("finished", job["id"], job)
+        self.job_finished.emit(job["id"], cancelled)
+        self._start_next()
+
+
+class DaemonClient(QObject):
+    """Connection to the running daemon: blocking request/reply calls plus a stream of job events.
+
+    Events are emitted from the socket's readyRead, so they arrive through the Qt
+    event loop, and also while a call() is waiting for its reply.
+    """
+
+    event = Signal(dict)
+    disconnected = Signal()
+
+    def __init__(self):
+        super().__init__()
+        self.socket = QLocalSocket(self)
+        self.socket.readyRead.connect(self._read)
+        self.socket.disconnected.connect(self.disconnected.emit)
+        self._buffer = b""
+        self._ids = itertools.count(1)
+        self._replies: dict[int, dict] = {}
+
+    @staticmethod
+    def running_pid() -> int | None:
+        return InstanceLock(DAEMON_LOCK_PATH).owner_pid()
+
+    def connect_to_daemon(self, timeout_ms: int = CONNECT_TIMEOUT_MS) -> bool:
+        self.socket.connectToServer(DAEMON_SOCKET_NAME)
+        return self.socket.waitForConnected(timeout_ms)
+
+    def is_connected(self) -> bool:
+        return self.socket.state() == QLocalSocket.ConnectedState
+
+    def close(self) -> None:
+        self.socket.disconnectFromServer()
+
+    def call(self, op: str, timeout_ms: int = REPLY_TIMEOUT_MS, **params):
+        if not self.is_connected():
+            raise ConnectionError("The organizer daemon is not running")
+        req_id = next(self._ids)
+        self.socket.write(_encode({"id": req_id, "op": op, **params}))
+        self.socket.flush()
+        deadline = time.monotonic() + timeout_ms / 1000
+        while req_id not in self._replies:
+            remaining = int((deadline - time.monotonic()) * 1000)
+            if remaining <= 0 or not self.socket.waitForReadyRead(remaining):
+                raise TimeoutError(f"No reply from the organizer daemon to {op!r}")
+            self._read()
+        reply = self._replies.pop(req_id)
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply.get("result")
+
+    def _read(self) -> None:
+        lines, self._buffer = _split_lines(self._buffer, bytes(self.socket.readAll()))
+        for line in lines:
+            msg = json.loads(line)
+            if "event" in msg:
+                self.event.emit(msg)
+            else:
+                self._replies[msg.get("id")] = msg
+
+    def submit(self, job: dict) -> int:
+        return self.call("submit", job=job)
+
+    def status(self) -> dict:
+        return self.call("status")
+
+    def cancel(self, job_id: int | None = None) -> bool:
+        return self.call("cancel", job=job_id)
+
+    def pause(self) -> bool:
+        return self.call("pause")
+
+    def resume(self) -> bool:
+        return self.call("resume")
+
+    def scrub(self, roots: list[str] | None = None) -> bool:
+        return self.call("scrub", roots=roots or [])
+
+    def shutdown(self) -> bool:
+        return self.call("shutdown")
+
+
+class RemoteJob(QObject):
+    """GUI handle for a job running in the daemon, shaped like a local organizer and its thread.
+
+    Daemon events are re-emitted as the PhotoOrganizer signals, and isRunning()/
+    finished mirror WorkerThread, so the GUI drives local and remote runs alike.
+    """
+
+    progress = Signal(int)
+    log_msg = Signal(str)
+    total_files = Signal(int)
+    moved_files = Signal(int)
+    skipped_files = Signal(int)
+    budget_usage = Signal(dict)
+    estimate = Signal(dict)
+    finished = Signal()
+
+    SIGNALS = {"progress": "progress", "log": "log_msg", "total": "total_files",
+               "moved": "moved_files", "skipped": "skipped_files", "budget": "budget_usage",
+               "estimate": "estimate"}
+
+    def __init__(self, client: DaemonClient, job: dict):
+        super().__init__()
+        self.client = client
+        self.base_dir = os.path.abspath(job["base_dir"])
+        self._running = True
+        self._paused = False
+        self._cancelled = False
+        self._early: list[dict] = []
+        self.job_id = None
+        client.event.connect(self._on_event)
+        client.disconnected.connect(self._lost)
+        self.job_id = client.submit(job)
+        for msg in self._early:
+            self._on_event(msg)
+
+    def _on_event(self, msg: dict) -> None:
+        if self.job_id is None:
+            self._early.append(msg)
+            return
+        if msg.get("job") != self.job_id:
+            return
+        kind = msg.get("event")
+        if kind in self.SIGNALS:
+            getattr(self, self.SIGNALS[kind]).emit(msg.get("value"))
+        elif kind == "finished" and self._running:
+            self._running = False
+            self._cancelled = (msg.get("value") or {}).get("state") == "cancelled"
+            self.finished.emit()
+
+    def _lost(self) -> None:
+        if self._running:
+            self._running = False
+            self.log_msg.emit("Lost connection to the organizer daemon.")
+            self.finished.emit()
+
+    def isRunning(self) -> bool:
+        return self._running
+
+    def _call(self, method, *args):
+        if not self._running:
+            return False
+        try:
+            return method(*args)
+        except (ConnectionError, TimeoutError, RuntimeError) as e:
+            self.log_msg.emit(f"Organizer daemon: {e}")
+            return False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        self._call(self.client.cancel, self.job_id)
+
+    def pause(self) -> None:
+        self._paused = bool(self._call(self.client.pause))
+
+    def resume(self) -> None:
+        self._call(self.client.resume)
+        self._paused = False
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+
+def _print_event(msg: dict) -> None:
+    kind, value = msg.get("event"), msg.get("value")
+    if kind == "log":
+        print(value)
+    elif kind == "finished" and value.get("scrub"):
+        print(f"Scrub {value['state']}")
+    elif kind == "finished":
+        print(f"Job {msg['job']} {value['state']}: {value['moved']} moved, {value['skipped']} skipped")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Photo organizer daemon and its command-line client.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="run the daemon in the foreground")
+    sub.add_parser("status", help="show the running and queued jobs")
+    p = sub.add_parser("submit", help="queue an organize job")
+    p.add_argument("base_dir")
+    p.add_argument("--source", action="append", default=[],
+                   help="another folder to merge into base_dir in the same run (repeatable)")
+    p.add_argument("--structure", default="day", choices=STRUCTURES)
+    p.add_argument("--separate-videos", action="store_true")
+    p.add_argument("--exclude", action="append", default=[], help="folder to skip (repeatable)")
+    p.add_argument("--prune-empty", action="store_true", help="remove empty folders afterwards")
+    p.add_argument("--follow", action="store_true", help="print the job's log until it finishes")
+    p = sub.add_parser("cancel", help="cancel a job, or every job")
+    p.add_argument("job", type=int, nargs="?")
+    p = sub.add_parser("scrub", help="verify the next slice of the given or configured libraries now")
+    p.add_argument("roots", nargs="*")
+    sub.add_parser("stop", help="ask the daemon to exit")
+    args = parser.parse_args(argv)
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    if args.command == "serve":
+        daemon = OrganizerDaemon()
+        daemon.log_msg.connect(print)
+        if not daemon.start():
+            print(f"The organizer daemon is already running (PID {DaemonClient.running_pid()})")
+            return 1
+        app.aboutToQuit.connect(daemon.stop)
+        return app.exec()
+
+    client = DaemonClient()
+    if not client.connect_to_daemon():
+        print("The organizer daemon is not running.")
+        return 1
+    try:
+        if args.command == "status":
+            print(json.dumps(client.status(), indent=2))
+        elif args.command == "cancel":
+            client.cancel(args.job)
+        elif args.command == "stop":
+            client.shutdown()
+        elif args.command == "scrub":
+            client.scrub([os.path.abspath(r) for r in args.roots])
+            print("Scrub started")
+        elif args.command == "submit":
+            job_id = None
+            if args.follow:
+                def follow(msg):
+                    if msg.get("job") == job_id:
+                        _print_event(msg)
+                        if msg.get("event") == "finished":
+                            app.quit()
+                client.event.connect(follow)
+                client.disconnected.connect(app.quit)
+            job_id = client.submit({"base_dir": args.base_dir, "sources": args.source,
+                                    "folder_structure": args.structure,
+                                    "separate_videos": args.separate_videos, "excluded_folders": args.exclude,
+                                    "prune_empty": args.prune_empty})
+            print(f"Queued job {job_id}")
+            if args.follow:
+                return app.exec()
+    except (RuntimeError, TimeoutError) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+
+from config import RUN_STATS_PATH
+from control import RunControl
+from rules import ScanRules
+
+# Seconds between refined estimates from the sampling walk.
+REFINE_INTERVAL = 0.5
+# Leaf folders listed before the sampled estimate replaces the history-based one.
+MIN_LEAF_SAMPLES = 30
+# The sampling walk stops after this many leaf folders, and after this many folders in all,
+# so it stays a small fraction of the scan it runs beside.
+MAX_LEAF_SAMPLES = 100
+MAX_SAMPLED_FOLDERS = 1000
+# Files per listed folder whose size is read for the byte estimate.
+SIZE_SAMPLES_PER_DIR = 2
+# Weight of the newest run in the per-library history.
+HISTORY_WEIGHT = 0.5
+
+
+class RunHistory:
+    """Per-library record of finished runs: files found, their bytes, and seconds per file of each stage."""
+
+    @staticmethod
+    def _load_all() -> dict:
+        try:
+            with open(RUN_STATS_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    @staticmethod
+    def load(root: str) -> dict:
+        return RunHistory._load_all().get(os.path.normcase(os.path.abspath(root)), {})
+
+    @staticmethod
+    def record(root: str, files: int, nbytes: int | None, seconds_per_file: dict) -> None:
+        """Blend a finished run into the history; counts are replaced, rates are averaged."""
+        data = RunHistory._load_all()
+        key = os.path.normcase(os.path.abspath(root))
+        entry = data.get(key, {})
+        rates = entry.get("seconds_per_file", {})
+        for stage, spf in seconds_per_file.items():
+            rates[stage] = spf if stage not in rates else HISTORY_WEIGHT * spf + (1 - HISTORY_WEIGHT) * rates[stage]
+        entry.update(files=files, seconds_per_file=rates, updated=time.time())
+        if nbytes:
+            entry["bytes"] = nbytes
+        data[key] = entry
+        tmp = RUN_STATS_PATH + ".tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp, RUN_STATS_PATH)
+        except OSError:
+            pass
+
+
+class FileCountEstimator:
+    """Early estimate of how many media files (and bytes) a scan of some roots will find.
+
+    The first figure is instant. For each root it comes from the entry counts in its
+    directory snapshot, or else the file count of the last run there, or else the
+    catalog. Roots without a snapshot are then sampled by a background walk. Where
+    a directory's st_nlink counts its subdirectories (most POSIX file systems),
+    folders with st_nlink == 2 have none. They are recognised as leaves without
+    being listed, so the folder skeleton of a date tree is known after listing only
+    its upper levels. Then up to MAX_LEAF_SAMPLES leaves are listed in random order,
+    and the rest are extrapolated from their mean. Elsewhere the walk lists
+    breadth-first and extrapolates unvisited folders from the mean per listed
+    folder. No root gets more than MAX_SAMPLED_FOLDERS folders listed, so the
+    sampling never turns into a second full walk beside the real scan. The estimate
+    is refined every REFINE_INTERVAL seconds and is exact only for trees small
+    enough to list completely.
+    """
+
+    def __init__(self, roots: list[str], exts: tuple[str, ...], excluded_folders: list[str] | None = None,
+                 rules: ScanRules | None = None, snapshots: dict | None = None, catalog=None,
+                 history: dict | None = None, control: RunControl | None = None):
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.exts = set(exts)
+        self.rules = (rules or ScanRules()).with_excluded(excluded_folders)
+        self.snapshots = snapshots or {}
+        self.catalog = catalog
+        self.history = history or {}
+        self.control = control or RunControl()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._priors: dict[str, tuple[int | None, int | None, str]] = {}
+        self._live: dict[str, tuple[int, int | None, bool]] = {}
+        self._exact: set[str] = set()
+
+    # -- instant prior ----------------------------------------------------------
+
+    def _snapshot_files(self, root: str) -> int | None:
+        """Files listed under root by the snapshot's last walk, if the coming walk will list them all again."""
+        snapshot = self.snapshots.get(root)
+        if not snapshot or not snapshot.entries:
+            return None
+        prefix = root.rstrip(os.sep) + os.sep
+        return sum(count - len(children) for d, (_, count, children) in snapshot.entries.items()
+                   if d == root or d.startswith(prefix))
+
+    def _prior(self, root: str) -> tuple[int | None, int | None, str]:
+        """(files, bytes, source) for one root from what earlier runs left behind."""
+        catalog_files = catalog_bytes = None
+        if self.catalog:
+            catalog_files, catalog_bytes = self.catalog.subtree_stats(root)
+        mean_size = catalog_bytes / catalog_files if catalog_files else None
+        if not mean_size and self.history.get("files") and self.history.get("bytes"):
+            mean_size = self.history["bytes"] / self.history["files"]
+
+        snapshot = self.snapshots.get(root)
+        if snapshot and snapshot.entries and not snapshot.needs_full_verify():
+            # An incremental walk only yields files in changed folders, like the last run's count, not the library's.
+            files = self.history.get("files", 0) if len(self.roots) == 1 else 0
+            return files, int(files * mean_size) if files and mean_size else None, "snapshot"
+        files, source = self._snapshot_files(root), "snapshot"
+        if files is None and len(self.roots) == 1 and self.history.get("files"):
+            files, source = self.history["files"], "history"
+        if files is None and catalog_files:
+            files, source = catalog_files, "catalog"
+        return files, int(files * mean_size) if files and mean_size else None, source
+
+    def prior(self) -> tuple[int | None, int | None]:
+        """Instant (files, bytes) estimate; None where nothing is known yet."""
+        for root in self.roots:
+            self._priors[root] = self._prior(root)
+        return self._combine()
+
+    def _combine(self) -> tuple[int | None, int | None]:
+        files = nbytes = 0
+        for root in self.roots:
+            live = self._live.get(root)
+            prior_files, prior_bytes, _ = self._priors.get(root, (None, None, ""))
+            if live:
+                live_files, live_bytes, trusted = live
+                files += live_files if trusted or prior_files is None else max(live_files, prior_files)
+                nbytes += live_bytes if live_bytes is not None else (prior_bytes or 0)
+            elif prior_files is not None:
+                files += prior_files
+                nbytes += prior_bytes or 0
+            else:
+                return None, None
+        return files, nbytes or None
+
+    # -- sampling walk ------------------------------------------------------------
+
+    def start(self, callback) -> None:
+        """Refine in a background thread, calling callback(files, bytes, exact) as the estimate improves."""
+        roots = [r for r in self.roots if self._priors.get(r, (None,))[0] is None or
+                 self._priors[r][2] != "snapshot"]
+        if not roots:
+            return
+        self._thread = threading.Thread(target=self._sample, args=(roots, callback), name="estimate", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _stopped(self) -> bool:
+        return self._stop.is_set() or self.control.is_cancelled()
+
+    def _list(self, directory: str, top: str) -> tuple[list, int, list[int]]:
+        """(subdirectory entries, media file count, a few media file sizes) of one folder."""
+        subdirs, count, sizes = [], 0, []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.rules.skip_dir(entry.path, ScanRules.relative(top, entry.path)):
+                                subdirs.append(entry)
+                        elif os.path.splitext(entry.name)[1].lower() in self.exts:
+                            count += 1
+                            if len(sizes) < SIZE_SAMPLES_PER_DIR:
+                                sizes.append(entry.stat(follow_symlinks=False).st_size)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return subdirs, count, sizes
+
+    def _sample(self, roots: list[str], callback) -> None:
+        last = 0.0
+        for root in roots:
+            counted, listed, frontier, leaves = 0, 0, deque([root]), []
+            leaf_files, leaves_listed, sizes = 0, 0, []
+            nlink_leaves = None if os.name != "nt" else False
+
+            def report(exact=False):
+                if not exact and not counted:
+                    return  # only empty upper folders so far; nothing to extrapolate from
+                mean_size = sum(sizes) / len(sizes) if sizes else None
+                if exact:
+                    files = counted
+                else:
+                    per_dir = counted / listed if listed else 0
+                    per_leaf = leaf_files / leaves_listed if leaves_listed else per_dir
+                    files = counted + int(len(leaves) * per_leaf + len(frontier) * per_dir)
+                trusted = exact or (nlink_leaves and not frontier and leaves_listed >= MIN_LEAF_SAMPLES)
+                self._live[root] = (files, int(files * mean_size) if mean_size else None, bool(trusted))
+                if exact:
+                    self._exact.add(root)
+                callback(*self._combine(), len(self._exact) == len(self.roots))
+
+            # Skeleton: list folders that may have subfolders, set aside those known to have none.
+            while frontier and listed < MAX_SAMPLED_FOLDERS:
+                if self._stopped():
+                    return
+                directory = frontier.popleft()
+                subdirs, count, dir_sizes = self._list(directory, root)
+                counted += count
+                listed += 1
+                sizes += dir_sizes
+                if nlink_leaves is None and subdirs:
+                    try:
+                        nlink_leaves = os.stat(directory).st_nlink == 2 + len(subdirs)
+                    except OSError:
+                        nlink_leaves = False
+                for entry in subdirs:
+                    try:
+                        is_leaf = nlink_leaves and entry.stat(follow_symlinks=False).st_nlink == 2
+                    except OSError:
+                        is_leaf = False
+                    (leaves if is_leaf else frontier).append(entry.path)
+                if time.monotonic() - last >= REFINE_INTERVAL:
+                    report()
+                    last = time.monotonic()
+
+            # Leaves in random order, so the running mean is an unbiased sample of the rest.
+            random.shuffle(leaves)
+            while leaves and leaves_listed < MAX_LEAF_SAMPLES and listed < MAX_SAMPLED_FOLDERS:
+                if self._stopped():
+                    return
+                _, count, dir_sizes = self._list(leaves.pop(), root)
+                counted += count
+                leaf_files += count
+                leaves_listed += 1
+                listed += 1
+                sizes += dir_sizes
+                if time.monotonic() - last >= REFINE_INTERVAL:
+                    report()
+                    last = time.monotonic()
+            report(exact=not frontier and not leaves)
+
+
+class RunProgress:
+    """Progress and ETA of an organize run across its scan, extract and move stages.
+
+    Each stage's share of the run is its cost per file. That cost is measured in
+    this run once the stage has handled MIN_RATE_FILES files. Until then it comes
+    from the library's run history, or from DEFAULT_SECONDS_PER_FILE scaled by how
+    fast this run's current stage is going. A stage's progress is its done count
+    over its total: the file estimate until the scan has found everything, then
+    the real count. The ETA is the work left in every stage at those costs. Paused
+    time is left out of all rates.
+    """
+
+    STAGES = ("scan", "extract", "move")
+    DEFAULT_SECONDS_PER_FILE = {"scan": 0.0002, "extract": 0.003, "move": 0.002}
+    MIN_RATE_FILES = 50
+    # Stage fractions stay below this until the stage is known to be finished.
+    OPEN_STAGE_CAP = 0.99
+
+    def __init__(self, history: dict | None = None, clock=time.monotonic):
+        self.history = history or {}
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.estimate: int | None = None
+        self.estimate_bytes: int | None = None
+        self.stage = self.STAGES[0]
+        self.done = dict.fromkeys(self.STAGES, 0)
+        self.totals: dict[str, int | None] = dict.fromkeys(self.STAGES)
+        self.started: dict[str, float | None] = dict.fromkeys(self.STAGES)
+        self.finished_at: dict[str, float | None] = dict.fromkeys(self.STAGES)
+        self._paused_at: float | None = None
+        self._paused_total = 0.0
+        self.started[self.stage] = self._now()
+
+    def _now(self) -> float:
+        now = self._clock()
+        paused = self._paused_total + (now - self._paused_at if self._paused_at is not None else 0.0)
+        return now - paused
+
+    def pause(self) -> None:
+        with self._lock:
+            if self._paused_at is None:
+                self._paused_at = self._clock()
+
+    def resume(self) -> None:
+        with self._lock:
+            if self._paused_at is not None:
+                self._paused_total += self._clock() - self._paused_at
+                self._paused_at = None
+
+    def set_estimate(self, files: int | None, nbytes: int | None = None) -> None:
+        with self._lock:
+            if files is not None:
+                self.estimate = files
+            if nbytes is not None:
+                self.estimate_bytes = nbytes
+
+    def update(self, stage: str, done: int, total: int | None = None) -> None:
+        """Record progress in stage; entering a later stage finishes the ones before it."""
+        with self._lock:
+            now = self._now()
+            index = self.STAGES.index(stage)
+            for earlier in self.STAGES[self.STAGES.index(self.stage):index]:
+                self.finished_at[earlier] = now
+                if self.totals[earlier] is None:
+                    self.totals[earlier] = self.done[earlier]
+            if index >= self.STAGES.index(self.stage):
+                self.stage = stage
+            if self.started[stage] is None:
+                self.started[stage] = now
+            self.done[stage] = done
+            if total is not None:
+                self.totals[stage] = total
+
+    def _measured(self, stage: str, now: float) -> float | None:
+        done, started = self.done[stage], self.started[stage]
+        if started is None or done < self.MIN_RATE_FILES:
+            return None
+        return ((self.finished_at[stage] or now) - started) / done
+
+    def measured_seconds_per_file(self) -> dict[str, float]:
+        """Cost per file of the stages this run handled enough files in to measure."""
+        with self._lock:
+            now = self._now()
+            return {s: spf for s in self.STAGES if (spf := self._measured(s, now))}
+
+    def _seconds_per_file(self, now: float) -> dict[str, float]:
+        measured = {s: self._measured(s, now) for s in self.STAGES}
+        known = self.history.get("seconds_per_file", {})
+        # How much faster or slower than the defaults this machine is running, from the latest measured stage.
+        scale = next((measured[s] / self.DEFAULT_SECONDS_PER_FILE[s] for s in reversed(self.STAGES)
+                      if measured[s]), 1.0)
+        return {s: measured[s] or known.get(s) or self.DEFAULT_SECONDS_PER_FILE[s] * scale for s in self.STAGES}
+
+    def _stage_files(self, stage: str) -> int | None:
+        return self.totals[stage] if self.totals[stage] is not None else self.estimate
+
+    def _fraction(self, stage: str) -> float:
+        if self.finished_at[stage] is not None:
+            return 1.0
+        if self.started[stage] is None:
+            return 0.0
+        files = self._stage_files(stage)
+        if not files:
+            return 0.0
+        return min(self.done[stage] / files, self.OPEN_STAGE_CAP)
+
+    def percent(self) -> int:
+        with self._lock:
+            spf = self._seconds_per_file(self._now())
+            weight = sum(spf.values())
+            return int(100 * sum(spf[s] * self._fraction(s) for s in self.STAGES) / weight)
+
+    def eta(self) -> float | None:
+        """Seconds left, or None while there is no file estimate yet."""
+        with self._lock:
+            spf = self._seconds_per_file(self._now())
+            left = 0.0
+            for stage in self.STAGES:
+                files = self._stage_files(stage)
+                if files is None:
+                    return None
+                left += spf[stage] * max(files - self.done[stage], 0) * (self._fraction(stage) < 1.0)
+            return left
+
+    def summary(self) -> dict:
+        with self._lock:
+            files, nbytes, stage = self.estimate, self.estimate_bytes, self.stage
+            exact = self.totals["scan"] is not None
+        return {"stage": stage, "files": files, "bytes": nbytes, "exact": exact,
+                "percent": self.percent(), "eta": self.eta()}
+
+    @staticmethod
+    def format_summary(summary: dict) -> str:
+        if not summary:
+            return ""
+        parts = [{"scan": "Scanning", "extract": "Reading dates", "move": "Moving"}[summary["stage"]]]
+        if summary.get("files") is not None:
+            approx = "" if summary.get("exact") else "~"
+            parts.append(f"{approx}{summary['files']:,} files")
+            if summary.get("bytes"):
+                parts.append(f"{approx}{summary['bytes'] / (1 << 30):.1f} GB")
+        eta = summary.get("eta")
+        if eta is not None:
+            parts.append(f"{eta / 60:.0f} min left" if eta >= 90 else f"{eta:.0f} s left")
+        return "  ·  ".join(parts)
@@ -0,0 +1,151 @@
+import os
+import json
+
+import numpy as np
+
+EVENTS_FILE = ".photo_events.json"
+
+
+def to_seconds(isos: list[str]) -> np.ndarray:
+    """ISO capture dates to int64 seconds, parsed in one vectorized pass."""
+    return np.array(isos, dtype="datetime64[us]").astype("datetime64[s]").astype(np.int64)
+
+
+class EventClusterer:
+    """Splits a timeline of capture times into events wherever the gap between shots is large.
+
+    Fixed mode splits on gaps longer than gap_hours. Adaptive mode compares each gap
+    with the typical (log-mean) gap of the shots around it, so a pause is judged
+    against how densely that stretch was photographed: gaps shorter than gap_hours
+    never split, gaps longer than max_gap_hours always do, and anything in between
+    splits when it is more than `factor` times the local norm.
+    """
+
+    WINDOW = 25
+
+    def __init__(self, gap_hours: float = 8.0, adaptive: bool = False, factor: float = 10.0,
+                 max_gap_hours: float = 72.0):
+        self.gap = gap_hours * 3600
+        self.adaptive = adaptive
+        self.factor = factor
+        self.max_gap = max_gap_hours * 3600
+
+    @classmethod
+    def from_config(cls, config: dict) -> "EventClusterer":
+        cfg = config.get("events", {})
+        return cls(
+            gap_hours=cfg.get("gap_hours", 8.0),
+            adaptive=cfg.get("adaptive", False),
+            factor=cfg.get("factor", 10.0),
+            max_gap_hours=cfg.get("max_gap_hours", 72.0),
+        )
+
+    def breaks(self, sorted_ts: np.ndarray) -> np.ndarray:
+        """Boolean mask over np.diff(sorted_ts): True where a new event starts."""
+        gaps = np.diff(sorted_ts).astype(np.float64)
+        if not self.adaptive or len(gaps) < 2:
+            return gaps > self.gap
+        log_gaps = np.log1p(gaps)
+        window = min(self.WINDOW, len(gaps))
+        kernel = np.ones(window) / window
+        local = np.convolve(log_gaps, kernel, mode="same")
+        return (gaps > self.gap) & ((gaps > self.max_gap) | (log_gaps > local + np.log(self.factor)))
+
+    def cluster(self, ts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(order, labels): argsort of ts and the event number of each sorted timestamp."""
+        order = np.argsort(ts, kind="stable")
+        labels = np.zeros(len(ts), dtype=np.int64)
+        if len(ts) > 1:
+            labels[1:] = np.cumsum(self.breaks(ts[order]))
+        return order, labels
+
+
+class EventIndex:
+    """Persistent list of events (start, end, folder) for one library, stored in its root.
+
+    New timestamps that fall within the gap of an existing event join it (stretching
+    its range but keeping its folder); the rest are clustered among themselves into
+    new events, so earlier folders never get renamed.
+    """
+
+    # Shots before this hour count towards the previous day when naming folders.
+    DAY_START_HOUR = 4
+
+    def __init__(self, root: str, clusterer: EventClusterer | None = None):
+        self.path = os.path.join(root, EVENTS_FILE)
+        self.clusterer = clusterer or EventClusterer()
+        self.starts = np.empty(0, dtype=np.int64)
+        self.ends = np.empty(0, dtype=np.int64)
+        self.names: list[str] = []
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                events = sorted(json.load(f).get("events", []))
+        except Exception:
+            return
+        self.starts = np.array([e[0] for e in events], dtype=np.int64)
+        self.ends = np.array([e[1] for e in events], dtype=np.int64)
+        self.names = [e[2] for e in events]
+
+    def save(self) -> None:
+        events = [[int(s), int(e), n] for s, e, n in zip(self.starts, self.ends, self.names)]
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"events": events}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    @classmethod
+    def folder_name(cls, start: int, end: int) -> str:
+        shift = np.timedelta64(cls.DAY_START_HOUR, "h")
+        s = (np.datetime64(int(start), "s") - shift).astype("datetime64[D]").item()
+        e = (np.datetime64(int(end), "s") - shift).astype("datetime64[D]").item()
+        if s == e:
+            return s.strftime("%Y-%m-%d")
+        if s.year == e.year:
+            return f"{s:%Y-%m-%d} to {e:%m-%d}"
+        return f"{s:%Y-%m-%d} to {e:%Y-%m-%d}"
+
+    def assign(self, ts: np.ndarray) -> list[str]:
+        """Folder name for each timestamp (seconds), creating or stretching events as needed."""
+        ts = np.asarray(ts, dtype=np.int64)
+        result = np.empty(len(ts), dtype=object)
+        unassigned = np.ones(len(ts), dtype=bool)
+        gap = int(self.clusterer.gap)
+
+        if len(self.starts):
+            # The event starting at or before t, and the one right after it, are the only candidates.
+            before = np.searchsorted(self.starts, ts, side="right") - 1
+            after = before + 1
+            b = np.clip(before, 0, len(self.starts) - 1)
+            a = np.clip(after, 0, len(self.starts) - 1)
+            in_before = (before >= 0) & (ts <= self.ends[b] + gap)
+            in_after = (after < len(self.starts)) & (ts >= self.starts[a] - gap) & ~in_before
+            chosen = np.where(in_before, b, a)
+            hit = in_before | in_after
+            names = np.array(self.names, dtype=object)
+            result[hit] = names[chosen[hit]]
+            np.minimum.at(self.starts, chosen[hit], ts[hit])
+            np.maximum.at(self.ends, chosen[hit], ts[hit])
+            unassigned = ~hit
+
+        if unassigned.any():
+            idx = np.flatnonzero(unassigned)
+            order, labels = self.clusterer.cluster(ts[idx])
+            sorted_ts = ts[idx][order]
+            firsts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+            lasts = np.r_[firsts[1:] - 1, len(labels) - 1]
+            new_names = [self.folder_name(sorted_ts[f], sorted_ts[l]) for f, l in zip(firsts, lasts)]
+            result[idx[order]] = np.array(new_names, dtype=object)[labels]
+
+            starts = np.r_[self.starts, sorted_ts[firsts]]
+            ends = np.r_[self.ends, sorted_ts[lasts]]
+            names = self.names + new_names
+            keep = np.argsort(starts, kind="stable")
+            self.starts, self.ends = starts[keep], ends[keep]
+            self.names = [names[i] for i in keep]
+        return result.tolist()
@@ -0,0 +1,452 @@
+import io
+import struct
+
+from PIL import Image, UnidentifiedImageError
+import exifread
+from exifread.utils import get_gps_coords
+
+# Bytes read up front; sniffing and most header parses are served from this buffer.
+SNIFF_BYTES = 64 * 1024
+# Upper bounds for metadata structures read beyond the sniff buffer.
+MAX_META_BYTES = 16 * 1024 * 1024
+MAX_EXIF_BYTES = 1024 * 1024
+
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+DATE_TAGS = (TAG_DATETIME_ORIGINAL, TAG_DATETIME, TAG_DATETIME_DIGITIZED)
+
+HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif", b"avis"}
+CANON_CR3_UUID = bytes.fromhex("85c0b687820f11e08111f4ce462b6a48")
+
+
+class ExtractorRegistry:
+    """Routes a file to a metadata parser by its leading bytes rather than its extension.
+
+    Each parser is registered with a sniff function over the first SNIFF_BYTES of
+    the file and is called as parser(f, head, info) -> "YYYY:MM:DD HH:MM:SS" or
+    None, reusing head for anything that lies inside it. Parsers may add cheap
+    extras such as the camera model or the GPS position ("gps": (lat, lon)) to info.
+    """
+
+    _formats: list[tuple[str, object, object]] = []
+
+    @classmethod
+    def register(cls, name: str, sniff):
+        def decorator(parser):
+            cls._formats.append((name, sniff, parser))
+            return parser
+        return decorator
+
+    @classmethod
+    def sniff(cls, head: bytes) -> str | None:
+        for name, sniff, _ in cls._formats:
+            if sniff(head):
+                return name
+        return None
+
+    @classmethod
+    def extract(cls, name: str, f, head: bytes, info: dict) -> str | None:
+        for fmt, _, parser in cls._formats:
+            if fmt == name:
+                return parser(f, head, info)
+        return None
+
+
+def _read_at(f, head: bytes, offset: int, size: int) -> bytes:
+    if offset + size <= len(head):
+        return head[offset:offset + size]
+    f.seek(offset)
+    return f.read(size)
+
+
+def read_tiff_tags(data: bytes, wanted=(TAG_MODEL,) + DATE_TAGS, gps_root: bool = False) -> dict:
+    """ASCII tags from IFD0 and the Exif sub-IFD of a TIFF structure, without touching image data.
+
+    The GPS IFD, if present, is returned as a dict under TAG_GPS_IFD, shaped like
+    Pillow's Exif.get_ifd(): refs as strings, coordinates as (deg, min, sec) floats.
+    gps_root reads a structure whose first IFD is itself the GPS IFD (CR3's CMT4).
+    """
+    if data[:2] == b"II":
+        e = "<"
+    elif data[:2] == b"MM":
+        e = ">"
+    else:
+        return {}
+    tags: dict = {}
+    gps: dict[int, object] = {}
+    pending, seen = [(struct.unpack(e + "I", data[4:8])[0], gps if gps_root else tags)], set()
+    while pending:
+        off, target = pending.pop()
+        if off in seen or off + 2 > len(data):
+            continue
+        seen.add(off)
+        count = struct.unpack(e + "H", data[off:off + 2])[0]
+        for i in range(count):
+            entry = off + 2 + 12 * i
+            if entry + 12 > len(data):
+                break
+            tag, typ, n = struct.unpack(e + "HHI", data[entry:entry + 8])
+            if target is tags and tag in (TAG_EXIF_IFD, TAG_GPS_IFD):
+                pointer = struct.unpack(e + "I", data[entry + 8:entry + 12])[0]
+                pending.append((pointer, tags if tag == TAG_EXIF_IFD else gps))
+            elif typ == 2 and (tag in wanted or target is gps):
+                if n <= 4:
+                    raw = data[entry + 8:entry + 8 + n]
+                else:
+                    value_off = struct.unpack(e + "I", data[entry + 8:entry + 12])[0]
+                    raw = data[value_off:value_off + n]
+                target[tag] = raw.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+            elif typ == 5 and target is gps and n <= 3:
+                value_off = struct.unpack(e + "I", data[entry + 8:entry + 12])[0]
+                raw = data[value_off:value_off + 8 * n]
+                if len(raw) == 8 * n:
+                    values = struct.unpack(e + "I" * (2 * n), raw)
+                    gps[tag] = tuple(num / den if den else 0.0 for num, den in zip(values[::2], values[1::2]))
+    if gps:
+        tags[TAG_GPS_IFD] = gps
+    return tags
+
+
+def gps_from_ifd(gps: dict) -> tuple[float, float] | None:
+    """(lat, lon) in decimal degrees from a GPS IFD dict; None if missing or the 0,0 placeholder."""
+    try:
+        lat = sum(float(v) / 60 ** i for i, v in enumerate(gps[2]))
+        lon = sum(float(v) / 60 ** i for i, v in enumerate(gps[4]))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if str(gps.get(1, "N")).strip("\x00 ").upper() == "S":
+        lat = -lat
+    if str(gps.get(3, "E")).strip("\x00 ").upper() == "W":
+        lon = -lon
+    return _valid_position(lat, lon)
+
+
+def _valid_position(lat: float, lon: float) -> tuple[float, float] | None:
+    # Many cameras write 0,0 when they have no fix.
+    if (lat == 0 and lon == 0) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def _from_tiff_tags(tags: dict, info: dict) -> str | None:
+    if tags.get(TAG_MODEL) and "camera" not in info:
+        info["camera"] = tags[TAG_MODEL]
+    gps = gps_from_ifd(tags.get(TAG_GPS_IFD, {}))
+    if gps:
+        info["gps"] = gps
+    for tag in DATE_TAGS:
+        if tags.get(tag):
+            return tags[tag]
+    return None
+
+
+def _exif_payload(data: bytes) -> bytes:
+    # EXIF blocks are stored with or without the JPEG-style "Exif\0\0" prefix.
+    return data[6:] if data.startswith(b"Exif\0\0") else data
+
+
+# -- JPEG / PNG ---------------------------------------------------------------
+
+def _parse_pillow(f, head: bytes, info: dict) -> str | None:
+    f.seek(0)
+    try:
+        exif = Image.open(f).getexif()
+        if exif:
+            if exif.get(272):
+                info["camera"] = str(exif.get(272)).strip("\x00 ")
+            gps = gps_from_ifd(exif.get_ifd(TAG_GPS_IFD)) if TAG_GPS_IFD in exif else None
+            if gps:
+                info["gps"] = gps
+            # DateTimeOriginal/Digitized live in the Exif sub-IFD, DateTime in IFD0.
+            tags = {**exif, **exif.get_ifd(TAG_EXIF_IFD)}
+            for tag in DATE_TAGS:
+                if tags.get(tag):
+                    return tags[tag]
+    except (UnidentifiedImageError, OSError):
+        pass
+    return _parse_exifread(f, head, info)
+
+
+ExtractorRegistry.register("jpeg", lambda h: h[:3] == b"\xff\xd8\xff")(_parse_pillow)
+ExtractorRegistry.register("png", lambda h: h[:8] == b"\x89PNG\r\n\x1a\n")(_parse_pillow)
+
+
+# -- TIFF-based RAW (CR2, NEF, ARW, DNG, ORF, RW2) ----------------------------
+
+def _parse_exifread(f, head: bytes, info: dict) -> str | None:
+    f.seek(0)
+    tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal", details=False, extract_thumbnail=False)
+    model = tags.get("Image Model")
+    if model and "camera" not in info:
+        info["camera"] = str(model).strip("\x00 ")
+    try:
+        gps = get_gps_coords(tags)
+    except (ValueError, TypeError, ZeroDivisionError, IndexError):
+        gps = None
+    if gps and _valid_position(*gps):
+        info["gps"] = _valid_position(*gps)
+    dt = tags.get("EXIF DateTimeOriginal") or tags.get("Image DateTime")
+    return str(dt) if dt else None
+
+
+ExtractorRegistry.register(
+    "tiff", lambda h: h[:4] in (b"II*\x00", b"MM\x00*", b"IIRO", b"IIRS", b"IIU\x00"))(_parse_exifread)
+
+
+# -- WebP ---------------------------------------------------------------------
+
+@ExtractorRegistry.register("webp", lambda h: h[:4] == b"RIFF" and h[8:12] == b"WEBP")
+def _parse_webp(f, head: bytes, info: dict) -> str | None:
+    pos, end = 12, 8 + struct.unpack("<I", head[4:8])[0]
+    while pos + 8 <= end:
+        header = _read_at(f, head, pos, 8)
+        if len(header) < 8:
+            break
+        fourcc, size = header[:4], struct.unpack("<I", header[4:])[0]
+        if fourcc == b"EXIF":
+            data = _read_at(f, head, pos + 8, min(size, MAX_EXIF_BYTES))
+            return _from_tiff_tags(read_tiff_tags(_exif_payload(data)), info)
+        pos += 8 + size + (size & 1)
+    return None
+
+
+# -- ISO-BMFF: HEIC / HEIF / AVIF and Canon CR3 ------------------------------
+
+def _boxes(data: bytes, start: int = 0, end: int | None = None):
+    """Yield (type, payload_start, payload_end) for the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _top_level_boxes(f, head: bytes):
+    """Yield (type, payload_offset, payload_size) for the top-level boxes of a file, reading only their headers."""
+    pos = 0
+    while True:
+        header = _read_at(f, head, pos, 16)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header[:8])
+        hdr = 8
+        if size == 1:
+            size, hdr = struct.unpack(">Q", header[8:16])[0], 16
+        elif size == 0:
+            size = MAX_META_BYTES
+        if size < hdr:
+            return
+        yield kind, pos + hdr, size - hdr
+        pos += size
+
+
+def _top_level_box(f, head: bytes, wanted: bytes) -> bytes | None:
+    """Payload of the first top-level box of the given type, read from the file as needed."""
+    for kind, offset, size in _top_level_boxes(f, head):
+        if kind == wanted:
+            return _read_at(f, head, offset, min(size, MAX_META_BYTES))
+    return None
+
+
+def _uint(data: bytes, pos: int, size: int) -> int:
+    return int.from_bytes(data[pos:pos + size], "big") if size else 0
+
+
+def _heif_exif_location(meta: bytes) -> tuple[int, int] | None:
+    """File offset and length of the Exif item, from the iinf and iloc boxes of a meta box."""
+    exif_id, locations = None, {}
+    for kind, start, end in _boxes(meta, 4):  # meta is a full box: skip version/flags
+        if kind == b"iinf":
+            version = meta[start]
+            pos = start + 4 + (2 if version == 0 else 4)
+            for entry, e_start, _ in _boxes(meta, pos, end):
+                if entry != b"infe" or meta[e_start] < 2:
+                    continue
+                id_size = 2 if meta[e_start] == 2 else 4
+                item_id = _uint(meta, e_start + 4, id_size)
+                if meta[e_start + 4 + id_size + 2:e_start + 4 + id_size + 6] == b"Exif":
+                    exif_id = item_id
+        elif kind == b"iloc":
+            version = meta[start]
+            offset_size, length_size = meta[start + 4] >> 4, meta[start + 4] & 0xF
+            base_size, index_size = meta[start + 5] >> 4, meta[start + 5] & 0xF if version else 0
+            id_size = 2 if version < 2 else 4
+            count = _uint(meta, start + 6, id_size)
+            pos = start + 6 + id_size
+            for _ in range(count):
+                item_id = _uint(meta, pos, id_size)
+                pos += id_size
+                method = 0
+                if version:
+                    method = _uint(meta, pos, 2) & 0xF
+                    pos += 2
+                pos += 2  # data_reference_index
+                base = _uint(meta, pos, base_size)
+                pos += base_size
+                extents = _uint(meta, pos, 2)
+                pos += 2
+                first = None
+                for _ in range(extents):
+                    pos += index_size
+                    offset = _uint(meta, pos, offset_size)
+                    length = _uint(meta, pos + offset_size, length_size)
+                    pos += offset_size + length_size
+                    if first is None:
+                        first = (base + offset, length)
+                if method == 0 and first:
+                    locations[item_id] = first
+    return locations.get(exif_id) if exif_id is not None else None
+
+
+def _is_bmff(head: bytes, brands) -> bool:
+    return head[4:8] == b"ftyp" and head[8:12] in brands
+
+
+@ExtractorRegistry.register("heif", lambda h: _is_bmff(h, HEIF_BRANDS))
+def _parse_heif(f, head: bytes, info: dict) -> str | None:
+    meta = _top_level_box(f, head, b"meta")
+    location = _heif_exif_location(meta) if meta else None
+    if not location:
+        return None
+    offset, length = location
+    data = _read_at(f, head, offset, min(length, MAX_EXIF_BYTES))
+    if len(data) < 4:
+        return None
+    # The Exif item starts with the offset of the TIFF header inside it.
+    tiff_start = 4 + struct.unpack(">I", data[:4])[0]
+    return _from_tiff_tags(read_tiff_tags(data[tiff_start:]), info)
+
+
+@ExtractorRegistry.register("cr3", lambda h: _is_bmff(h, {b"crx "}))
+def _parse_cr3(f, head: bytes, info: dict) -> str | None:
+    moov = _top_level_box(f, head, b"moov")
+    if not moov:
+        return None
+    tags: dict = {}
+    for kind, start, end in _boxes(moov):
+        if kind != b"uuid" or moov[start:start + 16] != CANON_CR3_UUID:
+            continue
+        # CMT1 holds IFD0 (model, DateTime), CMT2 the Exif IFD (DateTimeOriginal), CMT4 the GPS IFD.
+        for sub, s_start, s_end in _boxes(moov, start + 16, end):
+            if sub in (b"CMT1", b"CMT2", b"CMT4"):
+                tags.update(read_tiff_tags(moov[s_start:s_end], gps_root=sub == b"CMT4"))
+    return _from_tiff_tags(tags, info)
+
+
+# -- Embedded previews --------------------------------------------------------
+
+TAG_NEW_SUBFILE_TYPE = 0x00FE
+TAG_COMPRESSION = 0x0103
+TAG_STRIP_OFFSETS = 0x0111
+TAG_ORIENTATION = 0x0112
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_SUB_IFDS = 0x014A
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+JPEG_COMPRESSION = (6, 7)
+MAX_PREVIEW_IFDS = 16
+CANON_PREVIEW_UUID = bytes.fromhex("eaf42b5e1c984b88b9fbb7dc406e4d16")
+
+
+def _ifd_ints(f, head: bytes, e: str, entry: bytes) -> tuple[int, list[int]]:
+    """Tag and SHORT/LONG values of one 12-byte IFD entry; other types give no values."""
+    tag, typ, n = struct.unpack(e + "HHI", entry[:8])
+    size = {3: 2, 4: 4, 13: 4}.get(typ)
+    if size is None or not 0 < n <= 64:
+        return tag, []
+    if size * n <= 4:
+        raw = entry[8:8 + size * n]
+    else:
+        raw = _read_at(f, head, struct.unpack(e + "I", entry[8:12])[0], size * n)
+    if len(raw) < size * n:
+        return tag, []
+    return tag, list(struct.unpack(e + ("H" if size == 2 else "I") * n, raw))
+
+
+def _tiff_previews(f, head: bytes) -> tuple[list[tuple[int, int]], int]:
+    e = "<" if head[:2] == b"II" else ">"
+    previews, orientation = [], 1
+    pending, seen = [struct.unpack(e + "I", head[4:8])[0]], []
+    while pending and len(seen) < MAX_PREVIEW_IFDS:
+        off = pending.pop(0)
+        if off < 8 or off in seen:
+            continue
+        seen.append(off)
+        raw_count = _read_at(f, head, off, 2)
+        if len(raw_count) < 2:
+            continue
+        count = struct.unpack(e + "H", raw_count)[0]
+        block = _read_at(f, head, off + 2, 12 * count + 4)
+        tags = {}
+        for i in range(min(count, len(block) // 12)):
+            tag, values = _ifd_ints(f, head, e, block[12 * i:12 * i + 12])
+            if values:
+                tags[tag] = values
+        if len(seen) == 1:
+            orientation = tags.get(TAG_ORIENTATION, [1])[0]
+
+        if TAG_JPEG_OFFSET in tags and TAG_JPEG_LENGTH in tags:
+            previews.append((tags[TAG_JPEG_OFFSET][0], tags[TAG_JPEG_LENGTH][0]))
+        elif (tags.get(TAG_COMPRESSION, [0])[0] in JPEG_COMPRESSION and len(tags.get(TAG_STRIP_OFFSETS, ())) == 1
+              and (tags.get(TAG_NEW_SUBFILE_TYPE, [0])[0] == 1 or len(seen) == 1)):
+            # Reduced-resolution images, and CR2's IFD0, which holds a full-size JPEG preview.
+            previews.append((tags[TAG_STRIP_OFFSETS][0], tags.get(TAG_STRIP_BYTE_COUNTS, [0])[0]))
+        pending.extend(tags.get(TAG_SUB_IFDS, []))
+        if len(block) == 12 * count + 4:
+            pending.append(struct.unpack(e + "I", block[-4:])[0])
+    return [p for p in previews if p[1] > 0], orientation
+
+
+def _cr3_previews(f, head: bytes) -> tuple[list[tuple[int, int]], int]:
+    previews, orientation = [], 1
+    for kind, offset, size in _top_level_boxes(f, head):
+        if kind == b"moov":
+            moov = _read_at(f, head, offset, min(size, MAX_META_BYTES))
+            for box, start, end in _boxes(moov):
+                if box != b"uuid" or moov[start:start + 16] != CANON_CR3_UUID:
+                    continue
+                for sub, s_start, s_end in _boxes(moov, start + 16, end):
+                    if sub == b"THMB":
+                        soi = moov.find(b"\xff\xd8", s_start, s_end)
+                        if soi >= 0:
+                            previews.append((offset + soi, s_end - soi))
+                    elif sub == b"CMT1":
+                        cmt1 = moov[s_start:s_end]
+                        orientation = _tiff_previews(io.BytesIO(cmt1), cmt1)[1] if cmt1[:2] in (b"II", b"MM") else 1
+        elif kind == b"uuid":
+            # The PRVW box (about 1620x1080) sits in its own top-level uuid box.
+            probe = _read_at(f, head, offset, 64)
+            soi = probe.find(b"\xff\xd8")
+            if probe[:16] == CANON_PREVIEW_UUID and soi >= 0:
+                previews.append((offset + soi, size - soi))
+    return previews, orientation
+
+
+def embedded_previews(f, head: bytes) -> tuple[list[tuple[int, int]], int]:
+    """(file offset, length) of the JPEG previews embedded in a RAW file, and its EXIF orientation.
+
+    TIFF-based RAWs (CR2, NEF, ARW, DNG, ORF, RW2) are walked through IFD0, its
+    chained IFDs and SubIFDs; CR3 previews come from its THMB and PRVW boxes. Only
+    IFD entries are read, never image data. Other formats yield no previews.
+    """
+    try:
+        if head[:2] in (b"II", b"MM") and len(head) >= 8:
+            return _tiff_previews(f, head)
+        if _is_bmff(head, {b"crx "}):
+            return _cr3_previews(f, head)
+    except (struct.error, OSError):
+        pass
+    return [], 1
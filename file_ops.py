@@ -1,9 +1,122 @@
 import os
+import sys
+import mmap
+import errno
+import ctypes
 import hashlib
+import platform
 import shutil
 import threading
 from datetime import datetime
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SIDECAR_EXTS
+from geocode import PlaceIndex
+from rules import ScanRules
+
+# Unit of every read and hash update; hashlib releases the GIL for updates of this size.
+IO_BLOCK = 256 * 1024
+# Files at least this large are hashed through a memory map instead of reads.
+MMAP_MIN_BYTES = 8 << 20
+# Bytes compared at the head, middle and tail before a full comparison.
+SAMPLE_BYTES = 64 * 1024
+
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+RENAME_EXCL = 0x4
+# renameat2 syscall numbers, for C libraries older than glibc 2.28 that lack the wrapper.
+SYS_RENAMEAT2 = {"x86_64": 316, "aarch64": 276, "i686": 353, "i386": 353}
+# errnos meaning the filesystem (not the call) cannot do a no-replace rename.
+NOREPLACE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+class FileReader:
+    """Low-level reads shared by the FileUtils hash and compare helpers.
+
+    Files are opened unbuffered and read with readinto() into per-thread buffers
+    that are reused across calls, so large files are processed without allocating
+    a bytes object per chunk. Hashing large files feeds zero-copy slices of a
+    memory map to hashlib, which does the page-ins and digest work with the GIL
+    released, so hashing in several threads scales across cores.
+    """
+
+    _local = threading.local()
+
+    @classmethod
+    def buffers(cls) -> tuple[bytearray, bytearray]:
+        bufs = getattr(cls._local, "bufs", None)
+        if bufs is None:
+            bufs = cls._local.bufs = (bytearray(IO_BLOCK), bytearray(IO_BLOCK))
+        return bufs
+
+    @staticmethod
+    def open(path: str):
+        return open(path, 'rb', buffering=0)
+
+    @staticmethod
+    def read_at(f, offset: int | None, buf: bytearray, size: int) -> int:
+        """Fill buf[:size] from offset (None: the current position); returns the number of bytes read."""
+        if offset is not None:
+            f.seek(offset)
+        view = memoryview(buf)[:size]
+        got = 0
+        while got < size:
+            n = f.readinto(view[got:])
+            if not n:
+                break
+            got += n
+        return got
+
+    @classmethod
+    def hash_into(cls, f, hasher, size: int | None = None, start: int = 0):
+        """Feed the file's bytes from start to EOF into hasher and return it."""
+        size = os.fstat(f.fileno()).st_size if size is None else size
+        if size - start >= MMAP_MIN_BYTES:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        for off in range(start, len(mm), IO_BLOCK):
+                            with view[off:off + IO_BLOCK] as block:
+                                hasher.update(block)
+                return hasher
+            except (OSError, ValueError):
+                pass  # not mappable (some network or special files): fall back to reads
+        buf = cls.buffers()[0]
+        view = memoryview(buf)
+        f.seek(start)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                return hasher
+            hasher.update(view[:n] if n < IO_BLOCK else buf)
+
+    @classmethod
+    def same_content(cls, f1, f2, size: int, start: int = 0) -> bool:
+        """Byte-for-byte equality of two files of the given size from start on.
+
+        A head, middle and tail sample is compared first, so files that differ
+        anywhere near those points are rejected after reading a few blocks.
+        """
+        buf1, buf2 = cls.buffers()
+        remaining = size - start
+        if remaining > 3 * SAMPLE_BYTES:
+            for off in (start, start + remaining // 2 - SAMPLE_BYTES // 2, size - SAMPLE_BYTES):
+                n1 = cls.read_at(f1, off, buf1, SAMPLE_BYTES)
+                n2 = cls.read_at(f2, off, buf2, SAMPLE_BYTES)
+                if n1 != n2 or buf1[:n1] != buf2[:n2]:
+                    return False
+        f1.seek(start)
+        f2.seek(start)
+        while True:
+            n1 = cls.read_at(f1, None, buf1, IO_BLOCK)
+            n2 = cls.read_at(f2, None, buf2, IO_BLOCK)
+            if n1 != n2:
+                return False
+            if n1 < IO_BLOCK:
+                return buf1[:n1] == buf2[:n2]
+            if buf1 != buf2:
+                return False
 
 
 class FileUtils:
@@ -20,43 +133,45 @@ class FileUtils:
     @staticmethod
     def quick_file_hash(path: str, block_size: int = 4096) -> str:
         try:
-            size = os.path.getsize(path)
-            with open(path, 'rb') as f:
-                start = f.read(block_size)
-            return hashlib.md5(start + size.to_bytes(8, 'little')).hexdigest()
+            with FileReader.open(path) as f:
+                size = os.fstat(f.fileno()).st_size
+                buf = FileReader.buffers()[0]
+                n = FileReader.read_at(f, 0, buf, min(block_size, IO_BLOCK))
+                hasher = hashlib.md5(memoryview(buf)[:n])
+            hasher.update(size.to_bytes(8, 'little'))
+            return hasher.hexdigest()
         except Exception:
             return ""
 
     @staticmethod
-    def full_file_hash(path: str, block_size: int = 65536) -> str:
+    def full_file_hash(path: str) -> str:
         try:
-            hasher = hashlib.md5()
-            with open(path, 'rb') as f:
-                for chunk in iter(lambda: f.read(block_size), b''):
-                    hasher.update(chunk)
-            return hasher.hexdigest()
+            with FileReader.open(path) as f:
+                return FileReader.hash_into(f, hashlib.md5()).hexdigest()
         except Exception:
             return ""
 
     @staticmethod
-    def files_are_identical(path1: str, path2: str, block_size: int = 65536) -> bool:
+    def hash_files(paths: list[str], max_workers: int = 4) -> dict[str, str]:
+        """full_file_hash for many files at once; digests run in parallel threads outside the GIL."""
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(paths, executor.map(FileUtils.full_file_hash, paths)))
+
+    @staticmethod
+    def files_are_identical(path1: str, path2: str) -> bool:
         try:
-            if os.path.getsize(path1) != os.path.getsize(path2):
-                return False
-            with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
-                while True:
-                    b1 = f1.read(block_size)
-                    b2 = f2.read(block_size)
-                    if b1 != b2:
-                        return False
-                    if not b1:
-                        return True
+            with FileReader.open(path1) as f1, FileReader.open(path2) as f2:
+                size = os.fstat(f1.fileno()).st_size
+                if os.fstat(f2.fileno()).st_size != size:
+                    return False
+                return FileReader.same_content(f1, f2, size)
         except Exception:
             return False
 
     @staticmethod
     def resolve_filename_conflict(dest: str, src: str) -> str | None:
-        if not os.path.exists(dest):
+        # lexists: a dangling link still occupies the name.
+        if not os.path.lexists(dest):
             return dest
 
         if FileUtils.quick_file_hash(dest) == FileUtils.quick_file_hash(src):
@@ -67,7 +182,7 @@ class FileUtils:
         i = 1
         while True:
             new_path = f"{base}_{i}{ext}"
-            if not os.path.exists(new_path):
+            if not os.path.lexists(new_path):
                 return new_path
             if FileUtils.quick_file_hash(new_path) == FileUtils.quick_file_hash(src):
                 if FileUtils.files_are_identical(new_path, src):
@@ -75,9 +190,11 @@ class FileUtils:
             i += 1
 
     @staticmethod
-    def fast_walk(top: str, topdown: bool = True):
+    def fast_walk(top: str, topdown: bool = True, rules: ScanRules | None = None):
+        """Breadth-first walk; with rules, excluded folders are not descended into and files are filtered."""
         queue = deque([top])
         visited = []
+        rules = rules or None
 
         while queue:
             current_dir = queue.popleft()
@@ -87,8 +204,12 @@ class FileUtils:
                     for entry in it:
                         try:
                             if entry.is_dir(follow_symlinks=False):
+                                if rules and rules.skip_dir(entry.path, ScanRules.relative(top, entry.path)):
+                                    continue
                                 dirs.append(entry.path)
                             elif entry.is_file(follow_symlinks=False):
+                                if rules and not rules.accept_file(entry, ScanRules.relative(top, entry.path)):
+                                    continue
                                 files.append(entry.name)
                         except Exception:
                             continue
@@ -112,56 +233,309 @@ class FileUtils:
             FileUtils._seen_hashes.add(checksum)
         return False
 
+    @staticmethod
+    def reset_seen() -> None:
+        """Forget checksums from earlier runs; long-lived processes call this between jobs."""
+        with FileUtils._seen_lock:
+            FileUtils._seen_hashes.clear()
+
+
+def _load_native_rename():
+    """C function (src, dst) -> 0 / -1 that renames without replacing, or None on other platforms."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except (OSError, TypeError):
+        return None
+    if sys.platform.startswith("linux"):
+        fn = getattr(libc, "renameat2", None)
+        if fn is not None:
+            fn.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+            fn.restype = ctypes.c_int
+            return lambda src, dst: fn(AT_FDCWD, src, AT_FDCWD, dst, RENAME_NOREPLACE)
+        number = SYS_RENAMEAT2.get(platform.machine())
+        if number is None:
+            return None
+        syscall = libc.syscall
+        syscall.restype = ctypes.c_long
+        return lambda src, dst: syscall(ctypes.c_long(number), ctypes.c_int(AT_FDCWD), ctypes.c_char_p(src),
+                                        ctypes.c_int(AT_FDCWD), ctypes.c_char_p(dst), ctypes.c_uint(RENAME_NOREPLACE))
+    if sys.platform == "darwin":
+        fn = getattr(libc, "renamex_np", None)
+        if fn is not None:
+            fn.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint]
+            fn.restype = ctypes.c_int
+            return lambda src, dst: fn(src, dst, RENAME_EXCL)
+    return None
+
+
+_native_rename = _load_native_rename() if os.name == "posix" else None
+
 
 class FileMover:
     @staticmethod
-    def move_file(src: str, dest_folder: str, lock: threading.RLock, existing_files: set[str]) -> str:
-        filename = os.path.basename(src)
-        if FileUtils.is_fast_duplicate(src):
-            return f"Skipped {filename}, duplicate by checksum"
+    def rename_noreplace(src: str, dst: str) -> None:
+        """Atomically rename src to dst, raising FileExistsError instead of replacing an existing dst.
+
+        Uses renameat2(RENAME_NOREPLACE) on Linux and renamex_np(RENAME_EXCL) on macOS;
+        on Windows a plain rename already refuses to replace. Filesystems without
+        no-replace support fall back to link+unlink, then to claiming the name with an
+        O_EXCL placeholder that the rename replaces. Across devices the file is copied
+        into an O_EXCL-created destination and the source removed.
+        """
+        if _native_rename is not None:
+            if _native_rename(os.fsencode(src), os.fsencode(dst)) == 0:
+                return
+            err = ctypes.get_errno()
+            if err == errno.EEXIST:
+                raise FileExistsError(err, os.strerror(err), dst)
+            if err == errno.EXDEV:
+                FileMover._copy_exclusive(src, dst)
+                return
+            if err not in NOREPLACE_UNSUPPORTED:
+                raise OSError(err, os.strerror(err), src, None, dst)
+
+        if os.name == "nt":
+            try:
+                os.rename(src, dst)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                FileMover._copy_exclusive(src, dst)
+            return
 
         try:
-            os.makedirs(dest_folder, exist_ok=True)
-            dest = os.path.join(dest_folder, filename)
+            os.link(src, dst)
+        except FileExistsError:
+            raise
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                FileMover._copy_exclusive(src, dst)
+                return
+            # No hard links here (FAT, some network shares): claim the name, then replace our own placeholder.
+            os.close(os.open(dst, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            try:
+                os.replace(src, dst)
+            except OSError:
+                os.unlink(dst)
+                raise
+            return
+        os.unlink(src)
+
+    @staticmethod
+    def _copy_exclusive(src: str, dst: str) -> None:
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, IO_BLOCK)
+            shutil.copystat(src, dst)
+        except FileExistsError:
+            raise
+        except BaseException:
+            try:
+                os.unlink(dst)
+            except OSError:
+                pass
+            raise
+        os.unlink(src)
 
-            with lock:
-                resolved_dest = FileUtils.resolve_filename_conflict(dest, src)
-                if resolved_dest is None:
-                    return f"Skipped {filename}, duplicate"
-                dest = resolved_dest
-                existing_files.add(os.path.basename(dest))
+    @staticmethod
+    def move_noclobber(src: str, dest: str) -> str | None:
+        """Move src to dest, or dest_1, dest_2, ... if taken; None if a taken name holds an identical file.
+
+        Each name is claimed by the atomic rename itself, so concurrent movers need no
+        shared lock and no existence check: a mover that loses a race gets
+        FileExistsError and tries the next suffix.
+        """
+        base, ext = os.path.splitext(dest)
+        candidate, i = dest, 0
+        while True:
+            try:
+                FileMover.rename_noreplace(src, candidate)
+                return candidate
+            except FileExistsError:
+                if FileMover._identical(src, candidate):
+                    return None
+            i += 1
+            candidate = f"{base}_{i}{ext}"
+
+    @staticmethod
+    def _identical(src: str, candidate: str) -> bool:
+        return (FileUtils.quick_file_hash(candidate) == FileUtils.quick_file_hash(src)
+                and FileUtils.files_are_identical(candidate, src))
+
+    @staticmethod
+    def move_group_noclobber(moves: list[tuple[str, str]]) -> list[str | None]:
+        """Move each (src, dest) of one stem group, giving every dest the same _1, _2, ... suffix when one is taken.
 
-            if os.path.abspath(src) != os.path.abspath(dest):
+        The stem is that of the first dest; the rest of each name (".CR2", ".CR2.xmp")
+        is kept. A suffix is used only if every member's name under it is free, is
+        the member itself, or holds an identical file (that member is skipped: None),
+        so a RAW+JPEG pair and its sidecars never end up under different stems. Names
+        are claimed by the atomic rename as in move_noclobber; if a claim loses a race
+        or fails, the members already moved under that suffix are moved back, then the
+        next suffix is tried or the error raised.
+        """
+        stem = os.path.splitext(os.path.basename(moves[0][1]))[0]
+        cuts = []
+        for _, dest in moves:
+            name = os.path.basename(dest)
+            cuts.append(len(stem) if name.lower().startswith(stem.lower()) else len(os.path.splitext(name)[0]))
+        i = 0
+        while True:
+            names = [FileMover._suffixed(dest, cut, i) for (_, dest), cut in zip(moves, cuts)]
+            if all(not os.path.lexists(name) or os.path.abspath(name) == os.path.abspath(src)
+                   or FileMover._identical(src, name) for (src, _), name in zip(moves, names)):
+                results = FileMover._claim_group([src for src, _ in moves], names)
+                if results is not None:
+                    return results
+            i += 1
+
+    @staticmethod
+    def _suffixed(path: str, cut: int, i: int) -> str:
+        if not i:
+            return path
+        folder, name = os.path.split(path)
+        return os.path.join(folder, f"{name[:cut]}_{i}{name[cut:]}")
+
+    @staticmethod
+    def _claim_group(sources: list[str], names: list[str]) -> list[str | None] | None:
+        """Move sources onto names; None (with nothing moved) if a name was taken by a different file meanwhile."""
+        claimed, results = [], []
+        try:
+            for src, name in zip(sources, names):
+                if os.path.abspath(src) == os.path.abspath(name):
+                    results.append(name)
+                    continue
                 try:
-                    os.rename(src, dest)
-                except OSError:
-                    shutil.move(src, dest)
-                return f"Moved {filename} → {dest_folder}"
+                    FileMover.rename_noreplace(src, name)
+                except FileExistsError:
+                    if FileMover._identical(src, name):
+                        results.append(None)
+                        continue
+                    FileMover._unclaim(claimed)
+                    return None
+                claimed.append((src, name))
+                results.append(name)
+        except OSError:
+            FileMover._unclaim(claimed)
+            raise
+        return results
+
+    @staticmethod
+    def _unclaim(claimed: list[tuple[str, str]]) -> None:
+        for src, name in reversed(claimed):
+            FileMover.rename_noreplace(name, src)
+
+    @staticmethod
+    def move_file(src: str, dest_folder: str, lock: threading.RLock, existing_files: set[str], on_moved=None) -> str:
+        """Move src into dest_folder and describe what happened; raises OSError if the move failed."""
+        filename = os.path.basename(src)
+        # Sidecars are small and often byte-identical across photos (same edit), so they are never deduplicated.
+        if os.path.splitext(filename)[1].lower() not in SIDECAR_EXTS and FileUtils.is_fast_duplicate(src):
+            return f"Skipped {filename}, duplicate by checksum"
+
+        os.makedirs(dest_folder, exist_ok=True)
+        dest = os.path.join(dest_folder, filename)
+        if os.path.abspath(src) == os.path.abspath(dest):
             return f"Skipped {filename}, already there"
+
+        dest = FileMover.move_noclobber(src, dest)
+        if dest is None:
+            return f"Skipped {filename}, duplicate"
+        with lock:
+            existing_files.add(os.path.basename(dest))
+        if on_moved:
+            on_moved(src, dest)
+        return f"Moved {filename} → {dest_folder}"
+
+    @staticmethod
+    def move_group(items: list[tuple[str, str]], lock: threading.RLock, existing_files: set[str],
+                   on_moved=None) -> list[str]:
+        """Move the (src, dest_folder) members of one stem group together and describe what happened to each.
+
+        Members that are duplicates by checksum stay behind; the rest share one
+        collision suffix (see move_group_noclobber). Raises OSError if the group
+        could not be moved, in which case none of it was.
+        """
+        messages, moves, names = [], [], []
+        for src, dest_folder in items:
+            filename = os.path.basename(src)
+            if os.path.splitext(filename)[1].lower() not in SIDECAR_EXTS and FileUtils.is_fast_duplicate(src):
+                messages.append(f"Skipped {filename}, duplicate by checksum")
+                continue
+            os.makedirs(dest_folder, exist_ok=True)
+            messages.append(None)
+            moves.append((src, os.path.join(dest_folder, filename)))
+        if moves:
+            names = iter(FileMover.move_group_noclobber(moves))
+        for k, (src, dest_folder) in enumerate(items):
+            if messages[k] is not None:
+                continue
+            filename, dest = os.path.basename(src), next(names)
+            if dest is None:
+                messages[k] = f"Skipped {filename}, duplicate"
+            elif os.path.abspath(src) == os.path.abspath(dest):
+                messages[k] = f"Skipped {filename}, already there"
+            else:
+                with lock:
+                    existing_files.add(os.path.basename(dest))
+                if on_moved:
+                    on_moved(src, dest)
+                messages[k] = f"Moved {filename} → {dest_folder}"
+        return messages
+
+    @staticmethod
+    def safe_move_group(items: list[tuple[str, str]], lock: threading.RLock, existing: set[str], log_func,
+                        on_moved=None) -> bool:
+        """Log the outcome of move_group; False if the group was neither moved nor skipped on purpose."""
+        try:
+            for message in FileMover.move_group(items, lock, existing, on_moved):
+                log_func(message)
+            return True
+        except OSError as e:
+            log_func(f"Error moving {', '.join(os.path.basename(src) for src, _ in items)}: {e}")
         except Exception as e:
-            return f"Error moving {filename}: {e}"
+            import traceback
+            err = traceback.format_exc()
+            log_func(f"[CRITICAL] Exception moving {items[0][0]}: {e}\n{err}")
+        return False
 
     @staticmethod
-    def safe_move_file(src: str, target: str, lock: threading.RLock, existing: set[str], log_func) -> None:
+    def safe_move_file(src: str, target: str, lock: threading.RLock, existing: set[str], log_func, on_moved=None) -> bool:
+        """Log the outcome of move_file; False if src was neither moved nor skipped on purpose."""
         try:
-            result = FileMover.move_file(src, target, lock, existing)
-            log_func(result)
+            log_func(FileMover.move_file(src, target, lock, existing, on_moved))
+            return True
+        except OSError as e:
+            log_func(f"Error moving {os.path.basename(src)}: {e}")
         except Exception as e:
             import traceback
             err = traceback.format_exc()
             log_func(f"[CRITICAL] Exception moving {src}: {e}\n{err}")
+        return False
 
 
 class FolderNameGenerator:
+    # Structures that need the reverse-geocoded place of each file.
+    LOCATION_STRUCTURES = ("year_location", "location_day")
+
     @staticmethod
-    def generate(dt: datetime | None, ext: str, structure: str) -> str:
+    def generate(dt: datetime | None, ext: str, structure: str, place: tuple[str, str | None] | None = None) -> str:
         if not dt:
             return "Unknown Date"
 
         formats = {
+            "year_location": lambda: os.path.join(dt.strftime("%Y"), *PlaceIndex.folder_parts(place)),
+            "location_day": lambda: os.path.join(*PlaceIndex.folder_parts(place), dt.strftime("%Y-%m-%d")),
             "day": lambda: dt.strftime("%Y-%m-%d"),
             "year_month_day": lambda: os.path.join(dt.strftime("%Y"), dt.strftime("%m"), dt.strftime("%d")),
             "year_month": lambda: os.path.join(dt.strftime("%Y"), dt.strftime("%m")),
             "year_day": lambda: os.path.join(dt.strftime("%Y"), dt.strftime("%j")),
         }
         return formats.get(structure, lambda: dt.strftime("%Y-%m-%d"))()
+
+    @staticmethod
+    def depth(structure: str) -> int:
+        """Folder levels generate() produces for a structure; location levels may be fewer when a city is unknown."""
+        sample = FolderNameGenerator.generate(datetime(2000, 1, 1), "", structure, ("Country", "City"))
+        return len(os.path.normpath(sample).split(os.sep))
+
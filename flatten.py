@@ -1,11 +1,15 @@
 import os
+import stat
 import shutil
 import re
+import ctypes
+from pathlib import Path
 from typing import Optional, Callable
 from collections import deque
 
 
-def flatten_folder_tree(root_dir: str, target_dir: str) -> None:
+def flatten_folder_tree(root_dir: str, target_dir: str, progress_fn: Optional[Callable[[int, int], None]] = None,
+                        control=None) -> None:
     root_dir, target_dir = map(os.path.abspath, (root_dir, target_dir))
     if (target_dir.startswith(root_dir) or root_dir.startswith(target_dir)) and root_dir != target_dir:
         raise ValueError("Directories cannot be nested inside each other.")
@@ -14,12 +18,22 @@ def flatten_folder_tree(root_dir: str, target_dir: str) -> None:
     existing = set(os.listdir(target_dir))
 
     stack = deque()
+    total = 0
     for dirpath, _, files in os.walk(root_dir, topdown=False):
         stack.append((dirpath, files))
+        total += len(files)
+        if control and not control.checkpoint():
+            return
 
+    done = 0
     while stack:
         dirpath, files = stack.pop()
         for f in files:
+            if control and not control.checkpoint():
+                return
+            done += 1
+            if progress_fn:
+                progress_fn(done, total)
             src = os.path.join(dirpath, f)
             if not os.path.isfile(src):
                 continue
@@ -41,14 +55,21 @@ def flatten_folder_tree(root_dir: str, target_dir: str) -> None:
                 pass
 
 
-def clean_img_filenames(folder: str, recursive: bool = True, log_fn: Optional[Callable[[str], None]] = None) -> None:
+def clean_img_filenames(folder: str, recursive: bool = True, log_fn: Optional[Callable[[str], None]] = None,
+                        progress_fn: Optional[Callable[[int, int], None]] = None, control=None) -> None:
     pattern = re.compile(r'IMG_(\d+)')
     walk = os.walk(folder) if recursive else [(folder, [], os.listdir(folder))]
 
+    done = 0
     for dirpath, _, files in walk:
         existing = set(files)
 
         for f in files:
+            if control and not control.checkpoint():
+                return
+            done += 1
+            if progress_fn:
+                progress_fn(done, 0)
             path = os.path.join(dirpath, f)
             if not os.path.isfile(path):
                 continue
@@ -75,3 +96,55 @@ def clean_img_filenames(folder: str, recursive: bool = True, log_fn: Optional[Ca
 
             if log_fn:
                 log_fn(f"Renamed: {path} -> {new_path}")
+
+
+def prune_empty_folders(root_path: str, log_fn: Optional[Callable[[str], None]] = None,
+                        progress_fn: Optional[Callable[[int, int], None]] = None, control=None) -> None:
+    def is_hidden_or_system(p: Path) -> bool:
+        try:
+            attrs = ctypes.windll.kernel32.GetFileAttributesW(str(p))
+            if attrs == -1:
+                return False
+            return bool(attrs & (stat.FILE_ATTRIBUTE_HIDDEN | stat.FILE_ATTRIBUTE_SYSTEM))
+        except Exception:
+            return False
+
+    log_fn = log_fn or (lambda msg: None)
+    root = Path(root_path)
+    done = 0
+
+    # Walk bottom-up to remove children before parents
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if control and not control.checkpoint():
+            return
+        done += 1
+        if progress_fn:
+            progress_fn(done, 0)
+        current_dir = Path(dirpath)
+
+        # Skip if current path is symlink (avoid removing real data accidentally)
+        if current_dir.is_symlink():
+            continue
+
+        # Filter visible files (non-hidden/non-system)
+        visible_files = [
+            f for f in filenames
+            if not is_hidden_or_system(current_dir / f) and not f.startswith(".")
+        ]
+
+        # Filter visible directories (non-hidden/non-system); children removed earlier in this walk are gone
+        visible_dirs = [
+            d for d in dirnames
+            if (current_dir / d).exists()
+            and not is_hidden_or_system(current_dir / d) and not (current_dir / d).name.startswith(".")
+        ]
+
+        # Remove directory if empty (no visible files or directories)
+        if not visible_files and not visible_dirs:
+            try:
+                current_dir.rmdir()
+                log_fn(f"Removed empty folder: {current_dir}")
+            except PermissionError as e:
+                log_fn(f"Permission denied removing folder {current_dir}: {e}")
+            except Exception as e:
+                log_fn(f"Could not remove folder {current_dir}: {e}")
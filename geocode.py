@@ -0,0 +1,182 @@
+import os
+import csv
+
+import numpy as np
+
+# Bundled offline dataset: capitals and major cities (name,country,lat,lon).
+PLACES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "places.csv")
+EARTH_RADIUS_KM = 6371.0
+NO_LOCATION = "No Location"
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """Points on the unit sphere; chord distance between them is monotonic in great-circle distance."""
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class KDTree:
+    """Static k-d tree over 3D points with exact nearest-neighbour queries.
+
+    Nodes split on the axis of largest spread at the median (argpartition), and
+    leaves hold up to LEAF_SIZE points that are scanned with numpy, so the Python
+    work per query is a handful of node visits.
+    """
+
+    LEAF_SIZE = 32
+
+    def __init__(self, points: np.ndarray):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.index = np.arange(len(self.points))
+        # node: (axis, split, left, right) for inner nodes, (-1, start, end, 0) for leaves
+        self.nodes: list[tuple] = []
+        if len(self.points):
+            self._build(0, len(self.points))
+            self.points = self.points[self.index]
+
+    def _build(self, start: int, end: int) -> int:
+        node = len(self.nodes)
+        self.nodes.append(None)
+        if end - start <= self.LEAF_SIZE:
+            self.nodes[node] = (-1, start, end, 0)
+            return node
+        pts = self.points[self.index[start:end]]
+        axis = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        mid = (end - start) // 2
+        part = np.argpartition(pts[:, axis], mid)
+        self.index[start:end] = self.index[start:end][part]
+        split = float(pts[part[mid], axis])
+        left = self._build(start, start + mid)
+        right = self._build(start + mid, end)
+        self.nodes[node] = (axis, split, left, right)
+        return node
+
+    def query(self, q: np.ndarray) -> tuple[float, int]:
+        """(chord distance, original index) of the point nearest to q."""
+        best_d2, best_i = np.inf, -1
+        stack = [(0, 0.0)] if self.nodes else []
+        nodes, points = self.nodes, self.points
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best_d2:
+                continue
+            axis, split, a, b = nodes[node]
+            if axis < 0:
+                d2 = ((points[split:a] - q) ** 2).sum(axis=1)
+                i = int(np.argmin(d2))
+                if d2[i] < best_d2:
+                    best_d2, best_i = float(d2[i]), split + i
+                continue
+            diff = q[axis] - split
+            near, far = (a, b) if diff < 0 else (b, a)
+            stack.append((far, diff * diff))
+            stack.append((near, bound))
+        return (float(np.sqrt(best_d2)), int(self.index[best_i])) if best_i >= 0 else (np.inf, -1)
+
+
+class PlaceIndex:
+    """Offline reverse geocoder: nearest known place for a batch of GPS positions.
+
+    Positions are rounded (about 1 km) and deduplicated before lookup, so a chunk of
+    photos from the same outing costs one query. The city is only reported within
+    city_radius_km; further out the nearest place still gives the country, up to
+    COUNTRY_RADIUS_KM (beyond that, e.g. at sea, the position is left unresolved).
+    Uses scipy's cKDTree when it is installed and the bundled KDTree otherwise.
+    """
+
+    CITY_RADIUS_KM = 50.0
+    COUNTRY_RADIUS_KM = 750.0
+    ROUND_DIGITS = 2
+
+    _cache: dict[tuple, "PlaceIndex"] = {}
+
+    def __init__(self, names: list[str], countries: list[str], lats, lons,
+                 source: str = PLACES_PATH, city_radius_km: float = CITY_RADIUS_KM):
+        self.names = names
+        self.countries = countries
+        self.source = source
+        self.city_radius_km = city_radius_km
+        points = to_unit_vectors(lats, lons) if len(names) else np.empty((0, 3))
+        try:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(points) if len(names) else None
+            self._scipy = True
+        except ImportError:
+            self._tree = KDTree(points)
+            self._scipy = False
+        self._memo: dict[tuple[float, float], tuple[str, str | None]] = {}
+
+    @classmethod
+    def load(cls, path: str | None = None, city_radius_km: float = CITY_RADIUS_KM) -> "PlaceIndex":
+        """Index for a places file, cached per process.
+
+        Accepts the bundled CSV layout (name,country,lat,lon with a header) or a
+        GeoNames cities export (tab-separated .txt; countries appear as ISO codes).
+        """
+        path = path or PLACES_PATH
+        key = (path, city_radius_km)
+        if key not in cls._cache:
+            names, countries, lats, lons = [], [], [], []
+            try:
+                with open(path, 'r', encoding='utf-8', newline='') as f:
+                    if path.lower().endswith(".txt"):
+                        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                            if len(row) > 8:
+                                names.append(row[1])
+                                countries.append(row[8])
+                                lats.append(float(row[4]))
+                                lons.append(float(row[5]))
+                    else:
+                        for row in csv.DictReader(f):
+                            names.append(row["name"])
+                            countries.append(row["country"])
+                            lats.append(float(row["lat"]))
+                            lons.append(float(row["lon"]))
+            except (OSError, ValueError, KeyError):
+                names, countries, lats, lons = [], [], [], []
+            cls._cache[key] = cls(names, countries, lats, lons, path, city_radius_km)
+        return cls._cache[key]
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PlaceIndex":
+        return cls.load(config.get("places_file") or None, config.get("city_radius_km", cls.CITY_RADIUS_KM))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def lookup(self, positions: list[tuple[float, float] | None]) -> list[tuple[str, str | None] | None]:
+        """(country, city or None) for each (lat, lon); None for missing or unresolvable positions."""
+        if not self.names:
+            return [None] * len(positions)
+        keys = [(round(p[0], self.ROUND_DIGITS), round(p[1], self.ROUND_DIGITS)) if p else None for p in positions]
+        missing = sorted({k for k in keys if k is not None and k not in self._memo})
+        if missing:
+            lats, lons = zip(*missing)
+            queries = to_unit_vectors(lats, lons)
+            if self._scipy:
+                chords, idx = self._tree.query(queries)
+            else:
+                chords, idx = map(np.array, zip(*(self._tree.query(q) for q in queries)))
+            for key, km, i in zip(missing, chord_to_km(chords), idx):
+                if km > self.COUNTRY_RADIUS_KM:
+                    self._memo[key] = None
+                else:
+                    self._memo[key] = (self.countries[i], self.names[i] if km <= self.city_radius_km else None)
+        return [self._memo[k] if k is not None else None for k in keys]
+
+    @staticmethod
+    def folder_parts(place: tuple[str, str | None] | None) -> list[str]:
+        """Path components for a place: [country, city], [country] or [NO_LOCATION]."""
+        if not place:
+            return [NO_LOCATION]
+        return [_safe_name(p) for p in place if p]
+
+
+def _safe_name(name: str) -> str:
+    cleaned = "".join("_" if c in '<>:"/\\|?*' or ord(c) < 32 else c for c in name).strip(" .")
+    return cleaned or NO_LOCATION
@@ -0,0 +1,350 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+
+import psutil
+
+# Back-off multiplier bounds; 1.0 means running at full budget.
+MIN_FACTOR = 0.05
+MAX_PACE_DELAY = 0.25
+# Per-thread I/O counters on Linux.
+THREAD_IO_PATH = "/proc/thread-self/io"
+
+
+class TokenBucket:
+    """Token bucket shared between threads and extraction worker processes.
+
+    A rate of 0 disables limiting. Tokens may go negative so requests larger than
+    the burst size are admitted and paid back before the next one.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.base_rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1.0))
+        # [effective rate, tokens, last refill, total consumed]
+        self._state = multiprocessing.Array('d', [self.base_rate, self.burst, time.monotonic(), 0.0])
+
+    def set_factor(self, factor: float) -> None:
+        with self._state.get_lock():
+            self._state[0] = self.base_rate * factor
+
+    def consumed(self) -> float:
+        return self._state[3]
+
+    def consume(self, amount: float = 1.0) -> None:
+        state = self._state
+        while True:
+            with state.get_lock():
+                rate = state[0]
+                if self.base_rate <= 0:
+                    state[3] += amount
+                    return
+                now = time.monotonic()
+                state[1] = min(self.burst, state[1] + (now - state[2]) * rate)
+                state[2] = now
+                if state[1] > 0:
+                    state[1] -= amount
+                    state[3] += amount
+                    return
+                wait = -state[1] / rate if rate > 0 else MAX_PACE_DELAY
+            time.sleep(min(max(wait, 0.001), MAX_PACE_DELAY))
+
+
+class Throttle:
+    """The part of the governor handed to workers: read/move buckets plus a back-off pace delay."""
+
+    def __init__(self, read_bytes_per_sec: float = 0, moves_per_sec: float = 0):
+        self.read_bucket = TokenBucket(read_bytes_per_sec, burst=max(read_bytes_per_sec, 1 << 20))
+        self.move_bucket = TokenBucket(moves_per_sec)
+        self._delay = multiprocessing.Value('d', 0.0)
+        self._proc = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_proc"] = None
+        return state
+
+    def set_factor(self, factor: float) -> None:
+        self.read_bucket.set_factor(factor)
+        self.move_bucket.set_factor(factor)
+        self._delay.value = 0.0 if factor >= 1.0 else MAX_PACE_DELAY * (1.0 - factor)
+
+    def pace(self) -> None:
+        delay = self._delay.value
+        if delay > 0:
+            time.sleep(delay)
+
+    def charge_read(self, nbytes: int) -> None:
+        if nbytes > 0:
+            self.read_bucket.consume(nbytes)
+        self.pace()
+
+    def charge_move(self) -> None:
+        self.move_bucket.consume(1)
+        self.pace()
+
+    def _read_counter(self) -> int:
+        try:
+            if self._proc is None:
+                self._proc = psutil.Process()
+            io = self._proc.io_counters()
+            return getattr(io, "read_chars", io.read_bytes)
+        except Exception:
+            return 0
+
+    @staticmethod
+    def _thread_read_counter() -> int | None:
+        """Bytes read by the calling thread (Linux); None where the OS doesn't count per thread."""
+        try:
+            with open(THREAD_IO_PATH, 'rb') as f:
+                for line in f:
+                    if line.startswith(b"rchar:"):
+                        return int(line.split()[1])
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    @contextmanager
+    def metered_read(self, path: str | None = None):
+        """Charge the bytes read inside the block against the read budget.
+
+        A worker process measures its own process's I/O. When path is given, the
+        reader shares its process with others (extraction threads), whose reads
+        the process counters would include. So the calling thread's own counter
+        is used instead, or, where there is none, the file's size, which is an
+        upper bound for header reads.
+        """
+        if path is None:
+            before = self._read_counter()
+            yield
+            self.charge_read(self._read_counter() - before)
+            return
+        before = self._thread_read_counter()
+        yield
+        after = self._thread_read_counter() if before is not None else None
+        if after is not None:
+            self.charge_read(after - before)
+            return
+        try:
+            self.charge_read(os.path.getsize(path))
+        except OSError:
+            self.pace()
+
+
+class ResourceGovernor:
+    """Keeps background organizing within CPU, I/O and memory budgets.
+
+    Lowers CPU and I/O priority for the run, caps pool widths to the CPU share, and runs a
+    monitor that shrinks the token-bucket rates whenever the machine is busy or a
+    budget is exceeded, recovering gradually once it is idle again.
+    """
+
+    SAMPLE_INTERVAL = 1.0
+
+    def __init__(self, cpu_share: float = 1.0, read_bytes_per_sec: float = 0, moves_per_sec: float = 0,
+                 max_rss_mb: float = 0, busy_cpu_percent: float = 75.0):
+        self.cpu_share = min(max(cpu_share, 0.01), 1.0)
+        self.max_rss_mb = max_rss_mb
+        self.busy_cpu_percent = busy_cpu_percent
+        self.throttle = Throttle(read_bytes_per_sec, moves_per_sec)
+        self.factor = 1.0
+        self._usage: dict = {}
+        self._me = psutil.Process()
+        self._children: dict[int, psutil.Process] = {}
+        self._lowered: set[int] = set()
+        self._lower_children = False
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ResourceGovernor":
+        budget = config.get("governor", {})
+        return cls(
+            cpu_share=budget.get("cpu_share", 1.0),
+            read_bytes_per_sec=budget.get("read_mb_per_sec", 0) * (1 << 20),
+            moves_per_sec=budget.get("moves_per_sec", 0),
+            max_rss_mb=budget.get("max_rss_mb", 0),
+            busy_cpu_percent=budget.get("busy_cpu_percent", 75.0),
+        )
+
+    def limit_workers(self, workers: int) -> int:
+        return max(1, min(workers, int(psutil.cpu_count() * self.cpu_share) or 1))
+
+    @contextmanager
+    def lowered_priority(self, log_fn=None):
+        """Run the block at low CPU and I/O priority, then put the old priorities back.
+
+        On Linux both are per thread: only the calling thread is lowered, along with
+        the threads and processes it starts meanwhile (they inherit them), and the
+        rest of the process, such as the GUI, keeps its priority. Elsewhere they are
+        per process and an unprivileged user cannot raise them again, so this process
+        is left alone and only its worker processes are lowered, by the monitor as it
+        finds them. log_fn hears about a priority that could not be put back.
+        """
+        if not sys.platform.startswith("linux"):
+            self._lower_children = True
+            for child in self._own_processes()[1:]:
+                self._lower_child(child)
+            try:
+                yield
+            finally:
+                self._lower_children = False
+            return
+
+        proc = psutil.Process(threading.get_native_id())
+        saved_nice, saved_io = self._lower(proc)
+        try:
+            yield
+        finally:
+            error = self._restore(proc, saved_nice, saved_io)
+            if error and log_fn:
+                log_fn(f"Could not restore the organizer thread's priority ({error}); it stays low until it ends.")
+
+    @staticmethod
+    def _lower(proc: psutil.Process) -> tuple:
+        """Drop proc to low CPU and I/O priority; returns the (nice, ionice) it had, None where unknown."""
+        saved_nice = saved_io = None
+        try:
+            saved_nice = proc.nice()
+            if sys.platform == "win32":
+                proc.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            else:
+                proc.nice(max(saved_nice, 10))
+        except (psutil.Error, OSError):
+            pass
+        try:
+            saved_io = proc.ionice()
+            if sys.platform == "win32":
+                proc.ionice(psutil.IOPRIO_LOW)
+            elif hasattr(psutil, "IOPRIO_CLASS_IDLE"):
+                proc.ionice(psutil.IOPRIO_CLASS_IDLE)
+        except (psutil.Error, OSError, AttributeError):
+            pass
+        return saved_nice, saved_io
+
+    @staticmethod
+    def _restore(proc: psutil.Process, saved_nice, saved_io) -> str | None:
+        """Put back what _lower saved; the error if raising priority was refused."""
+        error = None
+        try:
+            if saved_nice is not None:
+                proc.nice(saved_nice)
+        except (psutil.Error, OSError) as e:
+            error = e
+        try:
+            if isinstance(saved_io, int):
+                proc.ionice(saved_io)
+            elif saved_io is not None:
+                keeps_value = saved_io.ioclass in (psutil.IOPRIO_CLASS_RT, psutil.IOPRIO_CLASS_BE)
+                proc.ionice(saved_io.ioclass, saved_io.value if keeps_value else None)
+        except (psutil.Error, OSError, ValueError) as e:
+            error = error or e
+        if isinstance(error, psutil.AccessDenied):
+            return "permission denied"
+        return str(error) if error else None
+
+    def _lower_child(self, child: psutil.Process) -> None:
+        # Workers are never raised again; the daemon's warm pool only does background work anyway.
+        if child.pid not in self._lowered:
+            self._lowered.add(child.pid)
+            self._lower(child)
+
+    def start(self, report_fn=None) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._monitor, args=(report_fn,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def usage(self) -> dict:
+        return dict(self._usage)
+
+    def _own_processes(self) -> list[psutil.Process]:
+        procs = [self._me]
+        try:
+            for child in self._me.children(recursive=True):
+                procs.append(self._children.setdefault(child.pid, child))
+                if self._lower_children:
+                    self._lower_child(child)
+        except psutil.Error:
+            pass
+        return procs
+
+    def _monitor(self, report_fn) -> None:
+        ncpu = psutil.cpu_count() or 1
+        psutil.cpu_percent(None)
+        last_read = self.throttle.read_bucket.consumed()
+        last_moves = self.throttle.move_bucket.consumed()
+        last_time = time.monotonic()
+
+        while not self._stop.wait(self.SAMPLE_INTERVAL):
+            own_cpu, rss = 0.0, 0
+            for proc in self._own_processes():
+                try:
+                    own_cpu += proc.cpu_percent(None)
+                    rss += proc.memory_info().rss
+                except psutil.Error:
+                    self._children.pop(proc.pid, None)
+                    self._lowered.discard(proc.pid)
+            own_share = own_cpu / (100.0 * ncpu)
+            system_cpu = psutil.cpu_percent(None)
+            others_cpu = max(0.0, system_cpu - own_share * 100.0)
+            rss_mb = rss / (1 << 20)
+
+            over_budget = own_share > self.cpu_share or (self.max_rss_mb and rss_mb > self.max_rss_mb)
+            busy = others_cpu > self.busy_cpu_percent
+            if over_budget or busy:
+                self.factor = max(MIN_FACTOR, self.factor * 0.5)
+            else:
+                self.factor = min(1.0, self.factor + 0.1)
+            self.throttle.set_factor(self.factor)
+
+            now = time.monotonic()
+            elapsed = max(now - last_time, 1e-6)
+            read_total = self.throttle.read_bucket.consumed()
+            moves_total = self.throttle.move_bucket.consumed()
+            self._usage = {
+                "cpu_share": own_share,
+                "cpu_budget": self.cpu_share,
+                "read_bytes_per_sec": (read_total - last_read) / elapsed,
+                "read_budget": self.throttle.read_bucket.base_rate,
+                "moves_per_sec": (moves_total - last_moves) / elapsed,
+                "moves_budget": self.throttle.move_bucket.base_rate,
+                "rss_mb": rss_mb,
+                "rss_budget_mb": self.max_rss_mb,
+                "factor": self.factor,
+                "busy": busy,
+            }
+            last_read, last_moves, last_time = read_total, moves_total, now
+            if report_fn:
+                report_fn(self.usage())
+
+    @staticmethod
+    def format_usage(usage: dict) -> str:
+        if not usage:
+            return ""
+        parts = [f"CPU {usage['cpu_share'] * 100:.0f}%/{usage['cpu_budget'] * 100:.0f}%"]
+        read = f"Read {usage['read_bytes_per_sec'] / (1 << 20):.1f} MB/s"
+        if usage["read_budget"]:
+            read += f"/{usage['read_budget'] / (1 << 20):.0f}"
+        parts.append(read)
+        moves = f"Moves {usage['moves_per_sec']:.0f}/s"
+        if usage["moves_budget"]:
+            moves += f"/{usage['moves_budget']:.0f}"
+        parts.append(moves)
+        rss = f"RSS {usage['rss_mb']:.0f} MB"
+        if usage["rss_budget_mb"]:
+            rss += f"/{usage['rss_budget_mb']:.0f}"
+        parts.append(rss)
+        if usage["factor"] < 1.0:
+            parts.append(f"backing off x{usage['factor']:.2f}")
+        return "  ·  ".join(parts)
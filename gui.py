@@ -1,25 +1,39 @@
 import os
-import stat
-import ctypes
 import threading
-from pathlib import Path
 from multiprocessing import cpu_count
 
 from PySide6.QtWidgets import QApplication, QWidget, QFileDialog, QMessageBox
 from PySide6.QtGui import QTextCursor
 from PySide6.QtCore import Qt, Signal
 import flatten
+import similar
 import startup_watchdog
 
 from config import ConfigManager
+from control import RunCheckpoint
+from governor import ResourceGovernor
+from events import EventClusterer
+from geocode import PlaceIndex
+from rules import ScanRules
+from backends import ExtractBackend
+from estimate import RunProgress
+from netio import AsyncIOEngine
+from browser import LibraryBrowser, ThumbnailCache, DEFAULT_WORKERS
+from catalog import LibraryCatalog
+from snapshot import DirectorySnapshot
+from tasks import TaskManager
+from linkview import LinkViewOrganizer
+from ingest import CardIngester
 from organizer import PhotoOrganizer
 from worker import WorkerThread
+from daemon import DaemonClient, RemoteJob
 from ui_form import Ui_Widget
 
 
 class PhotoOrganizerGUI(QWidget):
     log_signal = Signal(str)
-    FOLDER_STRUCT_MAP = {0: "day", 1: "year_month_day", 2: "year_month", 3: "year_day"}
+    FOLDER_STRUCT_MAP = {0: "day", 1: "year_month_day", 2: "year_month", 3: "year_day", 4: "events",
+                         5: "year_location", 6: "location_day"}
     PROGRESS_STYLE_DEFAULT = """
         QProgressBar {
             height: 22px; border: 1px solid #444; border-radius: 6px;
@@ -34,6 +48,11 @@ class PhotoOrganizerGUI(QWidget):
         self.ui.setupUi(self)
         self.config = ConfigManager.load()
         self.lock = threading.RLock()
+        self.catalog = LibraryCatalog()
+        self.organizer = None
+        self._progress_notes = {}
+        self.browser = None
+        self.tasks = TaskManager()
         self._connect_signals()
         self.load_config()
 
@@ -44,11 +63,20 @@ class PhotoOrganizerGUI(QWidget):
         u.remove_excluded_button.clicked.connect(self.remove_selected_excluded_folders)
         u.reset_all_button.clicked.connect(self.reset_settings)
         u.start_button.clicked.connect(self.start_organizing)
+        u.pause_button.clicked.connect(self.toggle_pause)
+        u.cancel_button.clicked.connect(self.cancel_organizing)
         u.flatten_button.clicked.connect(self.flatten_button_clicked)
         u.clean_filenames_button.clicked.connect(self.clean_filenames_clicked)
+        u.ingest_button.clicked.connect(self.start_ingest)
+        u.similar_button.clicked.connect(self.find_similar_clicked)
+        u.browse_library_button.clicked.connect(self.browse_library_clicked)
         u.startupadd_button.clicked.connect(startup_watchdog.install_watchdog)
         u.startupremove_button.clicked.connect(startup_watchdog.uninstall_watchdog)
         self.log_signal.connect(self._append_log)
+        self.tasks.log_msg.connect(self.log_signal.emit)
+        self.tasks.task_started.connect(lambda *_: self.ui.cancel_button.setEnabled(True))
+        self.tasks.task_progress.connect(self._show_task_progress)
+        self.tasks.task_finished.connect(self._task_finished)
 
     def _append_log(self, msg):
         doc = self.ui.log_list.document()
@@ -89,30 +117,203 @@ class PhotoOrganizerGUI(QWidget):
         if not base_dir or not os.path.isdir(base_dir):
             self.log_signal.emit("Invalid base directory.")
             return
+        busy = self.tasks.conflicting_task(base_dir)
+        if busy:
+            self.log_signal.emit(f"Cannot organize while {busy.name} is running on {busy.root}.")
+            return
+
+        missing = [s for s in self.config.get("extra_sources", []) if not os.path.isdir(s)]
+        if missing:
+            self.log_signal.emit(f"Extra source folder not found: {missing[0]}")
+            return
+
+        self.save_config()
+        folder_structure = self.FOLDER_STRUCT_MAP.get(self.ui.format_comboBox.currentIndex(), "day")
+        if not self.ui.link_view_checkbox.isChecked() and self.config.get("use_daemon", True):
+            handled = self._submit_to_daemon(base_dir, folder_structure)
+            if handled is not None:
+                if handled:
+                    self._run_organizer(base_dir)
+                return
+        if self.ui.link_view_checkbox.isChecked():
+            view_dir = self.config.get("view_dir") or QFileDialog.getExistingDirectory(
+                self, "Select Folder for the Link View", os.path.dirname(base_dir))
+            if not view_dir:
+                return
+            self.config["view_dir"] = view_dir
+            self.save_config()
+        ExtractBackend.configure(self.config)
+        # The organizer closes its I/O engine when the run ends.
+        common = dict(
+            max_workers=min(8, cpu_count()),
+            separate_videos=self.ui.sep_videos_checkbox.isChecked(),
+            excluded_folders=self.get_excluded_folders(),
+            governor=ResourceGovernor.from_config(self.config) if self.config.get("governor") else None,
+            event_clusterer=EventClusterer.from_config(self.config),
+            place_index=PlaceIndex.from_config(self.config),
+            scan_rules=ScanRules.from_config(self.config),
+            io_engine=AsyncIOEngine.from_config(self.config, base_dir),
+        )
+        if self.ui.link_view_checkbox.isChecked():
+            self.organizer = LinkViewOrganizer(base_dir, view_dir, folder_structure,
+                                               link_mode=self.config.get("link_mode", "auto"), **common)
+        else:
+            self.organizer = PhotoOrganizer(
+                base_dir=base_dir,
+                folder_structure=folder_structure,
+                checkpoint=RunCheckpoint(base_dir, folder_structure,
+                                         source_dirs=self.config.get("extra_sources", [])),
+                catalog=self.catalog,
+                record_hashes=self.config.get("scrub", {}).get("hash_on_organize", True),
+                source_dirs=[base_dir] + self.config.get("extra_sources", []),
+                snapshot=DirectorySnapshot(base_dir, full_verify_every=self.config.get("full_rescan_every",
+                                                                                    DirectorySnapshot.FULL_VERIFY_EVERY)),
+                **common
+            )
+        self._run_organizer(base_dir)
+
+    def _submit_to_daemon(self, base_dir, folder_structure):
+        """Hand the run to a running organizer daemon.
+
+        Returns True when the daemon took the job (self.organizer is its RemoteJob),
+        False when it refused it, and None when no daemon answered so the run stays local.
+        """
+        client = DaemonClient()
+        if not client.connect_to_daemon():
+            return None
+        try:
+            self.organizer = RemoteJob(client, {
+                "base_dir": base_dir,
+                "sources": self.config.get("extra_sources", []),
+                "folder_structure": folder_structure,
+                "separate_videos": self.ui.sep_videos_checkbox.isChecked(),
+                "excluded_folders": self.get_excluded_folders(),
+                "prune_empty": self.ui.rem_empty_checkbox.isChecked(),
+            })
+        except RuntimeError as e:
+            self.log_signal.emit(f"The organizer daemon refused the job: {e}")
+            return False
+        except (ConnectionError, TimeoutError):
+            return None
+        self.log_signal.emit(f"Organizing in the background process (job {self.organizer.job_id})...")
+        return True
 
+    def start_ingest(self):
+        library = self.ui.base_dir_edit.text().strip()
+        if not library or not os.path.isdir(library):
+            self.log_signal.emit("Select the library (base directory) to import into first.")
+            return
+        source = QFileDialog.getExistingDirectory(self, "Select Card or Folder to Import", self.config.get("ingest_source", ""))
+        if not source:
+            return
+        if TaskManager.overlaps(source, library):
+            self.log_signal.emit("The import source cannot be inside the library or contain it.")
+            return
+        busy = self.tasks.conflicting_task(library)
+        if busy:
+            self.log_signal.emit(f"Cannot import while {busy.name} is running on {busy.root}.")
+            return
+
+        self.config["ingest_source"] = source
         self.save_config()
-        self.organizer = PhotoOrganizer(
-            base_dir=base_dir,
-            folder_structure=self.FOLDER_STRUCT_MAP.get(self.ui.format_comboBox.currentIndex(), "day"),
+        self.organizer = CardIngester(
+            source, library,
+            self.FOLDER_STRUCT_MAP.get(self.ui.format_comboBox.currentIndex(), "day"),
             max_workers=min(8, cpu_count()),
             separate_videos=self.ui.sep_videos_checkbox.isChecked(),
-            excluded_folders=self.get_excluded_folders()
+            governor=ResourceGovernor.from_config(self.config) if self.config.get("governor") else None,
+            catalog=self.catalog,
+            event_clusterer=EventClusterer.from_config(self.config),
+            place_index=PlaceIndex.from_config(self.config),
+            scan_rules=ScanRules.from_config(self.config)
         )
+        self._run_organizer(library)
+
+    def _run_organizer(self, base_dir):
         self.organizer.progress.connect(self.ui.progress_bar.setValue)
         self.organizer.log_msg.connect(self.log_signal.emit)
         self.organizer.total_files.connect(lambda v: self.update_value("total", v))
         self.organizer.moved_files.connect(lambda v: self.update_value("moved", v))
         self.organizer.skipped_files.connect(lambda v: self.update_value("skipped", v))
+        self.organizer.budget_usage.connect(self._show_budget_usage)
+        self.organizer.estimate.connect(self._show_estimate)
+        self._progress_notes = {}
 
-        self.ui.start_button.setEnabled(False)
+        self._set_running(True)
+        if isinstance(self.organizer, RemoteJob):
+            # Already running in the daemon; the job handle stands in for the thread.
+            self.worker_thread = self.organizer
+            self.worker_thread.finished.connect(lambda: self._organizing_done(base_dir))
+            return
         self.worker_thread = WorkerThread(self.organizer)
         self.worker_thread.finished.connect(lambda: self._organizing_done(base_dir))
         self.worker_thread.start()
 
     def _organizing_done(self, base_dir):
-        if self.ui.rem_empty_checkbox.isChecked():
-            remove_empty_folders(base_dir, self.log_signal)
-        self.ui.start_button.setEnabled(True)
+        self._set_running(False)
+        if (self.ui.rem_empty_checkbox.isChecked() and not self.organizer.is_cancelled()
+                and type(self.organizer) is PhotoOrganizer):
+            self.tasks.submit("pruning empty folders", base_dir,
+                              lambda p, ctx: flatten.prune_empty_folders(p, ctx.log, ctx.progress, ctx.control))
+        self.ui.progress_bar.setFormat("%p%")
+
+    def _show_budget_usage(self, usage):
+        self._progress_notes["budget"] = ResourceGovernor.format_usage(usage)
+        self._show_progress_notes()
+
+    def _show_estimate(self, summary):
+        self._progress_notes["estimate"] = RunProgress.format_summary(summary)
+        self._show_progress_notes()
+
+    def _show_progress_notes(self):
+        notes = [self._progress_notes.get(k) for k in ("estimate", "budget")]
+        self.ui.progress_bar.setFormat("  ·  ".join(["%p%"] + [n for n in notes if n]))
+
+    def _set_running(self, running):
+        self.ui.start_button.setEnabled(not running)
+        self.ui.ingest_button.setEnabled(not running)
+        self.ui.pause_button.setEnabled(running)
+        self.ui.cancel_button.setEnabled(running)
+        self.ui.pause_button.setText(" Pause")
+
+    def toggle_pause(self):
+        if self.organizer.is_paused():
+            self.organizer.resume()
+            self.ui.pause_button.setText(" Pause")
+        else:
+            self.organizer.pause()
+            self.ui.pause_button.setText(" Resume")
+
+    def cancel_organizing(self):
+        self.ui.pause_button.setEnabled(False)
+        self.ui.cancel_button.setEnabled(False)
+        if self.tasks.has_active():
+            self.tasks.cancel()
+            self.log_signal.emit("Cancelling background tasks...")
+        if self.organizer and self.worker_thread.isRunning():
+            self.organizer.cancel()
+            self.log_signal.emit("Cancelling, progress saved for the next run...")
+
+    def _show_task_progress(self, task_id, done, total, rate):
+        if total:
+            self.ui.progress_bar.setValue(int(done * 100 / total))
+            self.ui.progress_bar.setFormat(f"%p%  ·  {done}/{total}  ·  {rate:.0f} items/s")
+        else:
+            self.ui.progress_bar.setFormat(f"{done} items  ·  {rate:.0f} items/s")
+
+    def _task_finished(self, task_id, msg, ok):
+        if not self.tasks.has_active():
+            self.ui.progress_bar.setFormat("%p%")
+            organizing = self.organizer is not None and self.worker_thread.isRunning()
+            self.ui.cancel_button.setEnabled(organizing)
+
+    def closeEvent(self, event):
+        self.tasks.shutdown()
+        if self.browser:
+            self.browser.close()
+        if isinstance(self.organizer, RemoteJob):
+            self.organizer.client.close()
+        super().closeEvent(event)
 
     def reset_settings(self):
         if QMessageBox.question(self, "Confirm Reset", "Delete all settings files?") == QMessageBox.Yes:
@@ -120,6 +321,7 @@ class PhotoOrganizerGUI(QWidget):
             if os.path.exists(path):
                 try: os.remove(path)
                 except: pass
+            self.config = {}
             self.ui.excluded_list.clear()
             self.ui.progress_bar.setValue(0)
             self.ui.log_list.clear()
@@ -128,21 +330,54 @@ class PhotoOrganizerGUI(QWidget):
             self.log_signal.emit("Settings reset.")
 
     def clean_filenames_clicked(self):
-        self._run_flatten_op("cleaning filenames", lambda p: flatten.clean_img_filenames(p, recursive=True, log_fn=self.log_signal.emit))
+        self._run_flatten_op("cleaning filenames", lambda p, ctx: flatten.clean_img_filenames(
+            p, recursive=True, log_fn=ctx.log, progress_fn=ctx.progress, control=ctx.control))
 
     def flatten_button_clicked(self):
-        self._run_flatten_op("flattening folders", lambda p: flatten.flatten_folder_tree(root_dir=p, target_dir=p))
+        self._run_flatten_op("flattening folders", lambda p, ctx: flatten.flatten_folder_tree(
+            root_dir=p, target_dir=p, progress_fn=ctx.progress, control=ctx.control))
+
+    def find_similar_clicked(self):
+        threshold = self.config.get("similar_threshold", similar.DEFAULT_THRESHOLD)
+        quarantine_dir = self.config.get("similar_quarantine_dir")
+        excluded = self.get_excluded_folders() + ([quarantine_dir] if quarantine_dir else [])
+
+        def run(root, ctx):
+            groups = similar.find_similar(root, excluded, threshold, self.catalog, ctx.control, ctx.progress, ctx.log,
+                                          rules=ScanRules.from_config(self.config))
+            for group in groups:
+                ctx.log(f"Similar: {group[0]}\n" + "\n".join(f"    ~ {p}" for p in group[1:]))
+            if quarantine_dir and groups:
+                moved = similar.quarantine(groups, root, quarantine_dir, self.catalog, ctx.control, ctx.log)
+                ctx.log(f"Moved {moved} similar copies to {quarantine_dir}")
+
+        self._run_flatten_op("finding similar photos", run)
+
+    def browse_library_clicked(self):
+        path = self.ui.base_dir_edit.text().strip()
+        if not path or not os.path.isdir(path):
+            self.log_signal.emit("Invalid base directory for browsing.")
+            return
+        structure = self.FOLDER_STRUCT_MAP.get(self.ui.format_comboBox.currentIndex(), "day")
+        if self.browser and self.browser.isVisible() and self.browser.base_dir == path:
+            self.browser.raise_()
+            self.browser.activateWindow()
+            return
+        if self.browser:
+            self.browser.close()
+        self.browser = LibraryBrowser(path, structure, ThumbnailCache.from_config(self.config),
+                                      workers=self.config.get("thumbnail_workers", DEFAULT_WORKERS))
+        self.browser.show()
 
     def _run_flatten_op(self, action, func):
         path = self.ui.base_dir_edit.text().strip()
         if not path or not os.path.isdir(path):
             self.log_signal.emit(f"Invalid base directory for {action}.")
             return
-        try:
-            func(path)
-            self.log_signal.emit(f"Completed {action} under: {path}")
-        except Exception as e:
-            self.log_signal.emit(f"Error during {action}: {e}")
+        if self.organizer and self.worker_thread.isRunning() and TaskManager.overlaps(self.organizer.base_dir, path):
+            self.log_signal.emit(f"Cannot start {action} while organizing {self.organizer.base_dir}.")
+            return
+        self.tasks.submit(action, path, func)
 
     def load_config(self):
         cfg = self.config
@@ -150,56 +385,17 @@ class PhotoOrganizerGUI(QWidget):
         idx = {v: k for k, v in self.FOLDER_STRUCT_MAP.items()}.get(cfg.get("folder_structure", "day"), 0)
         self.ui.format_comboBox.setCurrentIndex(idx)
         self.ui.sep_videos_checkbox.setChecked(cfg.get("separate_videos", False))
+        self.ui.link_view_checkbox.setChecked(cfg.get("link_view", False))
         self.ui.excluded_list.clear()
         for folder in cfg.get("excluded_folders", []):
             self.ui.excluded_list.addItem(folder)
 
     def save_config(self):
-        ConfigManager.save({
+        self.config.update({
             "base_dir": self.ui.base_dir_edit.text(),
             "folder_structure": self.FOLDER_STRUCT_MAP.get(self.ui.format_comboBox.currentIndex(), "day"),
             "separate_videos": self.ui.sep_videos_checkbox.isChecked(),
+            "link_view": self.ui.link_view_checkbox.isChecked(),
             "excluded_folders": self.get_excluded_folders()
         })
-
-def remove_empty_folders(root_path: str, log_signal):
-    def is_hidden_or_system(p: Path) -> bool:
-        try:
-            attrs = ctypes.windll.kernel32.GetFileAttributesW(str(p))
-            if attrs == -1:
-                return False
-            return bool(attrs & (stat.FILE_ATTRIBUTE_HIDDEN | stat.FILE_ATTRIBUTE_SYSTEM))
-        except Exception:
-            return False
-
-    root = Path(root_path)
-
-    # Walk bottom-up to remove children before parents
-    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
-        current_dir = Path(dirpath)
-
-        # Skip if current path is symlink (avoid removing real data accidentally)
-        if current_dir.is_symlink():
-            continue
-
-        # Filter visible files (non-hidden/non-system)
-        visible_files = [
-            f for f in filenames
-            if not is_hidden_or_system(current_dir / f) and not f.startswith(".")
-        ]
-
-        # Filter visible directories (non-hidden/non-system)
-        visible_dirs = [
-            d for d in dirnames
-            if not is_hidden_or_system(current_dir / d) and not (current_dir / d).name.startswith(".")
-        ]
-
-        # Remove directory if empty (no visible files or directories)
-        if not visible_files and not visible_dirs:
-            try:
-                current_dir.rmdir()
-                log_signal.emit(f"Removed empty folder: {current_dir}")
-            except PermissionError as e:
-                log_signal.emit(f"Permission denied removing folder {current_dir}: {e}")
-            except Exception as e:
-                log_signal.emit(f"Could not remove folder {current_dir}: {e}")
\ No newline at end of file
+        ConfigManager.save(self.config)
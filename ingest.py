@@ -0,0 +1,216 @@
+import io
+import os
+import time
+import queue
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from organizer import PhotoOrganizer
+from metadata import FileGatherer, MetadataExtractor
+from file_ops import FileUtils, FileReader, FileMover
+from config import file_exts
+
+# Enough for the EXIF block of JPEGs and the TIFF header/IFD0 of common RAW formats.
+HEADER_BYTES = 512 * 1024
+CHUNK_BYTES = 1 << 20
+# Chunks buffered per file between the card reader and its writer.
+QUEUE_CHUNKS = 16
+QUICK_HASH_BYTES = 4096
+
+_CANCELLED = object()
+
+
+class CardIngester(PhotoOrganizer):
+    """Copies a card or other source volume straight into dated folders of a library.
+
+    Each source file is read once, sequentially: the header is parsed in memory for
+    the capture date while the bytes are streamed to a writer thread that hashes and
+    writes the final file. Files already in the library (same size and content) are
+    detected before anything is written and skipped.
+    """
+
+    def __init__(self, source_dir: str, library_root: str, folder_structure: str, verify: bool = True, **kwargs):
+        super().__init__(source_dir, folder_structure, target_root=library_root, **kwargs)
+        self.verify = verify
+        self._seen: dict[tuple[int, str], str] = {}
+        self._reserved: set[str] = set()
+        self._done = 0
+        self._total = 0
+
+    def _organize(self) -> None:
+        self._log(f"Ingesting {self.base_dir} into {self.target_root}...")
+        paths = list(FileGatherer.scan_files(self.base_dir, file_exts, self.excluded_folders, self.control,
+                                             rules=self.scan_rules))
+        paths = self.scheduler.order_reads(paths)
+        self._total = len(paths)
+        self.total_files.emit(self._total)
+        self._emit_progress(0)
+
+        writers = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest-writer")
+        try:
+            for path in paths:
+                if not self.control.checkpoint():
+                    break
+                try:
+                    self._ingest_one(path, writers)
+                except Exception as e:
+                    self._log(f"Error reading {path}: {e}")
+                    self.skipped_files.emit(1)
+                    self._file_done()
+        finally:
+            writers.shutdown(wait=True)
+            if self.catalog:
+                self.catalog.flush()
+
+        if self.is_cancelled():
+            self._emit_progress(0)
+            self._log("Ingest cancelled.")
+        else:
+            self._emit_progress(100)
+            self._log("Ingest complete.")
+
+    def _file_done(self) -> None:
+        with self.lock:
+            self._done += 1
+            done = self._done
+        if self._total:
+            self._emit_progress(int(done * 100 / self._total))
+
+    def _ingest_one(self, path: str, writers: ThreadPoolExecutor) -> None:
+        filename = os.path.basename(path)
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_BYTES)
+            if self.governor:
+                self.governor.throttle.charge_read(len(header))
+            quick = hashlib.md5(header[:QUICK_HASH_BYTES] + size.to_bytes(8, 'little')).hexdigest()
+
+            duplicate = self._find_duplicate(path, size, quick, header, f)
+            if duplicate:
+                self._log(f"Skipped {filename}, already in library as {duplicate}")
+                self.skipped_files.emit(1)
+                self._file_done()
+                return
+            self._seen.setdefault((size, quick), path)
+
+            dt, info = MetadataExtractor.get_metadata(path, io.BytesIO(header))
+            iso_dt = dt.isoformat() if dt else None
+            self._file_info[path] = info
+            target_dir = self._determine_target_directory(path, iso_dt)
+
+            chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+            writers.submit(self._write_stream, path, target_dir, chunks, iso_dt, info)
+            chunks.put(header)
+            try:
+                f.seek(len(header))
+                while True:
+                    if not self.control.checkpoint():
+                        chunks.put(_CANCELLED)
+                        return
+                    chunk = f.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    if self.governor:
+                        self.governor.throttle.charge_read(len(chunk))
+                    chunks.put(chunk)
+            except Exception as e:
+                # The writer owns progress accounting once submitted; just tell it to discard.
+                self._log(f"Error reading {path}: {e}")
+                self.skipped_files.emit(1)
+                chunks.put(_CANCELLED)
+                return
+            chunks.put(None)
+
+    def _find_duplicate(self, path: str, size: int, quick: str, header: bytes, f) -> str | None:
+        candidates = []
+        earlier = self._seen.get((size, quick))
+        if earlier:
+            candidates.append(earlier)
+        if self.catalog:
+            candidates.extend(self.catalog.paths_with_size(size))
+
+        for candidate in candidates:
+            if candidate == path or FileUtils.quick_file_hash(candidate, QUICK_HASH_BYTES) != quick:
+                continue
+            try:
+                if self._stream_equal(candidate, size, header, f):
+                    return candidate
+            finally:
+                f.seek(len(header))
+        return None
+
+    @staticmethod
+    def _stream_equal(candidate: str, size: int, header: bytes, f) -> bool:
+        with FileReader.open(candidate) as c:
+            if c.read(len(header)) != header:
+                return False
+            return FileReader.same_content(f, c, size, start=len(header))
+
+    def _reserve_destination(self, target_dir: str, filename: str) -> str:
+        base, ext = os.path.splitext(os.path.join(target_dir, filename))
+        dest, i = base + ext, 1
+        with self.lock:
+            while dest in self._reserved or os.path.exists(dest):
+                dest = f"{base}_{i}{ext}"
+                i += 1
+            self._reserved.add(dest)
+        return dest
+
+    def _write_stream(self, src: str, target_dir: str, chunks: queue.Queue, iso_dt: str | None, info: dict) -> None:
+        filename = os.path.basename(src)
+        dest = part = None
+        hasher = hashlib.md5()
+        ok = False
+        stream_ended = False
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+            dest = self._reserve_destination(target_dir, filename)
+            part = dest + ".part"
+            with open(part, 'wb') as out:
+                while True:
+                    chunk = chunks.get()
+                    if chunk is None or chunk is _CANCELLED:
+                        stream_ended = True
+                    if chunk is None:
+                        break
+                    if chunk is _CANCELLED:
+                        return
+                    hasher.update(chunk)
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            digest = hasher.hexdigest()
+            if self.verify and FileUtils.full_file_hash(part) != digest:
+                self._log(f"Verification failed for {filename}, discarded copy")
+                self.skipped_files.emit(1)
+                return
+            # Another process may have taken the reserved name meanwhile; never replace its file.
+            final = FileMover.move_noclobber(part, dest)
+            if final is None:
+                self._log(f"Skipped {filename}, an identical file appeared in {target_dir}")
+                self.skipped_files.emit(1)
+                return
+            ok = True
+            shutil.copystat(src, final)
+            if self.catalog:
+                self.catalog.record(final, iso_dt, info.get("camera"), source_path=src,
+                                    hash_value=digest, hash_tier="full", verified_at=time.time())
+            self._log(f"Copied {filename} → {target_dir}")
+            self.moved_files.emit(1)
+        except Exception as e:
+            self._log(f"Error writing {filename}: {e}")
+            self.skipped_files.emit(1)
+        finally:
+            if not ok:
+                # Drain so the reader never blocks on a writer that gave up.
+                while not stream_ended:
+                    stream_ended = chunks.get() in (None, _CANCELLED)
+                if part:
+                    try:
+                        os.remove(part)
+                    except OSError:
+                        pass
+            with self.lock:
+                self._reserved.discard(dest)
+            self._file_done()
@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from organizer import PhotoOrganizer
+from metadata import FileGatherer
+from file_ops import FileUtils
+from config import file_exts
+
+FICLONE = 0x40049409
+LINK_MODES = ("auto", "hardlink", "reflink", "symlink")
+MANIFEST_NAME = ".photo_view.db"
+
+_FALLBACKS = {
+    "auto": ("hardlink", "reflink", "symlink"),
+    "hardlink": ("hardlink", "symlink"),
+    "reflink": ("reflink", "symlink"),
+    "symlink": ("symlink",),
+}
+
+
+def reflink(src: str, dest: str) -> None:
+    """Copy-on-write clone (btrfs/XFS FICLONE); raises OSError where unsupported."""
+    if fcntl is None:
+        raise OSError("reflink not supported on this platform")
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(dest_fd, FICLONE, src_fd)
+        except OSError:
+            os.close(dest_fd)
+            os.unlink(dest)
+            raise
+        os.close(dest_fd)
+    finally:
+        os.close(src_fd)
+
+
+def make_link(src: str, dest: str, mode: str = "auto") -> str:
+    """Create dest as a link to src using the first method that works; returns the method used."""
+    last_error = None
+    for method in _FALLBACKS.get(mode, _FALLBACKS["auto"]):
+        try:
+            if method == "hardlink":
+                os.link(src, dest)
+            elif method == "reflink":
+                reflink(src, dest)
+            else:
+                os.symlink(os.path.abspath(src), dest)
+            return method
+        except FileExistsError:
+            raise
+        except (OSError, NotImplementedError) as e:
+            last_error = e
+    raise last_error or OSError(f"Could not link {src}")
+
+
+class ViewManifest:
+    """Records which link in the view belongs to which source file, for incremental refreshes."""
+
+    def __init__(self, view_dir: str):
+        os.makedirs(view_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(view_dir, MANIFEST_NAME), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS links (src TEXT PRIMARY KEY, link TEXT, size INTEGER, mtime_ns INTEGER, iso TEXT)")
+        self._lock = threading.Lock()
+        self._pending: list[tuple] = []
+
+    def load(self) -> dict[str, tuple]:
+        return {row[0]: row[1:] for row in self._conn.execute("SELECT src, link, size, mtime_ns, iso FROM links")}
+
+    def put(self, src: str, link: str | None, size: int, mtime_ns: int, iso: str | None) -> None:
+        with self._lock:
+            self._pending.append((src, link, size, mtime_ns, iso))
+            if len(self._pending) >= 1000:
+                self._flush_locked()
+
+    def delete(self, sources: list[str]) -> None:
+        with self._lock:
+            self._flush_locked()
+            with self._conn:
+                self._conn.executemany("DELETE FROM links WHERE src = ?", [(s,) for s in sources])
+
+    def _flush_locked(self) -> None:
+        if self._pending:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+
+class LinkViewOrganizer(PhotoOrganizer):
+    """Builds a date-organized view of base_dir out of links, leaving the originals in place.
+
+    Uses the same folder structures and collision resolution as a normal organize run.
+    A manifest in the view remembers each source's size/mtime and link, so a refresh
+    only extracts metadata for new or changed files and drops links to deleted ones.
+    """
+
+    def __init__(self, base_dir: str, view_dir: str, folder_structure: str, link_mode: str = "auto", **kwargs):
+        view_dir = os.path.abspath(view_dir)
+        excluded = list(kwargs.pop("excluded_folders", None) or []) + [view_dir]
+        super().__init__(base_dir, folder_structure, excluded_folders=excluded, target_root=view_dir, **kwargs)
+        self.link_mode = link_mode
+        self.manifest = ViewManifest(view_dir)
+        self._entries: dict[str, tuple] = {}
+        self._stats: dict[str, tuple[int, int]] = {}
+
+    def _gather_files(self) -> tuple[list, int]:
+        self._log(f"Refreshing link view {self.target_root} from {self.base_dir}...")
+        self._entries = self.manifest.load()
+
+        seen, changed = set(), []
+        for path in FileGatherer.scan_files(self.base_dir, file_exts, self.excluded_folders, self.control,
+                                             rules=self.scan_rules):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            self._stats[path] = (st.st_size, st.st_mtime_ns)
+            old = self._entries.get(path)
+            if old and old[1] == st.st_size and old[2] == st.st_mtime_ns:
+                continue
+            changed.append(path)
+        if self.is_cancelled():
+            return [], 0
+
+        stale = [src for src in self._entries if src not in seen]
+        for src in stale:
+            self._remove_link(self._entries[src][0])
+        if stale:
+            self.manifest.delete(stale)
+            self._log(f"Removed {len(stale)} stale links.")
+
+        files = []
+        for path, iso_dt, info in FileGatherer.extract_paths(changed, self.control, self.scheduler, self.governor,
+                                                             places=self.place_index):
+            if self.uses_location:
+                self._file_info[path] = info
+            files.append((path, iso_dt))
+        self.total_files.emit(len(files))
+        self._log(f"{len(seen) - len(changed)} links up to date, {len(files)} to create or update.")
+        return files, len(files)
+
+    def _remove_link(self, link: str | None) -> None:
+        if link and os.path.lexists(link):
+            try:
+                os.unlink(link)
+            except OSError as e:
+                self._log(f"Could not remove stale link {link}: {e}")
+
+    def _move_file(self, path: str, date_taken_iso: str | None, existing_files: set) -> bool:
+        if not self.control.checkpoint():
+            return False
+        target_dir = self._determine_target_directory(path, date_taken_iso)
+        filename = os.path.basename(path)
+        size, mtime_ns = self._stats.get(path, (None, None))
+        old = self._entries.get(path)
+        if old:
+            self._remove_link(old[0])
+
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+            with self.lock:
+                dest = FileUtils.resolve_filename_conflict(os.path.join(target_dir, filename), path)
+                if dest is None:
+                    self._log(f"Skipped {filename}, identical file already in view")
+                    self.manifest.put(path, None, size, mtime_ns, date_taken_iso)
+                    self.skipped_files.emit(1)
+                    return False
+                method = make_link(path, dest, self.link_mode)
+            self.manifest.put(path, dest, size, mtime_ns, date_taken_iso)
+            self._log(f"Linked {filename} → {target_dir} ({method})")
+            self.moved_files.emit(1)
+            return True
+        except Exception as e:
+            self._log(f"Error linking {filename}: {e}")
+            self.skipped_files.emit(1)
+            return False
+
+    def _organize(self) -> None:
+        try:
+            super()._organize()
+        finally:
+            self.manifest.close()
@@ -1,10 +1,16 @@
 from PySide6.QtWidgets import QApplication
 from gui import PhotoOrganizerGUI
+from daemon import InstanceLock
+from config import GUI_LOCK_PATH
 
 
 if __name__ == "__main__":
     import sys
     app = QApplication(sys.argv)
+    instance = InstanceLock(GUI_LOCK_PATH)
+    if not instance.acquire():
+        print(f"Photo Organizer is already running (PID {instance.owner_pid()})")
+        sys.exit(0)
     window = PhotoOrganizerGUI()
     window.show()
     print(app.style().objectName())
@@ -1,87 +1,451 @@
+import io
 import os
+import queue
+import threading
+from typing import TYPE_CHECKING
+from contextlib import nullcontext
 from multiprocessing import cpu_count
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from PIL import Image, UnidentifiedImageError
 import exifread
 
 from file_ops import FileUtils
-from config import PHOTO_EXTS, RAW_EXTS
+from config import PHOTO_EXTS, RAW_EXTS, VIDEO_EXTS, SIDECAR_EXTS
 from utils import SystemUtils
+from control import RunControl
+from scheduler import LocalityScheduler
+from governor import ResourceGovernor
+from snapshot import DirectorySnapshot
+from extractors import ExtractorRegistry, SNIFF_BYTES
+from geocode import PlaceIndex
+from rules import ScanRules
+from backends import ExtractBackend
+
+if TYPE_CHECKING:
+    # netio imports this module, so the engine is only named in annotations.
+    from netio import AsyncIOEngine
 
 PHOTO_EXTS = set(PHOTO_EXTS)
 RAW_EXTS = set(RAW_EXTS)
+VIDEO_EXTS = set(VIDEO_EXTS)
+SIDECAR_EXTS = set(SIDECAR_EXTS)
+
+# Upper bound on paths per worker task; keeps cancellation and checkpoint granularity fine.
+EXTRACT_CHUNK_MAX = 64
+# Scanned paths between reports to a gather's found_fn.
+FOUND_REPORT_EVERY = 256
+# dHash compares (PHASH_SIZE + 1) x PHASH_SIZE neighbouring pixels for a 64-bit hash.
+PHASH_SIZE = 8
+
+
+class StemIndex:
+    """Groups files of one directory that share a stem (IMG_1234.CR2, IMG_1234.JPG, IMG_1234.xmp).
+
+    The member whose header is cheapest to read leads the group: JPEG first, then
+    other photo formats, RAW, and video. Sidecars are attached to the member they
+    describe (an .xmp to the RAW, an .aae to the photo, a .thm to the video), and
+    groups made only of sidecars are dropped.
+    """
+
+    # Which kinds of file each sidecar most likely belongs to, in order of preference.
+    SIDECAR_ANCHORS = {".xmp": ("raw", "photo", "video"), ".aae": ("photo", "raw", "video"),
+                       ".thm": ("video", "photo", "raw")}
+    RANK = {"jpeg": 0, "photo": 1, "raw": 2, "video": 3}
+
+    def __init__(self):
+        self._groups: dict[tuple[str, str], list[str]] = {}
+
+    @staticmethod
+    def kind(ext: str) -> str:
+        if ext in (".jpg", ".jpeg"):
+            return "jpeg"
+        if ext in PHOTO_EXTS:
+            return "photo"
+        if ext in RAW_EXTS:
+            return "raw"
+        if ext in VIDEO_EXTS:
+            return "video"
+        return "sidecar" if ext in SIDECAR_EXTS else "other"
+
+    def add(self, path: str) -> None:
+        directory, name = os.path.split(path)
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in SIDECAR_EXTS:
+            # darktable-style IMG_1234.CR2.xmp belongs to IMG_1234 as well.
+            inner, inner_ext = os.path.splitext(stem)
+            if inner and inner_ext.lower() not in SIDECAR_EXTS and StemIndex.kind(inner_ext.lower()) != "other":
+                stem = inner
+        self._groups.setdefault((directory, stem.lower()), []).append(path)
+
+    def __len__(self) -> int:
+        return sum(len(g) for g in self._groups.values())
+
+    def groups(self):
+        """Yield (media members, leader first; [(sidecar, member it follows)]) per group."""
+        for paths in self._groups.values():
+            media, sidecars = [], []
+            for p in paths:
+                (sidecars if os.path.splitext(p)[1].lower() in SIDECAR_EXTS else media).append(p)
+            if not media:
+                continue
+            media.sort(key=lambda p: (self.RANK.get(self.kind(os.path.splitext(p)[1].lower()), 4), p))
+            yield media, [(s, self._anchor(s, media)) for s in sidecars]
+
+    def _anchor(self, sidecar: str, media: list[str]) -> str:
+        stem, ext = os.path.splitext(sidecar)
+        for p in media:
+            if os.path.normcase(p) == os.path.normcase(stem):
+                return p
+        kinds = [self.kind(os.path.splitext(p)[1].lower()) for p in media]
+        kinds = ["photo" if k == "jpeg" else k for k in kinds]
+        for wanted in self.SIDECAR_ANCHORS.get(ext.lower(), ()):
+            if wanted in kinds:
+                return media[kinds.index(wanted)]
+        return media[0]
+
+
+class WarmExtractPool:
+    """Extraction worker processes kept alive between runs by a long-lived process (the daemon).
+
+    Worker initializers bind the pause/cancel events once, so the pool owns its own
+    RunControl and each run's token is mirrored onto it while the run polls its
+    futures. The pool is rebuilt only when the worker settings (throttle, phash,
+    places) change; its size is fixed and runs limit concurrency by how many chunks
+    they keep in flight.
+    """
+
+    _current: "WarmExtractPool | None" = None
+    enabled = False
+
+    def __init__(self, key: tuple, throttle, phash: bool, places):
+        self.key = key
+        self.max_procs = min(cpu_count(), 4)
+        self.control = RunControl()
+        self.executor = ProcessPoolExecutor(max_workers=self.max_procs, initializer=_init_extract_worker,
+                                            initargs=(*self.control.events(), throttle, phash, places))
+
+    @classmethod
+    def enable(cls) -> None:
+        cls.enabled = True
+
+    @classmethod
+    def acquire(cls, throttle, phash: bool, places) -> "WarmExtractPool":
+        key = (id(throttle) if throttle else None, phash, places)
+        if cls._current is None or cls._current.key != key:
+            cls.shutdown()
+            cls._current = cls(key, throttle, phash, places)
+        return cls._current
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls._current is not None:
+            cls._current.control.cancel()
+            cls._current.executor.shutdown(wait=True, cancel_futures=True)
+            cls._current = None
+
+    def mirror(self, control: RunControl) -> None:
+        if control.is_cancelled():
+            self.control.cancel()
+        elif control.is_paused():
+            self.control.pause()
+        else:
+            self.control.resume()
+
+    def release(self, in_flight) -> None:
+        """Drop a run's unfinished chunks and leave the workers idle for the next run."""
+        self.control.cancel()
+        for future in in_flight:
+            future.cancel()
+        wait(in_flight)
+        self.control.reset()
 
 
 class FileGatherer:
     @staticmethod
-    def scan_files(base: str, exts: tuple[str, ...], excluded_folders: list[str] | None = None):
-        excluded_abs = set(os.path.abspath(x) for x in (excluded_folders or []))
+    def scan_files(base: str, exts: tuple[str, ...], excluded_folders: list[str] | None = None,
+                   control: RunControl | None = None, snapshot: DirectorySnapshot | None = None,
+                   rules: ScanRules | None = None, engine: "AsyncIOEngine | None" = None):
+        """Paths under base with one of exts; excluded folders and rules are applied inside the walk.
+
+        With an async I/O engine the tree is listed concurrently (and the snapshot is not used).
+        """
+        rules = (rules or ScanRules()).with_excluded(excluded_folders)
+        if rules.skip_dir(base, ""):
+            return
         join = os.path.join
-        abspath = os.path.abspath
 
-        for root, _, files in FileUtils.fast_walk(base):
-            absroot = abspath(root)
-            if any(absroot.startswith(e + os.sep) for e in excluded_abs):
-                continue
+        if engine:
+            walker = engine.walk(base, rules, control)
+        elif snapshot:
+            walker = snapshot.walk(base, rules=rules)
+        else:
+            walker = FileUtils.fast_walk(base, rules=rules)
+        for root, _, files in walker:
+            if control and not control.checkpoint():
+                return
             for f in files:
                 ext = os.path.splitext(f)[1].lower()
                 if ext in exts:
                     yield join(root, f)
 
     @staticmethod
-    def gather_files_with_metadata(base_path: str, extensions: tuple[str, ...], excluded_folders: list[str] | None = None):
-        pending = list(FileGatherer.scan_files(base_path, extensions, excluded_folders))
+    def scan_roots(roots: list[str], exts: tuple[str, ...], excluded_folders: list[str] | None = None,
+                   control: RunControl | None = None, snapshots: dict[str, DirectorySnapshot] | None = None,
+                   rules: ScanRules | None = None, engine: "AsyncIOEngine | None" = None,
+                   scheduler: LocalityScheduler | None = None):
+        """scan_files over several roots at once, yielding paths from all of them as they are found.
+
+        Each root is walked in its own thread; with a scheduler, roots on the same
+        device share its concurrency cap, so two roots on one disk are not walked
+        against each other. The async I/O engine already lists concurrently, so its
+        roots are walked one after another.
+        """
+        snapshots = snapshots or {}
+        if len(roots) == 1 or engine:
+            for root in roots:
+                yield from FileGatherer.scan_files(root, exts, excluded_folders, control, snapshots.get(root),
+                                                   rules, engine)
+            return
+
+        found = queue.SimpleQueue()
+        done = object()
+
+        def walk(root):
+            try:
+                dev = scheduler.device_of(os.path.join(root, "")) if scheduler else -1
+                with scheduler.device_slot(dev, root) if scheduler else nullcontext():
+                    for path in FileGatherer.scan_files(root, exts, excluded_folders, control, snapshots.get(root),
+                                                        rules):
+                        found.put(path)
+            finally:
+                found.put(done)
+
+        for root in roots:
+            threading.Thread(target=walk, args=(root,), name="scan-root", daemon=True).start()
+        remaining = len(roots)
+        while remaining:
+            item = found.get()
+            if item is done:
+                remaining -= 1
+            else:
+                yield item
+
+    @staticmethod
+    def _scan(base_path, exts, excluded_folders, control, snapshot, rules, engine, scheduler):
+        if isinstance(base_path, str):
+            return FileGatherer.scan_files(base_path, exts, excluded_folders, control, snapshot, rules, engine)
+        return FileGatherer.scan_roots(base_path, exts, excluded_folders, control, snapshot, rules, engine, scheduler)
+
+    @staticmethod
+    def _counted(paths, found_fn):
+        """Pass paths through, reporting found_fn(count, finished) every FOUND_REPORT_EVERY paths and at the end."""
+        if not found_fn:
+            yield from paths
+            return
+        count = 0
+        for path in paths:
+            count += 1
+            if count % FOUND_REPORT_EVERY == 0:
+                found_fn(count, False)
+            yield path
+        found_fn(count, True)
+
+    @staticmethod
+    def gather_files_with_metadata(base_path: str | list[str], extensions: tuple[str, ...], excluded_folders: list[str] | None = None,
+                                   control: RunControl | None = None, known: dict[str, str | None] | None = None,
+                                   scheduler: LocalityScheduler | None = None, governor: ResourceGovernor | None = None,
+                                   snapshot: DirectorySnapshot | None = None, places: PlaceIndex | None = None,
+                                   rules: ScanRules | None = None, group_stems: bool = False,
+                                   engine: "AsyncIOEngine | None" = None, found_fn=None):
+        """Yield (path, iso, info) for every file under base_path, extracting only unknown ones.
+
+        With group_stems, files sharing a stem in one directory are read once: only
+        the group leader is yielded and its info lists the rest under "members" as
+        (path, follows) pairs, where follows is the file whose folder a sidecar
+        should share (a media member follows itself).
+
+        base_path may be a list of roots, scanned concurrently with scan_roots() and
+        extracted in one pool; snapshot is then a {root: DirectorySnapshot} dict.
+        found_fn(count, finished) follows the scan as it finds files, ahead of extraction.
+        """
+        control = control or RunControl()
+        known = known or {}
+        if group_stems:
+            yield from FileGatherer._gather_groups(base_path, extensions, excluded_folders, control, known,
+                                                   scheduler, governor, snapshot, places, rules, engine, found_fn)
+            return
+        pending = []
+        for path in FileGatherer._counted(FileGatherer._scan(base_path, extensions, excluded_folders, control,
+                                                             snapshot, rules, engine, scheduler), found_fn):
+            if path in known:
+                yield path, known[path], {}
+            else:
+                pending.append(path)
+        if not pending or control.is_cancelled():
+            return
+        yield from FileGatherer.extract_paths(pending, control, scheduler, governor, places=places, engine=engine)
+
+    @staticmethod
+    def _gather_groups(base_path, extensions, excluded_folders, control, known, scheduler, governor, snapshot,
+                       places, rules, engine=None, found_fn=None):
+        paths = list(FileGatherer._counted(FileGatherer._scan(base_path, tuple(extensions) + tuple(SIDECAR_EXTS),
+                                                              excluded_folders, control, snapshot, rules, engine,
+                                                              scheduler), found_fn))
+        if control.is_cancelled():
+            return
+        yield from FileGatherer.extract_groups(paths, control, known, scheduler, governor, places, engine)
+
+    @staticmethod
+    def extract_groups(paths: list[str], control: RunControl | None = None, known: dict[str, str | None] | None = None,
+                       scheduler: LocalityScheduler | None = None, governor: ResourceGovernor | None = None,
+                       places: PlaceIndex | None = None, engine: "AsyncIOEngine | None" = None):
+        """Group paths (media and sidecars) by stem and yield (leader, iso, info) with info["members"]."""
+        control = control or RunControl()
+        known = known or {}
+        index = StemIndex()
+        for path in paths:
+            index.add(path)
+
+        members, pending = {}, []
+        for media, sidecars in index.groups():
+            leader = media[0]
+            members[leader] = [(p, p) for p in media[1:]] + sidecars
+            if leader in known:
+                yield leader, known[leader], {"members": members.pop(leader)}
+            else:
+                pending.append(leader)
+        if not pending or control.is_cancelled():
+            return
+
+        # Groups whose leader had no embedded date get one more try with their next readable member.
+        retry = {}
+        for path, iso_dt, info in FileGatherer.extract_paths(pending, control, scheduler, governor, places=places,
+                                                             engine=engine):
+            info["members"] = members.pop(path, [])
+            fallback = next((p for p, _ in info["members"] if StemIndex.kind(os.path.splitext(p)[1].lower())
+                             in ("photo", "raw")), None) if info.get("date_from_mtime") else None
+            if fallback:
+                retry[fallback] = (path, iso_dt, info)
+            else:
+                yield path, iso_dt, info
+        for path, iso_dt, info in FileGatherer.extract_paths(list(retry), control, scheduler, governor, places=places,
+                                                             engine=engine):
+            leader, leader_iso, leader_info = retry.pop(path)
+            if not info.get("date_from_mtime"):
+                leader_iso = iso_dt
+                leader_info.pop("date_from_mtime", None)
+                leader_info.update((k, v) for k, v in info.items() if k not in leader_info)
+            yield leader, leader_iso, leader_info
+        for leader, leader_iso, leader_info in retry.values():
+            yield leader, leader_iso, leader_info
+
+    @staticmethod
+    def extract_paths(pending: list[str], control: RunControl | None = None,
+                      scheduler: LocalityScheduler | None = None, governor: ResourceGovernor | None = None,
+                      phash: bool = False, places: PlaceIndex | None = None, engine: "AsyncIOEngine | None" = None,
+                      backend: str | None = None):
+        """Extract metadata for an explicit list of paths in the worker pool, yielding (path, iso, info).
+
+        With phash, info also carries the file's perceptual hash under "phash". With
+        places, GPS positions are reverse-geocoded once per chunk into info["place"].
+        With an async I/O engine, headers are read in its thread pool instead.
+        backend picks the pool (see ExtractBackend; None: the configured default).
+        Subinterpreters cannot share the pause/cancel events or the read throttle,
+        so they stop between chunks and a throttled run uses processes instead.
+        """
+        control = control or RunControl()
         if not pending:
             return
+        if engine:
+            yield from engine.extract_paths(pending, control, places, phash)
+            return
 
-        max_procs = min(cpu_count(), 4)
-        chunksize = max(10, len(pending) // (max_procs * 4))
+        backend = ExtractBackend.resolve(backend)
+        if backend == "interpreter" and governor:
+            backend = "process"
+        max_procs = ExtractBackend.max_workers(backend)
+        if scheduler:
+            max_procs = min(max_procs, scheduler.total_concurrency(pending))
+        if governor:
+            max_procs = governor.limit_workers(max_procs)
+        chunksize = max(10, min(EXTRACT_CHUNK_MAX, len(pending) // (max_procs * 4)))
+        if scheduler:
+            chunks = iter(scheduler.chunk_reads(pending, chunksize))
+        else:
+            chunks = (pending[i:i + chunksize] for i in range(0, len(pending), chunksize))
+        max_in_flight = max_procs * 2
 
-        with ProcessPoolExecutor(max_workers=max_procs) as executor:
-            for path, iso_dt in executor.map(extract_worker, pending, chunksize=chunksize):
-                yield path, iso_dt
+        throttle = governor.throttle if governor else None
+        initargs = (throttle, phash, (places.source, places.city_radius_km) if places else None)
+        warm = context = None
+        if backend == "thread":
+            # Threads share this process, so each chunk carries the run's settings instead of worker globals.
+            context = ExtractContext(*control.events(), throttle, phash, places, shared=True)
+            executor = ExtractBackend.executor(backend, max_procs, None, ())
+        elif backend == "process" and WarmExtractPool.enabled:
+            warm = WarmExtractPool.acquire(*initargs)
+            executor = warm.executor
+            # The warm pool is sized for the machine; a chunk per allowed worker keeps this run's concurrency.
+            max_in_flight = max_procs
+        else:
+            events = control.events() if backend == "process" else (None, None)
+            executor = ExtractBackend.executor(backend, max_procs, _init_extract_worker, (*events, *initargs))
+        submit_args = (context,) if context else ()
+        in_flight = set()
+        try:
+            exhausted = False
+            while not control.is_cancelled():
+                if warm:
+                    warm.mirror(control)
+                while not exhausted and len(in_flight) < max_in_flight and not control.is_paused():
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    in_flight.add(executor.submit(extract_chunk, chunk, *submit_args))
+                if not in_flight:
+                    if exhausted:
+                        break
+                    control.checkpoint()
+                    continue
+                done, in_flight = wait(in_flight, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        finally:
+            if warm:
+                warm.release(in_flight)
+            else:
+                executor.shutdown(wait=not control.is_cancelled(), cancel_futures=True)
 
 
 class MetadataExtractor:
     @staticmethod
     def get_date_taken(path: str) -> datetime | None:
-        ext = os.path.splitext(path)[1].lower()
-        try:
-            with open(path, 'rb') as f:
-                if ext in PHOTO_EXTS:
-                    try:
-                        img = Image.open(f)
-                        exif = img.getexif()
-                        if exif:
-                            for tag in (36867, 306, 36868, 36869):  # DateTimeOriginal, etc.
-                                dt_str = exif.get(tag)
-                                if dt_str:
-                                    try:
-                                        return datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%S")
-                                    except ValueError:
-                                        continue
-                    except (UnidentifiedImageError, OSError):
-                        pass
+        return MetadataExtractor.get_metadata(path)[0]
 
-                    f.seek(0)
-                    tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal", details=False)
-                    dt_str = tags.get("EXIF DateTimeOriginal") or tags.get("Image DateTime")
-                    if dt_str:
-                        try:
-                            return datetime.strptime(str(dt_str), "%Y:%m:%d %H:%M:%S")
-                        except ValueError:
-                            pass
+    @staticmethod
+    def get_metadata(path: str, fileobj=None) -> tuple[datetime | None, dict]:
+        """Capture date plus cheap extras (camera model) read in the same header parse.
 
-                elif ext in RAW_EXTS:
-                    tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal", details=False)
-                    dt_str = tags.get("EXIF DateTimeOriginal") or tags.get("Image DateTime")
+        The parser is chosen from the file's leading bytes (see ExtractorRegistry), so
+        misnamed files are still read correctly. fileobj, if given, is parsed instead
+        of opening path (e.g. an in-memory header).
+        """
+        info = {}
+        try:
+            with (nullcontext(fileobj) if fileobj is not None else open(path, 'rb', buffering=SNIFF_BYTES)) as f:
+                head = f.read(SNIFF_BYTES)
+                fmt = ExtractorRegistry.sniff(head)
+                if fmt:
+                    dt_str = ExtractorRegistry.extract(fmt, f, head, info)
                     if dt_str:
                         try:
-                            return datetime.strptime(str(dt_str), "%Y:%m:%d %H:%M:%S")
+                            return datetime.strptime(str(dt_str).strip("\x00 "), "%Y:%m:%d %H:%M:%S"), info
                         except ValueError:
                             pass
 
+                if os.path.splitext(path)[1].lower() in RAW_EXTS:
                     try:
                         import rawpy
                         f.seek(0)
@@ -89,7 +453,7 @@ class MetadataExtractor:
                             dt_str = raw.metadata.datetime_taken
                             if dt_str:
                                 try:
-                                    return datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
+                                    return datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S"), info
                                 except ValueError:
                                     pass
                     except Exception:
@@ -100,12 +464,114 @@ class MetadataExtractor:
 
         mod_time = FileUtils.get_file_mod_time(path)
         if mod_time:
-            return datetime.fromtimestamp(mod_time)
+            info["date_from_mtime"] = True
+            return datetime.fromtimestamp(mod_time), info
+
+        return None, info
 
+    @staticmethod
+    def perceptual_hash(path: str) -> int | None:
+        """64-bit dHash of a photo without decoding it at full size.
+
+        JPEGs are decoded with draft() (DCT scaling, 1/8 of each dimension) and RAW
+        files use their embedded EXIF thumbnail; other formats Pillow can open are
+        reduced with thumbnail().
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in PHOTO_EXTS and ext not in RAW_EXTS:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                img = None
+                if ext in PHOTO_EXTS:
+                    try:
+                        img = Image.open(f)
+                        if img.format == "JPEG":
+                            img.draft("L", (PHASH_SIZE * 8, PHASH_SIZE * 8))
+                            return MetadataExtractor._dhash(img)
+                    except (UnidentifiedImageError, OSError):
+                        img = None
+
+                if img is not None:
+                    img.thumbnail((PHASH_SIZE * 8, PHASH_SIZE * 8), reducing_gap=2.0)
+                    return MetadataExtractor._dhash(img)
+
+                f.seek(0)
+                thumb = exifread.process_file(f, details=False).get("JPEGThumbnail")
+                if thumb:
+                    return MetadataExtractor._dhash(MetadataExtractor._trim_borders(Image.open(io.BytesIO(thumb))))
+        except Exception:
+            pass
         return None
 
+    @staticmethod
+    def _dhash(img: Image.Image) -> int:
+        small = img.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.Resampling.BILINEAR)
+        px = small.tobytes()
+        value = 0
+        for row in range(PHASH_SIZE):
+            offset = row * (PHASH_SIZE + 1)
+            for col in range(PHASH_SIZE):
+                value = (value << 1) | (px[offset + col] > px[offset + col + 1])
+        return value
+
+    @staticmethod
+    def _trim_borders(img: Image.Image) -> Image.Image:
+        # Camera thumbnails are often letterboxed to 4:3; crop the black bars so they hash like the photo.
+        bbox = img.convert("L").point(lambda v: 255 if v > 16 else 0).getbbox()
+        return img.crop(bbox) if bbox else img
+
 
-def extract_worker(path: str):
-    dt = MetadataExtractor.get_date_taken(path)
+def extract_worker(path: str, phash: bool = False):
+    dt, info = MetadataExtractor.get_metadata(path)
     iso_dt = dt.isoformat() if dt else None
-    return path, iso_dt
+    if phash:
+        info["phash"] = MetadataExtractor.perceptual_hash(path)
+    return path, iso_dt, info
+
+
+class ExtractContext:
+    """A run's settings as seen by extract_chunk: pause/cancel events, read throttle, phash flag, place index.
+
+    shared marks extraction threads, which share their process with the other
+    readers, so reads are metered per thread rather than per process.
+    """
+
+    def __init__(self, cancel_event=None, running_event=None, throttle=None, phash: bool = False,
+                 places: PlaceIndex | None = None, shared: bool = False):
+        self.cancel = cancel_event
+        self.running = running_event
+        self.throttle = throttle
+        self.phash = phash
+        self.places = places
+        self.shared = shared
+
+
+# Set once per worker process (or subinterpreter) by its initializer.
+_worker_context = ExtractContext()
+
+
+def _init_extract_worker(cancel_event, running_event, throttle=None, phash=False, places=None) -> None:
+    global _worker_context
+    _worker_context = ExtractContext(cancel_event, running_event, throttle, phash,
+                                     PlaceIndex.load(*places) if places else None)
+
+
+def extract_chunk(paths: list[str], context: ExtractContext | None = None) -> list[tuple[str, str | None, dict]]:
+    ctx = context or _worker_context
+    results = []
+    for path in paths:
+        if ctx.running is not None:
+            ctx.running.wait()
+        if ctx.cancel is not None and ctx.cancel.is_set():
+            break
+        if ctx.throttle is not None:
+            with ctx.throttle.metered_read(path if ctx.shared else None):
+                results.append(extract_worker(path, ctx.phash))
+        else:
+            results.append(extract_worker(path, ctx.phash))
+    if ctx.places is not None:
+        located = [info for _, _, info in results if "gps" in info]
+        for info, place in zip(located, ctx.places.lookup([info["gps"] for info in located])):
+            info["place"] = place
+    return results
@@ -0,0 +1,391 @@
+import io
+import os
+import sys
+import time
+import queue
+import random
+import asyncio
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import ConfigManager, file_exts
+from control import RunControl
+from extractors import SNIFF_BYTES
+from metadata import MetadataExtractor, extract_worker
+from rules import ScanRules
+
+# Latencies kept per operation type for the percentile in the stats line.
+STATS_WINDOW = 2048
+PAUSE_POLL = 0.05
+
+
+class LatencyShim:
+    """Artificial network latency for trying the engine on a local disk.
+
+    Every engine operation sleeps for its typical number of round trips before it
+    runs (a move is a duplicate-check read, a mkdir and a rename), and each block a
+    RangedReader fetches beyond the first costs one more.
+    """
+
+    ROUND_TRIPS = {"scandir": 1, "read": 1, "move": 3}
+
+    def __init__(self, latency_ms: float, jitter: float = 0.2):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+
+    def delay(self, round_trips: int = 1) -> None:
+        if self.latency > 0:
+            time.sleep(round_trips * self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+class RangedReader(io.RawIOBase):
+    """Read-only file served from aligned blocks fetched on demand and kept.
+
+    The first block covers the sniff buffer and most header parses, so dating a
+    file is usually one request; parsers that seek further (MP4 moov, CR3 boxes)
+    fetch only the blocks they touch instead of issuing a read per call.
+    """
+
+    def __init__(self, path: str, block_size: int = SNIFF_BYTES, shim: LatencyShim | None = None):
+        super().__init__()
+        self._f = open(path, 'rb', buffering=0)
+        self._size = os.fstat(self._f.fileno()).st_size
+        self._pos = 0
+        self._blocks: dict[int, bytes] = {}
+        self.block_size = block_size
+        self.shim = shim
+
+    def _block(self, index: int) -> bytes:
+        data = self._blocks.get(index)
+        if data is None:
+            if self.shim and self._blocks:
+                self.shim.delay()
+            self._f.seek(index * self.block_size)
+            data = self._f.read(self.block_size) or b""
+            self._blocks[index] = data
+        return data
+
+    def readinto(self, buf) -> int:
+        want = min(len(buf), self._size - self._pos)
+        view = memoryview(buf).cast("B")
+        got = 0
+        while got < want:
+            index, offset = divmod(self._pos + got, self.block_size)
+            data = self._block(index)[offset:offset + want - got]
+            if not data:
+                break
+            view[got:got + len(data)] = data
+            got += len(data)
+        self._pos += got
+        return got
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+class OpStats:
+    """Count, latency and throughput of one operation type."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=STATS_WINDOW)
+        self.started = None
+        self.last = None
+
+    def record(self, started: float, elapsed: float, ok: bool = True) -> None:
+        self.count += 1
+        self.errors += not ok
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.recent.append(elapsed)
+        self.started = started if self.started is None else min(self.started, started)
+        self.last = started + elapsed
+
+    def summary(self) -> dict:
+        recent = sorted(self.recent)
+        span = (self.last - self.started) if self.count else 0.0
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "p95_ms": 1000 * recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,
+            "max_ms": 1000 * self.max,
+            "per_sec": self.count / span if span > 0 else 0.0,
+        }
+
+
+class AsyncIOEngine:
+    """Concurrent I/O for high-latency (SMB/NFS) libraries.
+
+    An asyncio loop on its own thread schedules listings, header reads and moves
+    onto a large thread pool, with one semaphore per operation type so hundreds of
+    round trips are in flight at once without any one kind starving the others.
+    Callers stay synchronous: walk(), extract_paths() and run_moves() stream their
+    results back through a queue and honour the run's pause/cancel token. The
+    loop thread and pool live until close(); the organizer closes its engine when
+    its run ends.
+    """
+
+    MAX_IN_FLIGHT = 256
+    LIMITS = {"scandir": 32, "read": 128, "move": 64}
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, limits: dict | None = None,
+                 header_bytes: int = SNIFF_BYTES, latency_ms: float = 0.0):
+        self.limits = {**self.LIMITS, **(limits or {})}
+        self.max_in_flight = max(max_in_flight, 1)
+        self.header_bytes = header_bytes
+        self.shim = LatencyShim(latency_ms) if latency_ms else None
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="aio")
+        self.stats = {op: OpStats() for op in self.limits}
+        self._sems = {op: asyncio.Semaphore(n) for op, n in self.limits.items()}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="aio-loop", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config: dict, base_dir: str) -> "AsyncIOEngine | None":
+        """A new engine for base_dir if it is (inside) one of the async_io libraries, else None."""
+        cfg = config.get("async_io", {})
+        base = os.path.normcase(os.path.abspath(base_dir))
+        for lib in cfg.get("libraries", []):
+            lib = os.path.normcase(os.path.abspath(lib))
+            if base == lib or base.startswith(lib.rstrip(os.sep) + os.sep):
+                break
+        else:
+            return None
+        return cls(cfg.get("max_in_flight", cls.MAX_IN_FLIGHT), cfg.get("limits", {}),
+                   cfg.get("header_bytes", SNIFF_BYTES), cfg.get("latency_ms", 0))
+
+    def close(self) -> None:
+        """Stop the loop thread and the pool; safe to call more than once."""
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def reset_stats(self) -> None:
+        self.stats = {op: OpStats() for op in self.limits}
+
+    def format_stats(self) -> str:
+        parts = []
+        for op, stats in self.stats.items():
+            if stats.count:
+                s = stats.summary()
+                parts.append(f"{op} {s['count']} ops, {s['avg_ms']:.1f} ms avg, {s['p95_ms']:.1f} ms p95, "
+                             f"{s['per_sec']:.0f}/s" + (f", {s['errors']} errors" if s['errors'] else ""))
+        return "I/O engine: " + ("; ".join(parts) if parts else "idle")
+
+    # --- scheduling ---
+
+    async def _op(self, op: str, fn, *args):
+        async with self._sems[op]:
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = await self._loop.run_in_executor(self.executor, self._call, op, fn, args)
+                ok = True
+                return result
+            finally:
+                self.stats[op].record(started, time.perf_counter() - started, ok)
+
+    def _call(self, op: str, fn, args):
+        if self.shim:
+            self.shim.delay(LatencyShim.ROUND_TRIPS.get(op, 1))
+        return fn(*args)
+
+    @staticmethod
+    async def _gate(control: RunControl) -> bool:
+        """Async counterpart of RunControl.checkpoint(): wait out a pause without blocking the loop."""
+        while control.is_paused() and not control.is_cancelled():
+            await asyncio.sleep(PAUSE_POLL)
+        return not control.is_cancelled()
+
+    async def _drain(self, op: str, items, fn, control: RunControl, emit, on_error=None) -> None:
+        """Run fn over items with as many workers as op's limit, emitting each result.
+
+        An item that fails with OSError is counted in op's stats and emits
+        on_error(item, error), run in the pool, in its place; without on_error the
+        error ends the run.
+        """
+        it = iter(items)
+
+        async def worker():
+            for item in it:
+                if not await self._gate(control):
+                    return
+                try:
+                    result = await self._op(op, fn, *item)
+                except OSError as e:
+                    if on_error is None:
+                        raise
+                    result = await self._loop.run_in_executor(self.executor, on_error, item, e)
+                emit(result)
+
+        await asyncio.gather(*(worker() for _ in range(self.limits[op])))
+
+    def _stream(self, coro_fn, control: RunControl):
+        """Run coro_fn(emit) on the loop and yield whatever it emits, as it is emitted."""
+        results = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                await coro_fn(results.put)
+            except BaseException as e:
+                results.put(_Failure(e))
+                raise
+            finally:
+                results.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    # --- operations ---
+
+    def walk(self, top: str, rules: ScanRules | None = None, control: RunControl | None = None):
+        """Yield (dir, subdirs, files) like FileUtils.fast_walk, listing many directories at once."""
+        control = control or RunControl()
+        rules = rules or None
+
+        async def run(emit):
+            tasks = set()
+
+            async def visit(directory):
+                if not await self._gate(control):
+                    return
+                try:
+                    dirs, files = await self._op("scandir", _list_dir, directory, top, rules)
+                except OSError:
+                    return
+                emit((directory, dirs, files))
+                for d in dirs:
+                    tasks.add(asyncio.ensure_future(visit(d)))
+
+            tasks.add(asyncio.ensure_future(visit(top)))
+            while tasks:
+                finished, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                tasks -= finished
+                for task in finished:
+                    task.result()
+
+        return self._stream(run, control)
+
+    def extract_paths(self, paths: list[str], control: RunControl | None = None, places=None, phash: bool = False):
+        """Yield (path, iso, info) for each path, reading headers through RangedReader in parallel."""
+        control = control or RunControl()
+
+        async def run(emit):
+            # A header that can't be fetched is read again like the worker pool does, falling back to the mtime.
+            await self._drain("read", ((p, phash) for p in paths), self._read_metadata, control, emit,
+                              lambda item, error: extract_worker(*item))
+
+        for item in self._stream(run, control):
+            info = item[2]
+            if places is not None and "gps" in info:
+                info["place"] = places.lookup([info["gps"]])[0]
+            yield item
+
+    def _read_metadata(self, path: str, phash: bool):
+        with RangedReader(path, self.header_bytes, self.shim) as f:
+            dt, info = MetadataExtractor.get_metadata(path, f)
+        if phash:
+            info["phash"] = MetadataExtractor.perceptual_hash(path)
+        return path, dt.isoformat() if dt else None, info
+
+    def run_moves(self, items: list[tuple], move_fn, control: RunControl | None = None, on_done=None,
+                  on_error=None) -> int:
+        """Call move_fn(path, iso) -> moved count for every item, many at once; returns the total.
+
+        on_error(item, error) -> moved count reports an item whose move raised OSError.
+        """
+        control = control or RunControl()
+        total = 0
+
+        async def run(emit):
+            await self._drain("move", items, move_fn, control, emit, on_error)
+
+        for moved in self._stream(run, control):
+            total += moved
+            if on_done:
+                on_done(total)
+        return total
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _list_dir(directory: str, top: str, rules: ScanRules | None) -> tuple[list[str], list[str]]:
+    dirs, files = [], []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not rules or not rules.skip_dir(entry.path, ScanRules.relative(top, entry.path)):
+                        dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    if not rules or rules.accept_file(entry, ScanRules.relative(top, entry.path)):
+                        files.append(entry.name)
+            except OSError:
+                continue
+    return dirs, files
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Read-only benchmark: list a tree and read every header at several concurrency levels."""
+    p = argparse.ArgumentParser(description="Measure the async I/O engine on a library without changing it.")
+    p.add_argument("base_dir")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="simulate this round-trip time per operation")
+    p.add_argument("--in-flight", default="8,64,256", help="comma-separated concurrency levels to compare")
+    p.add_argument("--limit", type=int, default=2000, help="read at most this many headers per level")
+    args = p.parse_args(argv)
+
+    rules = ScanRules.from_config(ConfigManager.load())
+    for level in (int(v) for v in args.in_flight.split(",")):
+        engine = AsyncIOEngine(level, {op: level for op in AsyncIOEngine.LIMITS}, latency_ms=args.latency_ms)
+        started = time.perf_counter()
+        paths = [os.path.join(root, f) for root, _, files in engine.walk(args.base_dir, rules)
+                 for f in files if os.path.splitext(f)[1].lower() in file_exts][:args.limit]
+        dated = sum(1 for _, iso, _ in engine.extract_paths(paths) if iso)
+        print(f"{level:>4} in flight: {len(paths)} files, {dated} dated in {time.perf_counter() - started:.2f}s")
+        print("     " + engine.format_stats())
+        engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
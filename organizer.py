@@ -1,22 +1,54 @@
 from PySide6.QtCore import QObject, Signal
 from multiprocessing import cpu_count
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import threading
 import os
+import json
+import time
+import hashlib
 from datetime import datetime
 
-from metadata import FileGatherer
-from file_ops import FolderNameGenerator, FileMover
+from metadata import FileGatherer, MetadataExtractor
+from file_ops import FolderNameGenerator, FileMover, FileUtils
 from config import RAW_EXTS, VIDEO_EXTS, file_exts
+from control import RunControl, RunCheckpoint
+from scheduler import LocalityScheduler
+from governor import ResourceGovernor
+from catalog import LibraryCatalog
+from snapshot import DirectorySnapshot
+from events import EventClusterer, EventIndex, to_seconds
+from geocode import PlaceIndex
+from rules import ScanRules
+from netio import AsyncIOEngine
+from estimate import FileCountEstimator, RunProgress, RunHistory
+
+# Moved files hashed per batch when recording scrub baselines.
+HASH_BATCH = 256
+# Seconds between progress and estimate updates sent to the UI.
+REPORT_INTERVAL = 0.5
 
 
 class PhotoOrganizer(QObject):
+    """Moves the photos and videos under one or more source roots into dated folders of target_root.
+
+    By default base_dir is both the only source and the target. With source_dirs,
+    every root is scanned concurrently and extracted in one pool, and all files go
+    through the same destination registry and duplicate index, so several backups
+    merge into one library in a single pass.
+
+    Progress is weighted across the scan, extract and move stages (see RunProgress)
+    and starts moving from the first second: an early file estimate from history
+    or a sampling walk stands in for the count until the scan has found everything.
+    """
+
     progress = Signal(int)
     log_msg = Signal(str)
 
     total_files = Signal(int)
     moved_files = Signal(int)
     skipped_files = Signal(int)
+    budget_usage = Signal(dict)
+    estimate = Signal(dict)
 
     def __init__(
         self,
@@ -25,22 +57,113 @@ class PhotoOrganizer(QObject):
         max_workers: int = cpu_count(),
         separate_videos: bool = False,
         excluded_folders: list[str] | None = None,
+        checkpoint: RunCheckpoint | None = None,
+        governor: ResourceGovernor | None = None,
+        catalog: LibraryCatalog | None = None,
+        snapshot: DirectorySnapshot | None = None,
+        target_root: str | None = None,
+        event_clusterer: EventClusterer | None = None,
+        place_index: PlaceIndex | None = None,
+        scan_rules: ScanRules | None = None,
+        group_stems: bool = True,
+        io_engine: AsyncIOEngine | None = None,
+        record_hashes: bool = False,
+        source_dirs: list[str] | None = None,
     ):
         super().__init__()
         self.base_dir = base_dir
+        self.target_root = target_root or base_dir
         self.folder_structure = folder_structure
+        self.governor = governor
+        if governor:
+            max_workers = governor.limit_workers(max_workers)
         self.max_workers = max_workers
         self.separate_videos = separate_videos
-        self.excluded_folders = excluded_folders or []
+        self.source_dirs = [os.path.abspath(d) for d in source_dirs] if source_dirs else [base_dir]
+        self.excluded_folders = list(excluded_folders or [])
+        target = os.path.abspath(self.target_root)
+        if len(self.source_dirs) > 1 and target not in self.source_dirs and any(
+                target.startswith(d.rstrip(os.sep) + os.sep) for d in self.source_dirs):
+            # A library inside one of the sources is the destination, not something to merge again.
+            self.excluded_folders.append(target)
+        self.scan_rules = scan_rules
+        self.group_stems = group_stems
+        self.io_engine = io_engine
+        # Full-content hashes of moved files go to the catalog as the baseline for scrub.py.
+        self.record_hashes = record_hashes and catalog is not None
+        self._moved: list[str] = []
+        # Leader path -> [(member, file it follows)], and sidecar -> the member whose folder it shares.
+        self._stem_members: dict[str, list[tuple[str, str]]] = {}
+        self._sidecar_anchor: dict[str, str] = {}
 
         self.lock = threading.RLock()
-        self._cancel_requested = threading.Event()
+        self.control = RunControl()
+        self.checkpoint = checkpoint
+        self.scheduler = LocalityScheduler(max_workers)
+        self.catalog = catalog
+        self._file_info: dict[str, dict] = {}
+        self.snapshot = snapshot
+        self._touched_dirs: set[str] = set()
+        # Source folders still holding files whose move failed; the snapshot lists them again next run.
+        self._failed_dirs: set[str] = set()
+        self.event_clusterer = event_clusterer
+        self._snapshots = self._root_snapshots(snapshot)
+        self._event_index: EventIndex | None = None
+        self._event_folders: dict[str, str] = {}
+        self.uses_location = folder_structure in FolderNameGenerator.LOCATION_STRUCTURES
+        self.place_index = (place_index or PlaceIndex.load()) if self.uses_location else None
+        self.run_progress = RunProgress(RunHistory.load(self.target_root))
+        self._estimator: FileCountEstimator | None = None
+        self._last_report = 0.0
+
+    def _root_snapshots(self, snapshot: DirectorySnapshot | None) -> dict[str, DirectorySnapshot]:
+        """The given snapshot for its own root, plus one per other source root with the same settings."""
+        if not snapshot:
+            return {}
+        if len(self.source_dirs) == 1:
+            snapshots = {self.source_dirs[0]: snapshot}
+        else:
+            snapshots = {root: snapshot if root == snapshot.base_dir else
+                         DirectorySnapshot(root, full_verify_every=snapshot.full_verify_every)
+                         for root in self.source_dirs}
+        signature = self._layout_signature()
+        for s in snapshots.values():
+            s.signature = signature
+        return snapshots
+
+    def _layout_signature(self) -> str:
+        """Digest of the settings that decide which files a scan yields and where they are moved."""
+        settings = {
+            "target": os.path.normcase(os.path.abspath(self.target_root)),
+            "structure": self.folder_structure,
+            "separate_videos": self.separate_videos,
+            "group_stems": self.group_stems,
+            "events": self.event_clusterer is not None,
+            "rules": (self.scan_rules or ScanRules()).to_config(),
+            "excluded": sorted(os.path.normcase(os.path.abspath(p)) for p in self.excluded_folders),
+        }
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
 
     def cancel(self) -> None:
-        self._cancel_requested.set()
+        self.control.cancel()
+
+    def pause(self) -> None:
+        self.control.pause()
+        self.run_progress.pause()
+        if self.checkpoint:
+            self.checkpoint.save()
+        self._log("Paused.")
+
+    def resume(self) -> None:
+        self.control.resume()
+        self.run_progress.resume()
+        self._log("Resumed.")
 
     def is_cancelled(self) -> bool:
-        return self._cancel_requested.is_set()
+        return self.control.is_cancelled()
+
+    def is_paused(self) -> bool:
+        return self.control.is_paused()
 
     def _log(self, msg: str) -> None:
         self.log_msg.emit(msg)
@@ -48,17 +171,153 @@ class PhotoOrganizer(QObject):
     def _emit_progress(self, percent: int) -> None:
         self.progress.emit(percent)
 
+    def _report(self, force: bool = False) -> None:
+        """Emit the stage-weighted progress and the run estimate, at most every REPORT_INTERVAL seconds."""
+        now = time.monotonic()
+        if not force and now - self._last_report < REPORT_INTERVAL:
+            return
+        self._last_report = now
+        summary = self.run_progress.summary()
+        self._emit_progress(summary["percent"])
+        self.estimate.emit(summary)
+
+    def _on_estimate(self, files: int | None, nbytes: int | None, exact: bool) -> None:
+        if self.run_progress.totals["scan"] is not None:
+            return  # the scan has finished and counted for real
+        self.run_progress.set_estimate(max(files or 0, self.run_progress.done["scan"]), nbytes)
+        self._report()
+
+    def _on_found(self, count: int, finished: bool) -> None:
+        progress = self.run_progress
+        if finished:
+            if progress.estimate and progress.estimate_bytes:
+                progress.set_estimate(count, int(progress.estimate_bytes * count / progress.estimate))
+            else:
+                progress.set_estimate(count)
+            progress.update("extract", 0, count)
+            if self._estimator:
+                self._estimator.stop()
+        else:
+            progress.update("scan", count)
+            if (progress.estimate or 0) < count:
+                progress.set_estimate(count)
+        self._report(force=finished)
+
     def _gather_files(self) -> tuple[list, int]:
-        self._log(f"Scanning {self.base_dir}...")
-        files = list(FileGatherer.gather_files_with_metadata(
-            self.base_dir, file_exts, self.excluded_folders
-        ))
-        count = len(files)
+        multi = len(self.source_dirs) > 1
+        self._log(f"Scanning {', '.join(self.source_dirs) if multi else self.base_dir}...")
+        known = {}
+        for root, snapshot in self._snapshots.items():
+            prefix = f"{root}: " if multi else ""
+            if not snapshot.load():
+                self._log(f"{prefix}No directory snapshot yet, running a full scan.")
+            elif snapshot.settings_changed():
+                self._log(f"{prefix}Folder structure or scan settings changed, running a full scan.")
+            elif snapshot.needs_full_verify():
+                self._log(f"{prefix}Running periodic full verification scan.")
+            else:
+                self._log(f"{prefix}Incremental scan: only changed folders will be listed.")
+        if self.checkpoint and self.checkpoint.load():
+            known = self.checkpoint.metadata
+            self._log(f"Resuming previous run: {len(known)} files already extracted, "
+                      f"{len(self.checkpoint.done)} already moved.")
+        if self.uses_location:
+            # The checkpoint only keeps dates; places come from re-reading the headers.
+            known = {}
+
+        self._estimator = FileCountEstimator(self.source_dirs, file_exts, self.excluded_folders, self.scan_rules,
+                                             self._snapshots, self.catalog, self.run_progress.history, self.control)
+        files_estimate, bytes_estimate = self._estimator.prior()
+        if files_estimate:
+            self.run_progress.set_estimate(files_estimate, bytes_estimate)
+            size = f" ({bytes_estimate / (1 << 30):.1f} GB)" if bytes_estimate else ""
+            self._log(f"Expecting about {files_estimate:,} files{size}.")
+        self._report(force=True)
+        self._estimator.start(self._on_estimate)
+        try:
+            files = self._collect(known)
+        finally:
+            self._estimator.stop()
+        count = len(files) + sum(len(m) for m in self._stem_members.values())
         self.total_files.emit(count)
         self._log(f"Loaded metadata for {count} files.")
         return files, count
 
+    def _collect(self, known: dict) -> list[tuple[str, str | None]]:
+        files, extracted = [], 0
+        multi = len(self.source_dirs) > 1
+        roots = self.source_dirs if multi else self.source_dirs[0]
+        snapshots = self._snapshots if multi else self._snapshots.get(roots)
+        for path, iso_dt, info in FileGatherer.gather_files_with_metadata(
+            roots, file_exts, self.excluded_folders, self.control, dict(known), self.scheduler, self.governor,
+            snapshots, self.place_index, self.scan_rules, self.group_stems, self.io_engine, self._on_found
+        ):
+            members = info.pop("members", [])
+            extracted += 1 + len(members)
+            if self.run_progress.totals["scan"] is not None:
+                # Checkpointed files come back while the scan is still running; they don't end it.
+                self.run_progress.update("extract", extracted)
+                self._report()
+            if self.checkpoint:
+                members = [m for m in members if not self.checkpoint.is_done(m[0])]
+                if self.checkpoint.is_done(path):
+                    # The leader moved in an earlier run; members it left behind still go with its date.
+                    self._add_group(path, info, members)
+                    self._stem_members.pop(path, None)
+                    files += [(member, iso_dt) for member, _ in members]
+                    continue
+                self.checkpoint.record_metadata(path, iso_dt)
+            self._add_group(path, info, members)
+            files.append((path, iso_dt))
+        return files
+
+    def _add_group(self, leader: str, info: dict, members: list[tuple[str, str]]) -> None:
+        """Remember a leader's metadata and the members that move with it."""
+        if info or self.uses_location:
+            self._file_info[leader] = info
+        if members:
+            self._stem_members[leader] = members
+            for member, follows in members:
+                if follows != member:
+                    self._sidecar_anchor[member] = follows
+                if info or self.uses_location:
+                    self._file_info[member] = info
+
+    def _assign_events(self, isos: list[str]) -> None:
+        """Cluster capture dates into event folders in one pass (only for the "events" structure)."""
+        if self.folder_structure != "events":
+            return
+        with self.lock:
+            if self._event_index is None:
+                self._event_index = EventIndex(self.target_root, self.event_clusterer)
+            pending = sorted({iso for iso in isos if iso and iso not in self._event_folders})
+            if pending:
+                self._event_folders.update(zip(pending, self._event_index.assign(to_seconds(pending))))
+
+    def _place(self, path: str) -> tuple[str, str | None] | None:
+        info = self._file_info.get(path)
+        if info is None:
+            # Files outside a gathered batch (watchdog) are read here.
+            _, info = MetadataExtractor.get_metadata(path)
+            with self.lock:
+                self._file_info[path] = info
+        if "place" not in info:
+            info["place"] = self.place_index.lookup([info.get("gps")])[0]
+        return info["place"]
+
+    def _date_folder(self, dt: datetime | None, date_taken_iso: str | None, ext: str, path: str = "") -> str:
+        if self.folder_structure == "events" and dt:
+            if date_taken_iso not in self._event_folders:
+                # Files outside a gathered batch (ingest, watchdog) join or start events one at a time.
+                self._assign_events([date_taken_iso])
+            return self._event_folders[date_taken_iso]
+        place = self._place(path) if self.uses_location and dt else None
+        return FolderNameGenerator.generate(dt, ext, self.folder_structure, place)
+
     def _determine_target_directory(self, path: str, date_taken_iso: str | None) -> str:
+        anchor = self._sidecar_anchor.get(path)
+        if anchor:
+            return self._determine_target_directory(anchor, date_taken_iso)
         dt = None
         if date_taken_iso:
             try:
@@ -69,74 +328,211 @@ class PhotoOrganizer(QObject):
         ext = os.path.splitext(path)[1].lower()
         if ext in RAW_EXTS:
             return os.path.join(
-                self.base_dir,
-                FolderNameGenerator.generate(dt, ext, self.folder_structure),
+                self.target_root,
+                self._date_folder(dt, date_taken_iso, ext, path),
                 "Raw"
             )
         elif ext in VIDEO_EXTS and self.separate_videos:
-            return os.path.join(self.base_dir, "Videos")
+            return os.path.join(self.target_root, "Videos")
         else:
             return os.path.join(
-                self.base_dir,
-                FolderNameGenerator.generate(dt, ext, self.folder_structure)
+                self.target_root,
+                self._date_folder(dt, date_taken_iso, ext, path)
             )
 
     def _move_file(self, path: str, date_taken_iso: str | None, existing_files: set) -> bool:
-        if self.is_cancelled():
+        if not self.control.checkpoint():
             return False
 
         target_dir = self._determine_target_directory(path, date_taken_iso)
+        if self.governor:
+            self.governor.throttle.charge_move()
 
         try:
-            FileMover.safe_move_file(path, target_dir, self.lock, existing_files, self._log)
+            on_moved = lambda src, dest: self._on_moved(src, dest, date_taken_iso)
+            if not FileMover.safe_move_file(path, target_dir, self.lock, existing_files, self._log, on_moved):
+                self._move_failed([path])
+                return False
+            if self.checkpoint:
+                self.checkpoint.record_done(path)
             self.moved_files.emit(1)
             return True
         except Exception as e:
             self._log(f"Error moving {path}: {e}")
-            self.skipped_files.emit(1)
+            self._move_failed([path])
             return False
 
-    def _move_batch(self, batch, existing_files) -> int:
+    def _move_failed(self, paths: list[str]) -> None:
+        # Not checkpointed and their folders not marked unchanged, so the next run retries them.
+        with self.lock:
+            self._failed_dirs.update(os.path.dirname(p) for p in paths)
+        self.skipped_files.emit(len(paths))
+
+    def _on_moved(self, src: str, dest: str, date_taken_iso: str | None) -> None:
+        with self.lock:
+            self._touched_dirs.add(os.path.dirname(src))
+            self._touched_dirs.add(os.path.dirname(dest))
+            if self.record_hashes:
+                self._moved.append(dest)
+        if self.catalog:
+            self.catalog.record_move(src, dest, date_taken_iso, self._file_info.get(src, {}).get("camera"))
+
+    def _move_batch(self, batch, existing_files, dev: int = -1) -> int:
         moved_count = 0
-        for path, date_taken_iso in batch:
-            if self.is_cancelled():
-                break
-            if self._move_file(path, date_taken_iso, existing_files):
-                moved_count += 1
+        with self.scheduler.device_slot(dev, batch[0][0]):
+            for path, date_taken_iso in batch:
+                if not self.control.checkpoint():
+                    break
+                moved_count += self._move_group(self._group_of(path), date_taken_iso, existing_files)
         return moved_count
 
-    def organize(self) -> None:
-        existing_files = set()
-        files, total = self._gather_files()
-        self._emit_progress(0)
+    def _group_of(self, leader: str) -> list[str]:
+        """The leader followed by the rest of its stem group (RAW/JPEG twins, sidecars), if any."""
+        return [leader] + [member for member, _ in self._stem_members.pop(leader, ())]
 
-        batch_size = max(10, len(files) // (self.max_workers * 4))
-        batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    def _move_group(self, paths: list[str], date_taken_iso: str | None, existing_files: set) -> int:
+        """Move a stem group with the leader's date under one collision suffix; returns the files handled."""
+        if len(paths) == 1:
+            return int(self._move_file(paths[0], date_taken_iso, existing_files))
+        if not self.control.checkpoint():
+            return 0
 
-        moved_total = 0
+        items = [(path, self._determine_target_directory(path, date_taken_iso)) for path in paths]
+        if self.governor:
+            for _ in items:
+                self.governor.throttle.charge_move()
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = [
-                executor.submit(self._move_batch, batch, existing_files)
-                for batch in batches
-                if not self.is_cancelled()
-            ]
+        on_moved = lambda src, dest: self._on_moved(src, dest, date_taken_iso)
+        if not FileMover.safe_move_group(items, self.lock, existing_files, self._log, on_moved):
+            # None of the group moved.
+            self._move_failed(paths)
+            return 0
+        if self.checkpoint:
+            for path in paths:
+                self.checkpoint.record_done(path)
+        self.moved_files.emit(len(paths))
+        return len(paths)
 
-            for idx, future in enumerate(futures):
-                if self.is_cancelled():
-                    self._log("Cancellation detected, awaiting running threads.")
-                    break
-                moved_in_batch = future.result()
-                moved_total += moved_in_batch
-                self._emit_progress(int((moved_total / total) * 100))
+    def organize(self) -> None:
+        if not self.governor:
+            return self._run()
+        with self.governor.lowered_priority(self._log):
+            self._run()
+
+    def _run(self) -> None:
+        if self.governor:
+            self.governor.start(self.budget_usage.emit)
+        if self.io_engine:
+            self.io_engine.reset_stats()
+        try:
+            self._organize()
+        finally:
+            if self.io_engine:
+                self._log(self.io_engine.format_stats())
+                self.io_engine.close()
+            if self._event_index:
+                self._event_index.save()
+            if self.governor:
+                self.governor.stop()
+            if self.catalog:
+                self.catalog.flush()
+
+    def _organize(self) -> None:
+        files, total = self._gather_files()
+        self._assign_events([iso for _, iso in files])
+        self.run_progress.set_estimate(total)
+        self.run_progress.update("move", 0, total)
+        self._report(force=True)
+        self._run_moves(files, total)
 
         if self.is_cancelled():
+            if self.checkpoint:
+                self.checkpoint.save()
             self._emit_progress(0)
             self._log("Operation cancelled.")
         else:
+            self._record_hashes()
+            if self.checkpoint:
+                self.checkpoint.clear()
+            for snapshot in self._snapshots.values():
+                snapshot.refresh(self._touched_dirs, self._failed_dirs)
+                snapshot.save()
+            RunHistory.record(self.target_root, total, self.run_progress.estimate_bytes,
+                              self.run_progress.measured_seconds_per_file())
             self._emit_progress(100)
             self._log("Organization complete.")
 
+    def _record_hashes(self) -> None:
+        with self.lock:
+            paths, self._moved = self._moved, []
+        if not paths:
+            return
+        self._log(f"Recording content hashes of {len(paths)} moved files...")
+        for i in range(0, len(paths), HASH_BATCH):
+            if not self.control.checkpoint():
+                return
+            batch = paths[i:i + HASH_BATCH]
+            if self.governor:
+                with self.governor.throttle.metered_read():
+                    digests = FileUtils.hash_files(batch, self.max_workers)
+            else:
+                digests = FileUtils.hash_files(batch, self.max_workers)
+            now = time.time()
+            for path, digest in digests.items():
+                if digest:
+                    self.catalog.record(path, hash_value=digest, hash_tier="full", verified_at=now)
+
+    def _run_moves(self, files: list[tuple], total: int = 0) -> int:
+        """Move (path, iso) items in bounded, locality-grouped batches; returns the number moved."""
+        existing_files = set()
+        if self.io_engine:
+            def move(path, iso):
+                return self._move_group(self._group_of(path), iso, existing_files)
+
+            def progress(moved):
+                if total:
+                    self.run_progress.update("move", moved, total)
+                    self._report()
+
+            def failed(item, error):
+                self._log(f"Error moving {item[0]}: {error}")
+                self._move_failed([item[0]])
+                return 0
+
+            return self.io_engine.run_moves(files, move, self.control, progress, failed)
+        batch_size = max(10, len(files) // (self.max_workers * 4))
+        batches = iter(self.scheduler.group_moves(files, self._determine_target_directory, batch_size))
+        max_in_flight = self.max_workers * 2
+
+        moved_total = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            in_flight = set()
+            exhausted = False
+            while not self.is_cancelled():
+                while not exhausted and len(in_flight) < max_in_flight and not self.is_paused():
+                    batch = next(batches, None)
+                    if batch is None:
+                        exhausted = True
+                        break
+                    dev, items = batch
+                    in_flight.add(executor.submit(self._move_batch, items, existing_files, dev))
+                if not in_flight:
+                    if exhausted:
+                        break
+                    self.control.checkpoint()
+                    continue
+                done, in_flight = wait(in_flight, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    moved_total += future.result()
+                    if total:
+                        self.run_progress.update("move", moved_total, total)
+                        self._report()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return moved_total
+
     def organize_single_photo(self, file_path: str, date_taken_iso: str | None = None) -> None:
         existing_files = set()
         self._emit_progress(0)
@@ -0,0 +1,174 @@
+import os
+import re
+import time
+
+SIZE_UNITS = {"": 1, "b": 1, "k": 1 << 10, "kb": 1 << 10, "m": 1 << 20, "mb": 1 << 20,
+              "g": 1 << 30, "gb": 1 << 30, "t": 1 << 40, "tb": 1 << 40}
+DAY_SECONDS = 86400
+
+
+def parse_size(value) -> int | None:
+    """Byte count from an int or a string like "500KB" / "1.5 GB"; None for empty values."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or match.group(2).lower() not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Regex source for a path glob matched against '/'-separated paths relative to the scan root.
+
+    * and ? stay within one path component, ** spans any number of them, and
+    [...] is a character class. A leading / anchors the pattern at the scan root;
+    otherwise it may match the trailing components of a path at any depth, so
+    "*/.thumbnails" and "**/@eaDir" both match those folders anywhere.
+    "re:" patterns are taken as raw regular expressions.
+    """
+    if pattern.startswith("re:"):
+        return pattern[3:]
+    pattern = pattern.replace("\\", "/")
+    anchored = pattern.startswith("/")
+    pattern = pattern.strip("/")
+    out, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            out.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+            i = end + 1
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return ("^" if anchored else "(?:^|/)") + "".join(out) + "$"
+
+
+class ScanRules:
+    """Include/exclude globs plus size and age limits, compiled into one matcher for the walkers.
+
+    Directory excludes are checked before a folder is descended into, so excluded
+    trees (e.g. Synology @eaDir) are never listed; file rules are checked before an
+    entry is yielded, using the stat data scandir already has where possible.
+    Absolute excluded folders (the GUI list) are matched exactly, without patterns.
+    """
+
+    def __init__(self, exclude=(), include=(), min_size=None, max_size=None,
+                 min_age_days: float | None = None, max_age_days: float | None = None, excluded_paths=()):
+        self.exclude = list(exclude)
+        self.include = list(include)
+        self.min_size = parse_size(min_size)
+        self.max_size = parse_size(max_size)
+        self.min_age_days = min_age_days or None
+        self.max_age_days = max_age_days or None
+        self.excluded_paths = {os.path.normcase(os.path.abspath(p)) for p in excluded_paths}
+
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        self._exclude = re.compile("|".join(f"(?:{glob_to_regex(p)})" for p in self.exclude), flags) if self.exclude else None
+        self._include = re.compile("|".join(f"(?:{glob_to_regex(p)})" for p in self.include), flags) if self.include else None
+        self._needs_stat = any(v is not None for v in (self.min_size, self.max_size, self.min_age_days, self.max_age_days))
+        self._now = time.time()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ScanRules":
+        cfg = config.get("scan_rules", {})
+        return cls(
+            exclude=cfg.get("exclude", []),
+            include=cfg.get("include", []),
+            min_size=cfg.get("min_size"),
+            max_size=cfg.get("max_size"),
+            min_age_days=cfg.get("min_age_days"),
+            max_age_days=cfg.get("max_age_days"),
+        )
+
+    def to_config(self) -> dict:
+        return {
+            "exclude": self.exclude,
+            "include": self.include,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "min_age_days": self.min_age_days,
+            "max_age_days": self.max_age_days,
+        }
+
+    @staticmethod
+    def add_arguments(parser) -> None:
+        group = parser.add_argument_group("scan rules")
+        group.add_argument("--exclude-glob", action="append", default=[], metavar="GLOB",
+                           help="skip matching folders and files, e.g. '**/@eaDir' (repeatable; 're:' for a regex)")
+        group.add_argument("--include-glob", action="append", default=[], metavar="GLOB",
+                           help="only take files matching one of these (repeatable)")
+        group.add_argument("--min-size", help="skip files smaller than this, e.g. 20KB")
+        group.add_argument("--max-size", help="skip files larger than this, e.g. 4GB")
+        group.add_argument("--min-age-days", type=float, help="skip files modified more recently than this")
+        group.add_argument("--max-age-days", type=float, help="skip files modified longer ago than this")
+
+    @classmethod
+    def from_args(cls, args, config: dict | None = None) -> "ScanRules":
+        """Rules from the config file, extended or overridden by command-line options."""
+        base = cls.from_config(config or {})
+        return cls(
+            exclude=base.exclude + args.exclude_glob,
+            include=base.include + args.include_glob,
+            min_size=args.min_size if args.min_size is not None else base.min_size,
+            max_size=args.max_size if args.max_size is not None else base.max_size,
+            min_age_days=args.min_age_days if args.min_age_days is not None else base.min_age_days,
+            max_age_days=args.max_age_days if args.max_age_days is not None else base.max_age_days,
+        )
+
+    def with_excluded(self, paths) -> "ScanRules":
+        if not paths:
+            return self
+        rules = ScanRules(self.exclude, self.include, self.min_size, self.max_size,
+                          self.min_age_days, self.max_age_days, self.excluded_paths)
+        rules.excluded_paths |= {os.path.normcase(os.path.abspath(p)) for p in paths}
+        return rules
+
+    def __bool__(self) -> bool:
+        return bool(self._exclude or self._include or self._needs_stat or self.excluded_paths)
+
+    @staticmethod
+    def relative(top: str, path: str) -> str:
+        rel = path[len(top.rstrip("\\/")) + 1:]
+        return rel.replace(os.sep, "/") if os.sep != "/" else rel
+
+    def skip_dir(self, path: str, rel: str) -> bool:
+        if self.excluded_paths and os.path.normcase(os.path.abspath(path)) in self.excluded_paths:
+            return True
+        return bool(self._exclude and self._exclude.search(rel))
+
+    def accept_file(self, entry: os.DirEntry, rel: str) -> bool:
+        if self._exclude and self._exclude.search(rel):
+            return False
+        if self._include and not self._include.search(rel):
+            return False
+        if self._needs_stat:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                return False
+            if self.min_size is not None and st.st_size < self.min_size:
+                return False
+            if self.max_size is not None and st.st_size > self.max_size:
+                return False
+            age_days = (self._now - st.st_mtime) / DAY_SECONDS
+            if self.min_age_days is not None and age_days < self.min_age_days:
+                return False
+            if self.max_age_days is not None and age_days > self.max_age_days:
+                return False
+        return True
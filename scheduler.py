@@ -0,0 +1,175 @@
+import os
+import sys
+import struct
+import threading
+import itertools
+from contextlib import contextmanager
+from collections import defaultdict
+
+import psutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct("=QQLLLL")
+_FIEMAP_EXTENT = struct.Struct("=QQQQQLLLL")
+
+
+def first_extent_offset(path: str) -> int | None:
+    """Physical byte offset of the first extent of a file (Linux FIEMAP), or None."""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return None
+    buf = bytearray(_FIEMAP_HEADER.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(_FIEMAP_EXTENT.size))
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, buf)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
+    mapped = _FIEMAP_HEADER.unpack_from(buf)[3]
+    if not mapped:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(buf, _FIEMAP_HEADER.size)[1]
+
+
+class DeviceProbe:
+    @staticmethod
+    def is_sequential(dev: int, sample_path: str) -> bool:
+        """True for spinning disks and removable media, where seeks dominate throughput."""
+        if sys.platform.startswith("linux"):
+            return DeviceProbe._linux_sysfs_flag(dev, "queue/rotational") or DeviceProbe._linux_sysfs_flag(dev, "removable")
+        return DeviceProbe._is_removable_partition(sample_path)
+
+    @staticmethod
+    def _linux_sysfs_flag(dev: int, name: str) -> bool:
+        block = os.path.realpath(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}")
+        # Partitions keep their queue attributes on the parent disk.
+        for candidate in (block, os.path.dirname(block)):
+            try:
+                with open(os.path.join(candidate, name), 'r') as f:
+                    return f.read().strip() == "1"
+            except OSError:
+                continue
+        return False
+
+    @staticmethod
+    def _is_removable_partition(path: str) -> bool:
+        try:
+            path = os.path.abspath(path).lower()
+            best = None
+            for part in psutil.disk_partitions(all=False):
+                mount = part.mountpoint.lower()
+                if path.startswith(mount) and (best is None or len(mount) > len(best.mountpoint)):
+                    best = part
+            return bool(best and ("removable" in best.opts or "cdrom" in best.opts))
+        except Exception:
+            return False
+
+
+class LocalityScheduler:
+    """Orders reads and moves by physical placement and caps concurrency per device (st_dev)."""
+
+    SEQUENTIAL_DEVICE_LIMIT = 2
+
+    def __init__(self, max_workers: int, use_extents: bool = True):
+        self.max_workers = max(1, max_workers)
+        self.use_extents = use_extents
+        self._dir_devs: dict[str, int] = {}
+        self._sequential: dict[int, bool] = {}
+        self._slots: dict[int, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def device_of(self, path: str) -> int:
+        directory = os.path.dirname(path)
+        dev = self._dir_devs.get(directory)
+        if dev is None:
+            try:
+                dev = os.stat(directory).st_dev
+            except OSError:
+                dev = -1
+            self._dir_devs[directory] = dev
+        return dev
+
+    def is_sequential(self, dev: int, sample_path: str) -> bool:
+        seq = self._sequential.get(dev)
+        if seq is None:
+            seq = dev != -1 and DeviceProbe.is_sequential(dev, sample_path)
+            self._sequential[dev] = seq
+        return seq
+
+    def concurrency_for(self, dev: int, sample_path: str) -> int:
+        if self.is_sequential(dev, sample_path):
+            return min(self.max_workers, self.SEQUENTIAL_DEVICE_LIMIT)
+        return self.max_workers
+
+    def total_concurrency(self, paths: list[str]) -> int:
+        samples = {}
+        for p in paths:
+            samples.setdefault(self.device_of(p), p)
+        total = sum(self.concurrency_for(dev, p) for dev, p in samples.items())
+        return max(1, min(self.max_workers, total))
+
+    def _placement(self, path: str, dev: int) -> int:
+        if not self.is_sequential(dev, path):
+            return 0
+        if self.use_extents:
+            offset = first_extent_offset(path)
+            if offset is not None:
+                return offset
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return 0
+
+    def order_reads(self, paths: list[str]) -> list[str]:
+        """Sort by (st_dev, directory, physical offset or inode); SSD placement falls back to name order."""
+        def key(p):
+            dev = self.device_of(p)
+            return dev, os.path.dirname(p), self._placement(p, dev), p
+        return sorted(paths, key=key)
+
+    def chunk_reads(self, paths: list[str], chunksize: int) -> list[list[str]]:
+        """order_reads() cut into chunks per device, interleaved so the chunks in flight cover every device."""
+        per_dev = defaultdict(list)
+        for p in self.order_reads(paths):
+            per_dev[self.device_of(p)].append(p)
+        chunked = [[group[i:i + chunksize] for i in range(0, len(group), chunksize)] for group in per_dev.values()]
+        return [chunk for round_ in itertools.zip_longest(*chunked) for chunk in round_ if chunk]
+
+    def group_moves(self, items: list[tuple], target_fn, batch_size: int) -> list[tuple[int, list]]:
+        """Group (path, ...) items into (st_dev, batch) pairs ordered by source and destination directory."""
+        groups = defaultdict(list)
+        for item in items:
+            path = item[0]
+            groups[(self.device_of(path), os.path.dirname(path), target_fn(*item))].append(item)
+
+        batches = []
+        current, current_dev = [], None
+        for (dev, _, _), group in sorted(groups.items(), key=lambda kv: kv[0]):
+            if current and dev != current_dev:
+                batches.append((current_dev, current))
+                current = []
+            current_dev = dev
+            for item in group:
+                current.append(item)
+                if len(current) >= batch_size:
+                    batches.append((dev, current))
+                    current = []
+        if current:
+            batches.append((current_dev, current))
+        return batches
+
+    @contextmanager
+    def device_slot(self, dev: int, sample_path: str):
+        with self._lock:
+            slot = self._slots.get(dev)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.concurrency_for(dev, sample_path))
+                self._slots[dev] = slot
+        with slot:
+            yield
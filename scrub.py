@@ -0,0 +1,205 @@
+import os
+import sys
+import math
+import time
+import argparse
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from config import CATALOG_PATH, ConfigManager
+from control import RunControl
+from catalog import LibraryCatalog
+from file_ops import FileUtils
+from governor import Throttle
+from scheduler import LocalityScheduler
+
+DEFAULT_CYCLE_DAYS = 30
+DEFAULT_WORKERS = 4
+DAY_SECONDS = 86400
+# Filesystems store mtimes at different resolutions (FAT: 2 s); within this a file counts as untouched.
+MTIME_TOLERANCE = 2.0
+
+
+class LibraryScrubber:
+    """Re-verifies the full-content hashes in the catalog, one bounded slice per run.
+
+    Each run reads at most 1/cycle_days of the library's bytes, minus whatever was
+    already verified in the last 24 hours, taking the files whose last verification
+    is oldest (never-verified first) and not younger than cycle_days. Every result is
+    written back to the catalog as it comes in, so an interrupted run resumes where
+    it stopped and the whole library is covered once per cycle. Files are read
+    through one queue per device, with the scheduler's per-device concurrency, so
+    a slow disk never holds up the others; an optional read rate caps the load.
+
+    A file whose size or mtime changed since its hash was recorded was edited, not
+    damaged: its new hash becomes the baseline. Same size and mtime with different
+    content is reported as a mismatch and the original hash is kept.
+    """
+
+    def __init__(self, catalog: LibraryCatalog, root: str | None = None, cycle_days: float = DEFAULT_CYCLE_DAYS,
+                 max_bytes: int = 0, read_bytes_per_sec: float = 0, max_workers: int = DEFAULT_WORKERS,
+                 control: RunControl | None = None, log_fn=print, progress_fn=None):
+        self.catalog = catalog
+        self.root = os.path.abspath(root) if root else None
+        self.cycle_days = max(cycle_days, 1)
+        self.max_bytes = max_bytes
+        self.throttle = Throttle(read_bytes_per_sec) if read_bytes_per_sec else None
+        self.scheduler = LocalityScheduler(max_workers)
+        self.control = control or RunControl()
+        self.log_fn = log_fn or (lambda msg: None)
+        self.progress_fn = progress_fn
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict, catalog: LibraryCatalog, root: str | None = None, **kwargs) -> "LibraryScrubber":
+        cfg = config.get("scrub", {})
+        return cls(
+            catalog, root,
+            cycle_days=cfg.get("cycle_days", DEFAULT_CYCLE_DAYS),
+            max_bytes=int(cfg.get("max_gb_per_run", 0) * (1 << 30)),
+            read_bytes_per_sec=cfg.get("read_mb_per_sec", 0) * (1 << 20),
+            max_workers=cfg.get("workers", DEFAULT_WORKERS),
+            **kwargs,
+        )
+
+    def budget(self) -> int:
+        """Bytes this run may read."""
+        now = time.time()
+        share = math.ceil(self.catalog.total_bytes(self.root) / self.cycle_days)
+        recent = self.catalog.total_bytes(self.root, verified_since=now - DAY_SECONDS)
+        budget = max(share - recent, 0)
+        return min(budget, self.max_bytes) if self.max_bytes else budget
+
+    def select(self) -> list[tuple]:
+        due_before = time.time() - self.cycle_days * DAY_SECONDS
+        return self.catalog.least_recently_verified(self.root, due_before, self.budget())
+
+    def run(self) -> dict:
+        rows = self.select()
+        report = {"checked": 0, "bytes": 0, "ok": 0, "baselined": 0, "changed": 0,
+                  "mismatch": [], "missing": [], "unreadable": []}
+        if not rows:
+            self.log_fn("Scrub: nothing due.")
+            return report
+        total_bytes = sum(r[1] or 0 for r in rows)
+        self.log_fn(f"Scrub: verifying {len(rows)} files ({total_bytes / (1 << 30):.2f} GB)...")
+
+        by_dev = defaultdict(list)
+        for row in rows:
+            by_dev[self.scheduler.device_of(row[0])].append(row)
+        queues = []
+        for dev, group in by_dev.items():
+            order = {p: i for i, p in enumerate(self.scheduler.order_reads([r[0] for r in group]))}
+            queue = deque(sorted(group, key=lambda r: order[r[0]]))
+            queues += [queue] * self.scheduler.concurrency_for(dev, group[0][0])
+
+        with ThreadPoolExecutor(max_workers=len(queues), thread_name_prefix="scrub") as executor:
+            for future in [executor.submit(self._drain, q, report, total_bytes) for q in queues]:
+                future.result()
+        self.catalog.flush()
+
+        for status in ("mismatch", "missing", "unreadable"):
+            for path in report[status]:
+                self.log_fn(f"Scrub {status}: {path}")
+        verb = "stopped" if self.control.is_cancelled() else "complete"
+        self.log_fn(f"Scrub {verb}: {report['checked']} checked, {report['ok']} ok, {report['baselined']} baselined, "
+                    f"{report['changed']} changed, {len(report['mismatch'])} mismatched, "
+                    f"{len(report['missing'])} missing, {len(report['unreadable'])} unreadable.")
+        return report
+
+    def _drain(self, queue: deque, report: dict, total_bytes: int) -> None:
+        while self.control.checkpoint():
+            try:
+                row = queue.popleft()
+            except IndexError:
+                return
+            status = self._verify(*row)
+            with self._lock:
+                report["checked"] += 1
+                report["bytes"] += row[1] or 0
+                if isinstance(report[status], list):
+                    report[status].append(row[0])
+                else:
+                    report[status] += 1
+                done = report["bytes"]
+            if self.progress_fn and total_bytes:
+                self.progress_fn(int(done * 100 / total_bytes))
+
+    def _verify(self, path: str, size: int | None, mtime: float | None, digest: str | None, tier: str | None) -> str:
+        now = time.time()
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.catalog.record_verification(path, "missing", now)
+            return "missing"
+        except OSError:
+            self.catalog.record_verification(path, "unreadable", now)
+            return "unreadable"
+        if self.throttle:
+            self.throttle.charge_read(st.st_size)
+        actual = FileUtils.full_file_hash(path)
+        if not actual:
+            self.catalog.record_verification(path, "unreadable", now)
+            return "unreadable"
+
+        if tier != "full" or not digest:
+            status = "baselined"
+        elif st.st_size != size or mtime is None or abs(st.st_mtime - mtime) > MTIME_TOLERANCE:
+            status = "changed"
+        elif actual == digest:
+            self.catalog.record_verification(path, "ok", now)
+            return "ok"
+        else:
+            self.catalog.record_verification(path, "mismatch", now)
+            return "mismatch"
+        self.catalog.record_verification(path, "ok", now, actual, st.st_size, st.st_mtime)
+        return status
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="scrub", description="Verify the organized library against its recorded hashes.")
+    parser.add_argument("--db", default=CATALOG_PATH, help="catalog database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="verify the next slice of the library")
+    p.add_argument("root", nargs="?")
+    p.add_argument("--cycle-days", type=float, help="verify the whole library once per this many days")
+    p.add_argument("--max-gb", type=float, help="read at most this much in this run")
+    p.add_argument("--read-mb-per-sec", type=float, help="read rate limit")
+    p = sub.add_parser("status", help="verification coverage")
+    p.add_argument("root", nargs="?")
+    p = sub.add_parser("problems", help="files found damaged, missing or unreadable")
+    p.add_argument("root", nargs="?")
+
+    args = parser.parse_args(argv)
+    catalog = LibraryCatalog(args.db)
+    try:
+        if args.command == "run":
+            scrubber = LibraryScrubber.from_config(ConfigManager.load(), catalog, args.root)
+            if args.cycle_days:
+                scrubber.cycle_days = args.cycle_days
+            if args.max_gb:
+                scrubber.max_bytes = int(args.max_gb * (1 << 30))
+            if args.read_mb_per_sec:
+                scrubber.throttle = Throttle(args.read_mb_per_sec * (1 << 20))
+            report = scrubber.run()
+            return 1 if report["mismatch"] or report["missing"] or report["unreadable"] else 0
+        if args.command == "status":
+            summary = catalog.verification_summary(args.root)
+            for status, count in sorted(summary["counts"].items()):
+                print(f"{status}\t{count}")
+            if summary["oldest"]:
+                print(f"oldest verification\t{datetime.fromtimestamp(summary['oldest']):%Y-%m-%d %H:%M}")
+        elif args.command == "problems":
+            problems = catalog.verification_problems(args.root)
+            for path, status, verified_at in problems:
+                print(f"{status}\t{datetime.fromtimestamp(verified_at):%Y-%m-%d}\t{path}")
+            return 1 if problems else 0
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,524 @@
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager, ExitStack
+
+from organizer import PhotoOrganizer
+from metadata import FileGatherer
+from file_ops import FileUtils
+from config import file_exts, SIDECAR_EXTS, ConfigManager
+from rules import ScanRules
+from backends import ExtractBackend
+
+QUEUE_DIR_NAME = ".photo_organizer_queue"
+
+
+class FileLease:
+    """Exclusive lease backed by a lock file created with O_EXCL, safe on shared (SMB/NFS) volumes.
+
+    The holder keeps the lease alive by touching it; a lease whose mtime is older
+    than ttl is considered abandoned and may be broken by another worker. Breaking
+    renames the file aside and checks the inode, so two workers racing to break the
+    same stale lease cannot both end up owning it.
+    """
+
+    def __init__(self, path: str, owner: str, ttl: float):
+        self.path = path
+        self.owner = owner
+        self.ttl = ttl
+
+    def acquire(self) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._break_if_stale():
+                    return False
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"owner": self.owner, "acquired": time.time()}, f)
+            return True
+        return False
+
+    def _break_if_stale(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        if time.time() - st.st_mtime < self.ttl:
+            return False
+        tomb = f"{self.path}.{os.getpid()}.{threading.get_ident()}.stale"
+        try:
+            os.rename(self.path, tomb)
+        except FileNotFoundError:
+            return True
+        try:
+            if os.stat(tomb).st_ino != st.st_ino:
+                # Someone else broke it first and we moved their fresh lease: put it back.
+                try:
+                    os.link(tomb, self.path)
+                except FileExistsError:
+                    pass
+                return False
+            return True
+        finally:
+            try:
+                os.remove(tomb)
+            except OSError:
+                pass
+
+    def owned(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("owner") == self.owner
+        except Exception:
+            return False
+
+    def renew(self) -> bool:
+        if not self.owned():
+            return False
+        try:
+            os.utime(self.path)
+            return True
+        except OSError:
+            return False
+
+    def release(self) -> None:
+        if self.owned():
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class ShardQueue:
+    """Durable work queue stored as plain files on the library volume itself.
+
+    Layout under <base_dir>/.photo_organizer_queue:
+        manifest.json      run settings and shard count, written last by the coordinator
+        shards/<id>.json   directories making up each shard
+        leases/<id>.lease  held by the worker currently processing a shard
+        done/<id>          marker for a finished shard
+        dest/<hash>.lock   short-lived lock on one destination directory
+
+    Only atomic create/rename/unlink operations are used, so any number of worker
+    processes on any number of hosts can share the queue without a server.
+    """
+
+    SHARD_FILES = 2000
+    LEASE_TTL = 120.0
+    DEST_LOCK_TTL = 60.0
+
+    def __init__(self, base_dir: str, owner: str | None = None):
+        self.base_dir = os.path.abspath(base_dir)
+        self.root = os.path.join(self.base_dir, QUEUE_DIR_NAME)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.manifest: dict = {}
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    # -- coordinator ----------------------------------------------------------
+
+    def create(self, folder_structure: str, separate_videos: bool = False,
+               excluded_folders: list[str] | None = None, shard_files: int = SHARD_FILES, log_fn=print,
+               rules: ScanRules | None = None) -> int:
+        """Enumerate directories into shards; reuses an existing queue so a restarted coordinator is a no-op."""
+        if self.load():
+            log_fn(f"Queue already exists with {self.manifest['shards']} shards.")
+            return self.manifest["shards"]
+        for sub in ("shards", "leases", "done", "dest"):
+            os.makedirs(self._path(sub), exist_ok=True)
+
+        excluded = [os.path.abspath(x) for x in (excluded_folders or [])] + [self.root]
+        rules = rules or ScanRules()
+        shard, shard_count, shard_size = [], 0, 0
+        for root, dirs, files in FileUtils.fast_walk(self.base_dir, rules=rules.with_excluded(excluded)):
+            absroot = os.path.abspath(root)
+            count = sum(1 for f in files if os.path.splitext(f)[1].lower() in file_exts)
+            if not count:
+                continue
+            shard.append(absroot)
+            shard_size += count
+            if shard_size >= shard_files:
+                self._write_shard(shard_count, shard)
+                shard_count += 1
+                shard, shard_size = [], 0
+        if shard:
+            self._write_shard(shard_count, shard)
+            shard_count += 1
+
+        self.manifest = {
+            "shards": shard_count,
+            "folder_structure": folder_structure,
+            "separate_videos": separate_videos,
+            "excluded_folders": excluded,
+            "scan_rules": rules.to_config(),
+            "created": time.time(),
+        }
+        self._write_json(self._path("manifest.json"), self.manifest)
+        log_fn(f"Queued {shard_count} shards under {self.root}.")
+        return shard_count
+
+    def _write_shard(self, shard_id: int, dirs: list[str]) -> None:
+        self._write_json(self._path("shards", f"{shard_id:06d}.json"), {"dirs": dirs})
+
+    @staticmethod
+    def _write_json(path: str, data: dict) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    # -- workers --------------------------------------------------------------
+
+    def load(self) -> bool:
+        try:
+            with open(self._path("manifest.json"), 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            return True
+        except Exception:
+            return False
+
+    def is_done(self, shard_id: int) -> bool:
+        return os.path.exists(self._path("done", f"{shard_id:06d}"))
+
+    def done_count(self) -> int:
+        try:
+            return len(os.listdir(self._path("done")))
+        except OSError:
+            return 0
+
+    def all_done(self) -> bool:
+        return self.done_count() >= self.manifest.get("shards", 0)
+
+    def lease(self) -> tuple[int, list[str], FileLease] | None:
+        """Claim the next unfinished shard nobody holds; None if all are done or leased."""
+        total = self.manifest.get("shards", 0)
+        # Start at an owner-dependent offset so workers don't all contend for shard 0.
+        start = int(hashlib.sha1(self.owner.encode()).hexdigest(), 16) % max(total, 1)
+        for i in range(total):
+            shard_id = (start + i) % total
+            if self.is_done(shard_id):
+                continue
+            lease = FileLease(self._path("leases", f"{shard_id:06d}.lease"), self.owner, self.LEASE_TTL)
+            if not lease.acquire():
+                continue
+            if self.is_done(shard_id):
+                lease.release()
+                continue
+            with open(self._path("shards", f"{shard_id:06d}.json"), 'r', encoding='utf-8') as f:
+                return shard_id, json.load(f)["dirs"], lease
+        return None
+
+    def complete(self, shard_id: int, lease: FileLease) -> None:
+        with open(self._path("done", f"{shard_id:06d}"), 'w', encoding='utf-8') as f:
+            f.write(self.owner)
+        lease.release()
+
+    @contextmanager
+    def destination_lock(self, directory: str, control=None):
+        """Serialize name resolution and moves into one destination directory across all workers."""
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(directory)).encode("utf-8")).hexdigest()
+        lock = FileLease(self._path("dest", f"{key}.lock"), f"{self.owner}:{threading.get_ident()}",
+                         self.DEST_LOCK_TTL)
+        delay = 0.005
+        while not lock.acquire():
+            if control and not control.checkpoint():
+                raise InterruptedError("cancelled while waiting for destination lock")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        try:
+            yield lock
+        finally:
+            lock.release()
+
+
+class ShardWorker(PhotoOrganizer):
+    """Organizer that processes shards leased from a ShardQueue until the queue is drained.
+
+    Several workers (processes or hosts) can run against the same queue. Leases are
+    renewed in the background while a shard is being processed; moves into a
+    destination directory hold that directory's lock, renewed as the moves go on,
+    so collision resolution stays correct across workers. Stem groups (RAW+JPEG
+    twins, sidecars) move together as in a normal run.
+    """
+
+    IDLE_POLL = 2.0
+
+    def __init__(self, queue: ShardQueue, **kwargs):
+        manifest = queue.manifest
+        kwargs.setdefault("separate_videos", manifest.get("separate_videos", False))
+        kwargs.setdefault("excluded_folders", manifest.get("excluded_folders"))
+        kwargs.setdefault("scan_rules", ScanRules.from_config(manifest))
+        super().__init__(queue.base_dir, manifest["folder_structure"], **kwargs)
+        self.queue = queue
+        self._lease: FileLease | None = None
+        self._lease_lost = threading.Event()
+
+    def _renew_loop(self, stop: threading.Event) -> None:
+        while not stop.wait(self.queue.LEASE_TTL / 4):
+            if self._lease and not self._lease.renew():
+                self._log("Lost shard lease; another worker took over.")
+                self._lease_lost.set()
+                return
+
+    def _gather_shard(self, dirs: list[str]) -> list[tuple[str, str | None]]:
+        paths = []
+        rules = self.scan_rules or None
+        exts = set(file_exts) | (set(SIDECAR_EXTS) if self.group_stems else set())
+        for d in dirs:
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if entry.is_file(follow_symlinks=False) and os.path.splitext(entry.name)[1].lower() in exts:
+                            if rules and not rules.accept_file(entry, ScanRules.relative(self.base_dir, entry.path)):
+                                continue
+                            paths.append(entry.path)
+            except OSError:
+                continue
+        files = []
+        if self.group_stems:
+            results = FileGatherer.extract_groups(paths, self.control, None, self.scheduler, self.governor,
+                                                  self.place_index)
+        else:
+            results = FileGatherer.extract_paths(paths, self.control, self.scheduler, self.governor,
+                                                 places=self.place_index)
+        for path, iso_dt, info in results:
+            self._add_group(path, info, info.pop("members", []))
+            files.append((path, iso_dt))
+        return files
+
+    def _move_batch(self, batch, existing_files, dev: int = -1) -> int:
+        # A group goes with its leader's date and holds the lock of every folder it lands in (day/ and day/Raw/),
+        # taken in sorted order so workers can't deadlock; groups landing in the same folders share the locks.
+        by_targets: dict[tuple[str, ...], list[tuple[list[str], str | None]]] = {}
+        for path, date_taken_iso in batch:
+            group = self._group_of(path)
+            targets = tuple(sorted({self._determine_target_directory(p, date_taken_iso) for p in group}))
+            by_targets.setdefault(targets, []).append((group, date_taken_iso))
+
+        moved_count = 0
+        with self.scheduler.device_slot(dev, batch[0][0]):
+            for targets, groups in by_targets.items():
+                if not self.control.checkpoint() or self._lease_lost.is_set():
+                    break
+                try:
+                    with ExitStack() as stack:
+                        locks = [stack.enter_context(self.queue.destination_lock(t, self.control)) for t in targets]
+                        renewed = time.monotonic()
+                        for group, date_taken_iso in groups:
+                            if time.monotonic() - renewed >= self.queue.DEST_LOCK_TTL / 4:
+                                for target, lock in zip(targets, locks):
+                                    if not lock.renew():
+                                        # Moves are no-clobber, so a worker that broke the lock can't overwrite ours.
+                                        self._log(f"Destination lock for {target} was taken over.")
+                                renewed = time.monotonic()
+                            # Another worker may have handled these files after taking over a stale lease.
+                            group = [p for p in group if os.path.exists(p)]
+                            if group:
+                                moved_count += self._move_group(group, date_taken_iso, existing_files)
+                except InterruptedError:
+                    break
+        return moved_count
+
+    def _organize(self) -> None:
+        total = self.queue.manifest.get("shards", 0)
+        self._log(f"Worker {self.queue.owner} joining queue with {total} shards.")
+        self._emit_progress(int(self.queue.done_count() * 100 / total) if total else 100)
+        processed = 0
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew_loop, args=(stop,), daemon=True)
+        renewer.start()
+        try:
+            while self.control.checkpoint():
+                claimed = self.queue.lease()
+                if claimed is None:
+                    if self.queue.all_done():
+                        break
+                    # Remaining shards are leased by others; wait in case a lease goes stale.
+                    time.sleep(self.IDLE_POLL)
+                    continue
+                shard_id, dirs, lease = claimed
+                self._lease = lease
+                self._lease_lost.clear()
+                files = self._gather_shard(dirs)
+                # Moves count every member of a stem group, so the total does too.
+                count = len(files) + sum(len(self._stem_members.get(path, ())) for path, _ in files)
+                moved = self._run_moves(files)
+                if self.is_cancelled() or self._lease_lost.is_set():
+                    lease.release()
+                    self._lease = None
+                    continue
+                self.queue.complete(shard_id, lease)
+                self._lease = None
+                processed += 1
+                self._log(f"Shard {shard_id}: moved {moved} of {count} files.")
+                self._emit_progress(int(self.queue.done_count() * 100 / total) if total else 100)
+        finally:
+            stop.set()
+            if self._lease:
+                self._lease.release()
+
+        if self.is_cancelled():
+            self._log(f"Worker cancelled after {processed} shards; unfinished shards stay queued.")
+        else:
+            self._emit_progress(100)
+            self._log(f"Queue drained; this worker processed {processed} shards.")
+
+
+def _scratch_library(base_dir: str, files: int) -> None:
+    """Generated photos with clashing names across folders; every fourth has a RAW twin and an .xmp."""
+    import random
+    from PIL import Image
+
+    for i in range(files):
+        folder = os.path.join(base_dir, "incoming", f"card{i % 8}", f"dcim{i % 3}")
+        os.makedirs(folder, exist_ok=True)
+        stem = os.path.join(folder, f"IMG_{i % 60}")
+        exif = Image.Exif()
+        exif.get_ifd(0x8769)[0x9003] = f"2020:01:{1 + i % 5:02d} 10:00:00"
+        Image.frombytes('RGB', (8, 8), random.randbytes(192)).save(stem + ".jpg", exif=exif)
+        if i % 4 == 0:
+            with open(stem + ".CR2", 'wb') as f:
+                f.write(os.urandom(256))
+            with open(stem + ".xmp", 'w', encoding='utf-8') as f:
+                f.write(f"<x:xmpmeta>{i}</x:xmpmeta>")
+
+
+def _library_contents(base_dir: str) -> dict[str, int]:
+    """Count of files per content hash, outside the queue folder."""
+    counts: dict[str, int] = {}
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = [d for d in dirs if d != QUEUE_DIR_NAME]
+        for name in files:
+            digest = FileUtils.full_file_hash(os.path.join(root, name))
+            counts[digest] = counts.get(digest, 0) + 1
+    return counts
+
+
+def _orphan_sidecars(base_dir: str) -> list[str]:
+    """Sidecars with no file of their stem (IMG_1.xmp -> IMG_1.*, IMG_1.CR2.xmp -> IMG_1.CR2) beside them."""
+    orphans = []
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = [d for d in dirs if d != QUEUE_DIR_NAME]
+        others = {n.lower() for n in files if os.path.splitext(n)[1].lower() not in SIDECAR_EXTS}
+        stems = {os.path.splitext(n)[0] for n in others}
+        for name in files:
+            stem, ext = os.path.splitext(name.lower())
+            if ext in SIDECAR_EXTS and stem not in stems and stem not in others:
+                orphans.append(os.path.join(root, name))
+    return orphans
+
+
+def run_local(base_dir: str | None, workers: int, threads: int, structure: str, shard_files: int,
+              scratch_files: int) -> int:
+    """Coordinate base_dir and drain its queue with several worker processes on this machine.
+
+    Without base_dir a scratch library is generated in the temp directory, organized,
+    checked and removed: every file must still be there exactly once, none may be
+    left in the incoming folders, and every sidecar must sit next to a file of its stem.
+    """
+    import shutil
+    import tempfile
+    import subprocess
+
+    scratch = base_dir is None
+    if scratch:
+        base_dir = tempfile.mkdtemp(prefix="shards_local_")
+        _scratch_library(base_dir, scratch_files)
+        shard_files = max(1, scratch_files // (workers * 4))
+        before = _library_contents(base_dir)
+    try:
+        queue = ShardQueue(base_dir)
+        queue.create(structure, shard_files=shard_files, rules=ScanRules.from_config(ConfigManager.load()))
+        started = time.monotonic()
+        procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "work", base_dir, "--threads", str(threads)],
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                 for _ in range(workers)]
+
+        def relay(n, proc):
+            for line in proc.stdout:
+                print(f"[worker {n}] {line.rstrip()}", flush=True)
+
+        relays = [threading.Thread(target=relay, args=(n, proc), daemon=True) for n, proc in enumerate(procs, 1)]
+        for t in relays:
+            t.start()
+        codes = [proc.wait() for proc in procs]
+        for t in relays:
+            t.join()
+        queue.load()
+        print(f"{workers} workers drained {queue.done_count()}/{queue.manifest['shards']} shards "
+              f"in {time.monotonic() - started:.1f}s (exit codes {codes}).")
+        ok = queue.all_done() and not any(codes)
+        if scratch:
+            left = [os.path.join(root, f) for root, _, files in os.walk(os.path.join(base_dir, "incoming"))
+                    for f in files]
+            orphans = _orphan_sidecars(base_dir)
+            same = _library_contents(base_dir) == before
+            print(f"Contents {'unchanged' if same else 'CHANGED'}, {len(left)} files left in incoming, "
+                  f"{len(orphans)} sidecars apart from their file.")
+            ok = ok and same and not left and not orphans
+        print("OK" if ok else "FAILED")
+        return 0 if ok else 1
+    finally:
+        if scratch:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="shards", description="Organize one library with several cooperating workers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("coordinate", help="enumerate the library into a shared queue")
+    p.add_argument("base_dir")
+    p.add_argument("--structure", default="day",
+                   choices=("day", "year_month_day", "year_month", "year_day", "year_location", "location_day"))
+    p.add_argument("--separate-videos", action="store_true")
+    p.add_argument("--exclude", action="append", default=[], help="folder to skip (repeatable)")
+    p.add_argument("--shard-files", type=int, default=ShardQueue.SHARD_FILES, help="approximate files per shard")
+    ScanRules.add_arguments(p)
+    p = sub.add_parser("work", help="process shards until the queue is drained")
+    p.add_argument("base_dir")
+    p.add_argument("--threads", type=int, default=4, help="move threads in this worker")
+    p = sub.add_parser("status", help="show queue progress")
+    p.add_argument("base_dir")
+    p = sub.add_parser("local", help="coordinate and drain a queue with several workers on this machine")
+    p.add_argument("base_dir", nargs="?", help="library to organize (default: a generated scratch library, checked afterwards)")
+    p.add_argument("--workers", type=int, default=3, help="worker processes to start")
+    p.add_argument("--threads", type=int, default=2, help="move threads in each worker")
+    p.add_argument("--structure", default="day",
+                   choices=("day", "year_month_day", "year_month", "year_day", "year_location", "location_day"))
+    p.add_argument("--shard-files", type=int, default=ShardQueue.SHARD_FILES, help="approximate files per shard")
+    p.add_argument("--files", type=int, default=400, help="photos in the scratch library")
+
+    args = parser.parse_args(argv)
+    if args.command == "local":
+        return run_local(args.base_dir and os.path.abspath(args.base_dir), args.workers, args.threads,
+                         args.structure, args.shard_files, args.files)
+    queue = ShardQueue(args.base_dir)
+    if args.command == "coordinate":
+        queue.create(args.structure, args.separate_videos, args.exclude, args.shard_files,
+                     rules=ScanRules.from_args(args, ConfigManager.load()))
+        return 0
+    if not queue.load():
+        print(f"No queue under {args.base_dir}; run 'coordinate' first.")
+        return 1
+    if args.command == "status":
+        print(f"{queue.done_count()}/{queue.manifest['shards']} shards done")
+        return 0
+
+    ExtractBackend.configure(ConfigManager.load())
+    worker = ShardWorker(queue, max_workers=args.threads)
+    worker.log_msg.connect(print)
+    worker.organize()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+import os
+import sys
+import math
+import argparse
+import itertools
+
+from PIL import Image
+
+from config import CATALOG_PATH, PHOTO_EXTS, RAW_EXTS, ConfigManager
+from control import RunControl
+from catalog import LibraryCatalog
+from metadata import FileGatherer
+from file_ops import FileMover
+from rules import ScanRules
+
+# Hamming distance (out of 64 bits) up to which two photos count as near-duplicates.
+DEFAULT_THRESHOLD = 8
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """Multi-index hash table for radius queries over 64-bit perceptual hashes.
+
+    Hashes are split into m disjoint chunks, each indexed in its own table. If two
+    hashes differ in at most radius bits, at least one chunk differs in at most
+    radius // m bits (pigeonhole), so a query only probes the few chunk values near
+    its own in each table and verifies those candidates. m is picked from the
+    expected size so that probes and bucket sizes stay small as the library grows.
+    """
+
+    BITS = 64
+
+    def __init__(self, radius: int, expected: int = 0):
+        self.radius = radius
+        m = self._chunk_count(radius, max(expected, 1))
+        widths = [self.BITS // m + (1 if i < self.BITS % m else 0) for i in range(m)]
+        self._shifts, shift = [], self.BITS
+        for w in widths:
+            shift -= w
+            self._shifts.append((shift, (1 << w) - 1))
+        flips = radius // m
+        self._probes = [self._masks(w, flips) for w in widths]
+        self._tables: list[dict[int, list[int]]] = [{} for _ in widths]
+        self._values: list[int] = []
+        self._items: list = []
+
+    @classmethod
+    def _chunk_count(cls, radius: int, n: int) -> int:
+        # Cost per query ~ probes per chunk x (lookup + expected bucket size x candidate check),
+        # summed over chunks; checking a candidate costs several times a dict lookup.
+        def cost(m):
+            w = cls.BITS // m
+            probes = sum(math.comb(w, k) for k in range(radius // m + 1))
+            return m * probes * (1 + 8 * n / 2 ** w)
+        # m = 1 is a single exact-match table, the only sensible choice for radius 0.
+        return min(range(1, radius + 2), key=cost)
+
+    @staticmethod
+    def _masks(width: int, flips: int) -> list[int]:
+        masks = [0]
+        for k in range(1, flips + 1):
+            for bits in itertools.combinations(range(width), k):
+                masks.append(sum(1 << b for b in bits))
+        return masks
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, value: int, item) -> None:
+        idx = len(self._values)
+        self._values.append(value)
+        self._items.append(item)
+        for table, (shift, mask) in zip(self._tables, self._shifts):
+            table.setdefault((value >> shift) & mask, []).append(idx)
+
+    def search(self, value: int) -> list[tuple[int, object]]:
+        """All (distance, item) pairs within the table's radius of value."""
+        values, radius, found = self._values, self.radius, {}
+        for table, (shift, mask), probes in zip(self._tables, self._shifts, self._probes):
+            key = (value >> shift) & mask
+            for bucket in filter(None, map(table.get, map(key.__xor__, probes))):
+                for idx in bucket:
+                    d = (value ^ values[idx]).bit_count()
+                    if d <= radius:
+                        found[idx] = d
+        return [(d, self._items[idx]) for idx, d in found.items()]
+
+
+def group_similar(hashes: dict[str, int], threshold: int = DEFAULT_THRESHOLD, control: RunControl | None = None) -> list[list[str]]:
+    """Cluster paths whose hashes lie within threshold of each other (transitively).
+
+    Each hash is looked up in the index built so far and then inserted, so every
+    near pair is found once without comparing all pairs.
+    """
+    parent = {p: p for p in hashes}
+
+    def find(p):
+        while parent[p] != p:
+            parent[p] = parent[parent[p]]
+            p = parent[p]
+        return p
+
+    index = MultiIndexHash(threshold, len(hashes))
+    for path, value in hashes.items():
+        if control and not control.checkpoint():
+            return []
+        for _, other in index.search(value):
+            a, b = find(path), find(other)
+            if a != b:
+                parent[a] = b
+        index.add(value, path)
+
+    groups: dict[str, list[str]] = {}
+    for path in hashes:
+        groups.setdefault(find(path), []).append(path)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def _rank(path: str) -> tuple:
+    # Keep the highest-resolution copy; prefer camera formats, then the least recompressed (largest) file.
+    ext = os.path.splitext(path)[1].lower()
+    pixels = 0
+    if ext not in RAW_EXTS:
+        try:
+            with Image.open(path) as img:
+                pixels = img.width * img.height
+        except Exception:
+            pass
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    kind = 0 if ext in RAW_EXTS else 1 if ext in (".jpg", ".jpeg") else 2
+    return (kind != 0, -pixels, kind, -size, path)
+
+
+def find_similar(root: str, excluded_folders: list[str] | None = None, threshold: int = DEFAULT_THRESHOLD,
+                 catalog: LibraryCatalog | None = None, control: RunControl | None = None,
+                 progress_fn=None, log_fn=None, rules: ScanRules | None = None) -> list[list[str]]:
+    """Groups of near-duplicate photos under root, best copy first.
+
+    Hashes are computed in the metadata extraction pool and cached in the catalog,
+    so files whose size and mtime are unchanged are not read again on later runs.
+    """
+    control = control or RunControl()
+    log_fn = log_fn or (lambda msg: None)
+    exts = tuple(PHOTO_EXTS) + tuple(RAW_EXTS)
+    cached = catalog.phashes(root) if catalog else {}
+
+    hashes, pending = {}, []
+    for path in FileGatherer.scan_files(root, exts, excluded_folders, control, rules=rules):
+        path = os.path.abspath(path)
+        entry = cached.get(path)
+        if entry:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if entry[0] == st.st_size and entry[1] == st.st_mtime:
+                hashes[path] = entry[2]
+                continue
+        pending.append(path)
+    if control.is_cancelled():
+        return []
+
+    total = len(hashes) + len(pending)
+    log_fn(f"Hashing {len(pending)} photos ({len(hashes)} cached)...")
+    done = len(hashes)
+    for path, iso_dt, info in FileGatherer.extract_paths(pending, control, phash=True):
+        done += 1
+        if progress_fn:
+            progress_fn(done, total)
+        value = info.get("phash")
+        if value is None:
+            continue
+        hashes[path] = value
+        if catalog:
+            catalog.record(path, iso_dt, info.get("camera"), phash=value)
+    if catalog:
+        catalog.flush()
+    if control.is_cancelled():
+        return []
+
+    groups = [sorted(g, key=_rank) for g in group_similar(hashes, threshold, control)]
+    groups.sort(key=lambda g: g[0])
+    log_fn(f"Found {len(groups)} groups of similar photos ({sum(len(g) - 1 for g in groups)} extra copies).")
+    return groups
+
+
+def quarantine(groups: list[list[str]], root: str, quarantine_dir: str, catalog: LibraryCatalog | None = None,
+               control: RunControl | None = None, log_fn=None) -> int:
+    """Move all but the first photo of each group into quarantine_dir, keeping paths relative to root."""
+    log_fn = log_fn or (lambda msg: None)
+    moved = 0
+    for group in groups:
+        for src in group[1:]:
+            if control and not control.checkpoint():
+                return moved
+            rel = os.path.relpath(src, root)
+            dest = os.path.join(quarantine_dir, rel if not rel.startswith("..") else os.path.basename(src))
+            try:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                dest = FileMover.move_noclobber(src, dest)
+                if dest is None:
+                    log_fn(f"Skipped {src}, identical copy already quarantined")
+                    continue
+                if catalog:
+                    catalog.rename(src, dest)
+                moved += 1
+                log_fn(f"Quarantined {src} (similar to {group[0]})")
+            except Exception as e:
+                log_fn(f"Error quarantining {src}: {e}")
+    if catalog:
+        catalog.flush()
+    return moved
+
+
+def _threshold(value: str) -> int:
+    bits = int(value)
+    if not 0 <= bits <= MultiIndexHash.BITS:
+        raise argparse.ArgumentTypeError(f"must be between 0 and {MultiIndexHash.BITS}")
+    return bits
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="similar", description="Find near-duplicate photos.")
+    parser.add_argument("root")
+    parser.add_argument("--threshold", type=_threshold, default=DEFAULT_THRESHOLD,
+                        help=f"max differing hash bits out of 64 (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--quarantine", metavar="DIR", help="move all but the best copy of each group here")
+    parser.add_argument("--exclude", action="append", default=[], help="folder to skip (repeatable)")
+    parser.add_argument("--db", default=CATALOG_PATH, help="catalog database used to cache hashes")
+    ScanRules.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(args.root)
+    excluded = args.exclude + ([args.quarantine] if args.quarantine else [])
+    catalog = LibraryCatalog(args.db)
+    try:
+        groups = find_similar(root, excluded, args.threshold, catalog, log_fn=print,
+                              rules=ScanRules.from_args(args, ConfigManager.load()))
+        for group in groups:
+            print(group[0])
+            for path in group[1:]:
+                print(f"  ~ {path}")
+        if args.quarantine and groups:
+            print(f"Quarantined {quarantine(groups, root, os.path.abspath(args.quarantine), catalog, log_fn=print)} files.")
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+from collections import deque
+
+from config import SNAPSHOT_DIR
+from rules import ScanRules
+
+
+class DirectorySnapshot:
+    """Per-library record of directory mtimes used to skip unchanged folders on rescans.
+
+    Each directory maps to (mtime_ns, entry count, child directory names). On an
+    incremental walk every known directory is stat'ed, but only those whose mtime
+    changed are listed again. Directory mtimes only reflect direct entries, so the
+    walk still descends through unchanged directories using the stored child list.
+
+    signature describes the settings a run organizes by (layout, rules). Skipping a
+    folder is only safe when the last walk was done under the same ones, so any
+    difference forces a full walk.
+    """
+
+    FULL_VERIFY_EVERY = 10
+    # Directories modified this close to the snapshot time may change again within the
+    # same mtime tick (FAT/SMB have 2 s granularity), so they are always re-listed.
+    RACY_WINDOW_NS = 2_000_000_000
+
+    def __init__(self, base_dir: str, path: str | None = None, full_verify_every: int = FULL_VERIFY_EVERY,
+                 signature: str = ""):
+        self.base_dir = os.path.abspath(base_dir)
+        if path is None:
+            digest = hashlib.sha1(os.path.normcase(self.base_dir).encode("utf-8")).hexdigest()[:16]
+            path = os.path.join(SNAPSHOT_DIR, f"{digest}.json")
+        self.path = path
+        self.full_verify_every = full_verify_every
+        self.entries: dict[str, tuple[int, int, list[str]]] = {}
+        self.taken_ns = 0
+        self.runs_since_full = 0
+        self.signature = signature
+        self.saved_signature = signature
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            return False
+        if data.get("base_dir") != self.base_dir:
+            return False
+        self.entries = {d: (e[0], e[1], e[2]) for d, e in data.get("entries", {}).items()}
+        self.taken_ns = data.get("taken_ns", 0)
+        self.runs_since_full = data.get("runs_since_full", 0)
+        self.saved_signature = data.get("signature", "")
+        return bool(self.entries)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.taken_ns = time.time_ns()
+        data = {
+            "base_dir": self.base_dir,
+            "taken_ns": self.taken_ns,
+            "runs_since_full": self.runs_since_full,
+            "signature": self.signature,
+            "entries": self.entries,
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+        self.saved_signature = self.signature
+
+    def settings_changed(self) -> bool:
+        return self.saved_signature != self.signature
+
+    def needs_full_verify(self) -> bool:
+        return not self.entries or self.runs_since_full >= self.full_verify_every or self.settings_changed()
+
+    def _is_unchanged(self, directory: str, mtime_ns: int) -> bool:
+        old = self.entries.get(directory)
+        return old is not None and old[0] == mtime_ns and old[0] < self.taken_ns - self.RACY_WINDOW_NS
+
+    @staticmethod
+    def _list(directory: str, top: str = "", rules: ScanRules | None = None) -> tuple[list[str], list[str], int]:
+        """(all subdirectories, files passing rules, total entry count) of one directory."""
+        dirs, files, count = [], [], 0
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                        count += 1
+                    elif entry.is_file(follow_symlinks=False):
+                        count += 1
+                        if rules and not rules.accept_file(entry, ScanRules.relative(top, entry.path)):
+                            continue
+                        files.append(entry.name)
+                except Exception:
+                    continue
+        return dirs, files, count
+
+    def walk(self, top: str | None = None, full: bool | None = None, rules: ScanRules | None = None):
+        """Yield (dir, subdirs, files) like FileUtils.fast_walk, for changed directories only.
+
+        The snapshot always records the unfiltered listing, so changing rules never
+        hides folders from later walks; rules only filter what is yielded and descended.
+        """
+        top = os.path.abspath(top or self.base_dir)
+        if full is None:
+            full = self.needs_full_verify()
+        self.runs_since_full = 0 if full else self.runs_since_full + 1
+        rules = rules or None
+
+        queue = deque([top])
+        while queue:
+            current_dir = queue.popleft()
+            try:
+                mtime_ns = os.stat(current_dir).st_mtime_ns
+            except OSError:
+                self.entries.pop(current_dir, None)
+                continue
+
+            if not full and self._is_unchanged(current_dir, mtime_ns):
+                children = [os.path.join(current_dir, c) for c in self.entries[current_dir][2]]
+                queue.extend(self._kept_dirs(children, top, rules))
+                continue
+
+            try:
+                dirs, files, count = self._list(current_dir, top, rules)
+            except (PermissionError, FileNotFoundError):
+                continue
+            self.entries[current_dir] = (mtime_ns, count, [os.path.basename(d) for d in dirs])
+            dirs = self._kept_dirs(dirs, top, rules)
+            yield current_dir, dirs, files
+            queue.extend(dirs)
+
+    @staticmethod
+    def _kept_dirs(dirs: list[str], top: str, rules: ScanRules | None) -> list[str]:
+        if not rules:
+            return dirs
+        return [d for d in dirs if not rules.skip_dir(d, ScanRules.relative(top, d))]
+
+    def refresh(self, directories, failed=()) -> None:
+        """Re-record directories the run itself modified (and their ancestors) so they count as unchanged.
+
+        Directories in failed, where some moves failed, are forgotten instead, so the
+        next incremental walk lists them again and retries the files left there.
+        """
+        failed = {os.path.abspath(d) for d in failed}
+        pending = set()
+        for d in directories:
+            d = os.path.abspath(d)
+            while (d == self.base_dir or d.startswith(self.base_dir + os.sep)) and d not in pending:
+                pending.add(d)
+                if d == self.base_dir:
+                    break
+                d = os.path.dirname(d)
+
+        pending -= failed
+        for d in failed:
+            self.entries.pop(d, None)
+        queue = deque(sorted(pending, key=lambda p: p.count(os.sep)))
+        while queue:
+            current_dir = queue.popleft()
+            try:
+                mtime_ns = os.stat(current_dir).st_mtime_ns
+                dirs, _, count = self._list(current_dir)
+            except OSError:
+                self.entries.pop(current_dir, None)
+                continue
+            self.entries[current_dir] = (mtime_ns, count, [os.path.basename(d) for d in dirs])
+            queue.extend(d for d in dirs if d not in self.entries and d not in pending and d not in failed)
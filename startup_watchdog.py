@@ -3,7 +3,6 @@ import os
 import subprocess
 import winreg
 import signal
-import psutil
 from pathlib import Path
 
 from PySide6.QtWidgets import QApplication, QSystemTrayIcon, QMenu
@@ -11,7 +10,8 @@ from PySide6.QtGui import QIcon, QAction
 from PySide6.QtCore import QObject, Signal
 
 from typing import Optional
-from config import REG_NAME, WINDOWS_RUN_KEY, main_icon
+from config import REG_NAME, WINDOWS_RUN_KEY, GUI_LOCK_PATH, main_icon
+from daemon import OrganizerDaemon, DaemonClient, InstanceLock
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -68,18 +68,19 @@ def launch_watchdog() -> None:
 
 
 def kill_watchdog_process() -> None:
-    current_pid = os.getpid()
-    script_name = Path(__file__).name
-    for proc in psutil.process_iter(['pid', 'cmdline']):
+    """Ask the background daemon to exit over its socket; fall back to the pid in its lock file."""
+    client = DaemonClient()
+    if client.connect_to_daemon():
         try:
-            if proc.pid == current_pid:
-                continue
-            cmdline = proc.info['cmdline']
-            if cmdline and any(script_name in part for part in cmdline):
-                proc.send_signal(signal.SIGTERM)
-                print(f"Killed watchdog process PID {proc.pid}")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
+            client.shutdown()
+            print("Asked the watchdog process to quit.")
+            return
+        except (RuntimeError, TimeoutError):
+            pass
+    pid = DaemonClient.running_pid()
+    if pid and pid != os.getpid():
+        os.kill(pid, signal.SIGTERM)
+        print(f"Killed watchdog process PID {pid}")
 
 
 def install_watchdog() -> None:
@@ -118,14 +119,10 @@ def launch_main_app() -> None:
     base_dir = Path(__file__).resolve().parent
     main_py = base_dir / "main.py"
 
-    for proc in psutil.process_iter(['pid', 'cmdline']):
-        try:
-            cmdline = proc.info['cmdline']
-            if cmdline and sys.executable in cmdline and str(main_py) in cmdline:
-                print(f"Main app already running (PID {proc.pid})")
-                return
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
+    pid = InstanceLock(GUI_LOCK_PATH).owner_pid()
+    if pid:
+        print(f"Main app already running (PID {pid})")
+        return
     if main_py.exists():
         subprocess.Popen([sys.executable, str(main_py)], close_fds=True)
         print(f"Launched main app: {main_py}")
@@ -135,6 +132,10 @@ def launch_main_app() -> None:
 
 def create_tray_icon():
     app = QApplication(sys.argv)
+    daemon = OrganizerDaemon()
+    if not daemon.start():
+        print(f"Background process already running (PID {DaemonClient.running_pid()})")
+        sys.exit(0)
     icon = main_icon
     if icon.isNull():
         icon = QIcon()
@@ -151,6 +152,9 @@ def create_tray_icon():
     menu.addAction(quit_action)
 
     tray_icon.setContextMenu(menu)
+    daemon.job_finished.connect(lambda job_id, cancelled: tray_icon.showMessage(
+        "Photo Organizer", f"Job {job_id} {'cancelled' if cancelled else 'finished'}"))
+    app.aboutToQuit.connect(daemon.stop)
     app.aboutToQuit.connect(lambda: print("Application is quitting..."))
     sys.exit(app.exec())
 
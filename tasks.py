@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, Signal
+
+from control import RunControl
+
+
+class TaskContext:
+    """Handed to each task function: cancellation/pause token plus progress and log reporting."""
+
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, manager: "TaskManager", task_id: int, name: str, root: str):
+        self.manager = manager
+        self.task_id = task_id
+        self.name = name
+        self.root = root
+        self.control = RunControl()
+        self.started = time.monotonic()
+        self.done = 0
+        self.total = 0
+        self._last_emit = 0.0
+
+    def checkpoint(self) -> bool:
+        return self.control.checkpoint()
+
+    def progress(self, done: int, total: int = 0) -> None:
+        self.done, self.total = done, total or self.total
+        now = time.monotonic()
+        if now - self._last_emit >= self.PROGRESS_INTERVAL or (self.total and done >= self.total):
+            self._last_emit = now
+            rate = done / max(now - self.started, 1e-6)
+            self.manager.task_progress.emit(self.task_id, done, self.total, rate)
+
+    def log(self, msg: str) -> None:
+        self.manager.log_msg.emit(msg)
+
+
+class TaskManager(QObject):
+    """Runs long file operations (flatten, clean filenames, prune) off the GUI thread.
+
+    Tasks are queued on a small worker pool. Each one claims its folder tree, and a
+    task whose tree overlaps a queued or running one is refused.
+    """
+
+    task_started = Signal(int, str)
+    task_progress = Signal(int, int, int, float)
+    task_finished = Signal(int, str, bool)
+    log_msg = Signal(str)
+
+    def __init__(self, max_workers: int = 2):
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task")
+        self._ids = itertools.count(1)
+        self._tasks: dict[int, TaskContext] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def overlaps(a: str, b: str) -> bool:
+        a, b = os.path.normcase(os.path.abspath(a)), os.path.normcase(os.path.abspath(b))
+        return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+    def conflicting_task(self, root: str) -> TaskContext | None:
+        with self._lock:
+            for ctx in self._tasks.values():
+                if self.overlaps(ctx.root, root):
+                    return ctx
+        return None
+
+    def submit(self, name: str, root: str, func) -> int | None:
+        """Queue func(root, ctx); returns the task id, or None if the tree is already busy."""
+        with self._lock:
+            for ctx in self._tasks.values():
+                if self.overlaps(ctx.root, root):
+                    self.log_msg.emit(f"Refusing {name}: {ctx.name} is already working on {ctx.root}")
+                    return None
+            task_id = next(self._ids)
+            ctx = TaskContext(self, task_id, name, root)
+            self._tasks[task_id] = ctx
+        self._executor.submit(self._run, func, ctx)
+        self.log_msg.emit(f"Queued {name} for {root}")
+        return task_id
+
+    def _run(self, func, ctx: TaskContext) -> None:
+        if not ctx.checkpoint():
+            self._finish(ctx, f"{ctx.name} cancelled before it started", False)
+            return
+        ctx.started = time.monotonic()
+        self.task_started.emit(ctx.task_id, ctx.name)
+        try:
+            func(ctx.root, ctx)
+        except Exception as e:
+            self._finish(ctx, f"Error during {ctx.name}: {e}", False)
+            return
+        elapsed = time.monotonic() - ctx.started
+        if ctx.control.is_cancelled():
+            self._finish(ctx, f"Cancelled {ctx.name} after {ctx.done} items", False)
+        else:
+            rate = ctx.done / max(elapsed, 1e-6)
+            self._finish(ctx, f"Completed {ctx.name} under: {ctx.root} "
+                              f"({ctx.done} items in {elapsed:.1f}s, {rate:.0f}/s)", True)
+
+    def _finish(self, ctx: TaskContext, msg: str, ok: bool) -> None:
+        with self._lock:
+            self._tasks.pop(ctx.task_id, None)
+        self.log_msg.emit(msg)
+        self.task_finished.emit(ctx.task_id, msg, ok)
+
+    def cancel(self, task_id: int | None = None) -> None:
+        with self._lock:
+            targets = list(self._tasks.values()) if task_id is None else [self._tasks.get(task_id)]
+        for ctx in targets:
+            if ctx:
+                ctx.control.cancel()
+
+    def has_active(self) -> bool:
+        with self._lock:
+            return bool(self._tasks)
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import LibraryCatalog
+
+
+class RecordMoveTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.lib = os.path.join(self.root.name, "lib")
+        os.makedirs(os.path.join(self.lib, "2020"))
+        self.catalog = LibraryCatalog(os.path.join(self.root.name, "catalog.db"))
+
+    def tearDown(self):
+        self.catalog.close()
+        self.root.cleanup()
+
+    def paths(self) -> list[str]:
+        self.catalog.flush()
+        return sorted(os.path.relpath(row[0], self.lib) for row in self.catalog._query("SELECT path FROM files"))
+
+    def move(self, src: str, dest: str) -> None:
+        os.rename(src, dest)
+        self.catalog.record_move(src, dest, "2020-03-04T10:00:00")
+
+    def test_move_within_library_replaces_the_source_row(self):
+        src, dest = os.path.join(self.lib, "a.jpg"), os.path.join(self.lib, "2020", "a.jpg")
+        with open(src, 'wb') as f:
+            f.write(b"photo")
+        self.catalog.record(src, source_path="/card/a.jpg", hash_value="full-hash", hash_tier="full",
+                            verified_at=1.0)
+        self.move(src, dest)
+        self.assertEqual(self.paths(), [os.path.join("2020", "a.jpg")])
+        self.assertEqual(self.catalog.count(), 1)
+        self.assertEqual(self.catalog._query("SELECT source_path, hash, hash_tier, capture_day FROM files"),
+                         [("/card/a.jpg", "full-hash", "full", "2020-03-04")])
+
+    def test_move_from_outside_adds_a_row(self):
+        src, dest = os.path.join(self.root.name, "b.jpg"), os.path.join(self.lib, "2020", "b.jpg")
+        with open(src, 'wb') as f:
+            f.write(b"photo")
+        self.move(src, dest)
+        self.assertEqual(self.paths(), [os.path.join("2020", "b.jpg")])
+        self.assertEqual(self.catalog._query("SELECT source_path, hash_tier FROM files"), [(src, "quick")])
+
+    def test_stale_row_at_destination_is_replaced(self):
+        src, dest = os.path.join(self.lib, "c.jpg"), os.path.join(self.lib, "2020", "c.jpg")
+        with open(src, 'wb') as f:
+            f.write(b"photo")
+        self.catalog.record(src)
+        self.catalog.record(dest)
+        self.move(src, dest)
+        self.assertEqual(self.paths(), [os.path.join("2020", "c.jpg")])
+
+
+if __name__ == "__main__":
+    unittest.main()
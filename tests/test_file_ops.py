@@ -0,0 +1,79 @@
+import os
+import sys
+import random
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import QCoreApplication
+from PIL import Image
+
+from file_ops import FileMover, FileUtils
+from organizer import PhotoOrganizer
+
+app = QCoreApplication.instance() or QCoreApplication([])
+
+
+def write_jpeg(path: str, date: str = "2020:02:02 10:00:00") -> None:
+    exif = Image.Exif()
+    exif.get_ifd(0x8769)[0x9003] = date
+    Image.frombytes('RGB', (8, 8), random.randbytes(192)).save(path, exif=exif)
+
+
+def write_bytes(path: str, data: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class StemGroupCollisionTest(unittest.TestCase):
+    def setUp(self):
+        FileUtils.reset_seen()
+        self.root = tempfile.TemporaryDirectory()
+        self.lib = os.path.join(self.root.name, "lib")
+        self.card = os.path.join(self.root.name, "card")
+        self.day = os.path.join(self.lib, "2020-02-02")
+        os.makedirs(self.day)
+        os.makedirs(self.card)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def organize(self) -> list[str]:
+        organizer = PhotoOrganizer(self.card, "day", 2, target_root=self.lib)
+        logs = []
+        organizer._log = logs.append
+        organizer.organize()
+        return logs
+
+    def test_group_shares_suffix_when_photo_name_is_taken(self):
+        write_jpeg(os.path.join(self.day, "IMG_5.jpg"))
+        write_jpeg(os.path.join(self.card, "IMG_5.jpg"))
+        write_bytes(os.path.join(self.card, "IMG_5.xmp"), b"edit")
+        self.organize()
+        self.assertEqual(sorted(os.listdir(self.day)), ["IMG_5.jpg", "IMG_5_1.jpg", "IMG_5_1.xmp"])
+        self.assertEqual(os.listdir(self.card), [])
+
+    def test_suffix_is_checked_against_every_member(self):
+        write_jpeg(os.path.join(self.day, "IMG_5.jpg"))
+        os.makedirs(os.path.join(self.day, "Raw"))
+        write_bytes(os.path.join(self.day, "Raw", "IMG_5_1.CR2"), os.urandom(64))
+        write_jpeg(os.path.join(self.card, "IMG_5.jpg"))
+        write_bytes(os.path.join(self.card, "IMG_5.CR2"), os.urandom(64))
+        write_bytes(os.path.join(self.card, "IMG_5.CR2.xmp"), b"raw edit")
+        self.organize()
+        self.assertIn("IMG_5_2.jpg", os.listdir(self.day))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.day, "Raw"))),
+                         ["IMG_5_1.CR2", "IMG_5_2.CR2", "IMG_5_2.CR2.xmp"])
+
+    def test_identical_member_is_skipped_and_rest_keep_the_stem(self):
+        write_bytes(os.path.join(self.day, "IMG_5.jpg"), b"same photo")
+        write_bytes(os.path.join(self.card, "IMG_5.jpg"), b"same photo")
+        write_bytes(os.path.join(self.card, "IMG_5.xmp"), b"edit")
+        moves = [(os.path.join(self.card, name), os.path.join(self.day, name)) for name in ("IMG_5.jpg", "IMG_5.xmp")]
+        self.assertEqual(FileMover.move_group_noclobber(moves), [None, os.path.join(self.day, "IMG_5.xmp")])
+        self.assertEqual(sorted(os.listdir(self.card)), ["IMG_5.jpg"])
+
+
+if __name__ == "__main__":
+    unittest.main()
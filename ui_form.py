@@ -89,6 +89,9 @@ class Ui_Widget(object):
         self.format_comboBox.addItem("")
         self.format_comboBox.addItem("")
         self.format_comboBox.addItem("")
+        self.format_comboBox.addItem("")
+        self.format_comboBox.addItem("")
+        self.format_comboBox.addItem("")
         self.format_comboBox.setObjectName(u"format_comboBox")
 
         self.horizontalLayout_2.addWidget(self.format_comboBox)
@@ -106,6 +109,11 @@ class Ui_Widget(object):
 
         self.verticalLayout.addWidget(self.sep_videos_checkbox)
 
+        self.link_view_checkbox = QCheckBox(self.OptionsBox)
+        self.link_view_checkbox.setObjectName(u"link_view_checkbox")
+
+        self.verticalLayout.addWidget(self.link_view_checkbox)
+
         self.horizontalLayout_6 = QHBoxLayout()
         self.horizontalLayout_6.setObjectName(u"horizontalLayout_6")
         self.flatten_button = QPushButton(self.OptionsBox)
@@ -120,6 +128,24 @@ class Ui_Widget(object):
 
         self.horizontalLayout_6.addWidget(self.clean_filenames_button)
 
+        self.ingest_button = QPushButton(self.OptionsBox)
+        self.ingest_button.setObjectName(u"ingest_button")
+        self.ingest_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
+
+        self.horizontalLayout_6.addWidget(self.ingest_button)
+
+        self.similar_button = QPushButton(self.OptionsBox)
+        self.similar_button.setObjectName(u"similar_button")
+        self.similar_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
+
+        self.horizontalLayout_6.addWidget(self.similar_button)
+
+        self.browse_library_button = QPushButton(self.OptionsBox)
+        self.browse_library_button.setObjectName(u"browse_library_button")
+        self.browse_library_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
+
+        self.horizontalLayout_6.addWidget(self.browse_library_button)
+
 
         self.verticalLayout.addLayout(self.horizontalLayout_6)
 
@@ -157,6 +183,29 @@ class Ui_Widget(object):
 
         self.verticalLayout_5.addWidget(self.start_button)
 
+        self.horizontalLayout_7 = QHBoxLayout()
+        self.horizontalLayout_7.setObjectName(u"horizontalLayout_7")
+        self.pause_button = QPushButton(self.ActionsBox)
+        self.pause_button.setObjectName(u"pause_button")
+        self.pause_button.setEnabled(False)
+        self.pause_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
+        icon2 = QIcon(QIcon.fromTheme(QIcon.ThemeIcon.MediaPlaybackPause))
+        self.pause_button.setIcon(icon2)
+
+        self.horizontalLayout_7.addWidget(self.pause_button)
+
+        self.cancel_button = QPushButton(self.ActionsBox)
+        self.cancel_button.setObjectName(u"cancel_button")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
+        icon3 = QIcon(QIcon.fromTheme(QIcon.ThemeIcon.MediaPlaybackStop))
+        self.cancel_button.setIcon(icon3)
+
+        self.horizontalLayout_7.addWidget(self.cancel_button)
+
+
+        self.verticalLayout_5.addLayout(self.horizontalLayout_7)
+
         self.progress_bar = QProgressBar(self.ActionsBox)
         self.progress_bar.setObjectName(u"progress_bar")
         sizePolicy2 = QSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.MinimumExpanding)
@@ -311,15 +360,36 @@ class Ui_Widget(object):
         self.format_comboBox.setItemText(1, QCoreApplication.translate("Widget", u"By Year / Month / Day", None))
         self.format_comboBox.setItemText(2, QCoreApplication.translate("Widget", u"By Year / Month", None))
         self.format_comboBox.setItemText(3, QCoreApplication.translate("Widget", u"By Year / Day-Of-Year", None))
+        self.format_comboBox.setItemText(4, QCoreApplication.translate("Widget", u"By Event (date range)", None))
+        self.format_comboBox.setItemText(5, QCoreApplication.translate("Widget", u"By Year / Country / City", None))
+        self.format_comboBox.setItemText(6, QCoreApplication.translate("Widget", u"By Country / City / Day", None))
 
         self.rem_empty_checkbox.setText(QCoreApplication.translate("Widget", u"Remove Empty Folders", None))
         self.sep_videos_checkbox.setText(QCoreApplication.translate("Widget", u"Separate Videos", None))
+#if QT_CONFIG(tooltip)
+        self.link_view_checkbox.setToolTip(QCoreApplication.translate("Widget", u"Build a date-organized view out of hardlinks/reflinks/symlinks and leave the originals in place", None))
+#endif // QT_CONFIG(tooltip)
+        self.link_view_checkbox.setText(QCoreApplication.translate("Widget", u"Link View (Keep Originals)", None))
         self.flatten_button.setText(QCoreApplication.translate("Widget", u"Flatten Structure", None))
         self.clean_filenames_button.setText(QCoreApplication.translate("Widget", u"Clean Filenames", None))
+#if QT_CONFIG(tooltip)
+        self.ingest_button.setToolTip(QCoreApplication.translate("Widget", u"Copy a memory card straight into dated folders of the base directory", None))
+#endif // QT_CONFIG(tooltip)
+        self.ingest_button.setText(QCoreApplication.translate("Widget", u"Import from Card", None))
+#if QT_CONFIG(tooltip)
+        self.similar_button.setToolTip(QCoreApplication.translate("Widget", u"Report groups of near-duplicate photos (bursts, re-exports, recompressed copies)", None))
+#endif // QT_CONFIG(tooltip)
+        self.similar_button.setText(QCoreApplication.translate("Widget", u"Find Similar", None))
+#if QT_CONFIG(tooltip)
+        self.browse_library_button.setToolTip(QCoreApplication.translate("Widget", u"Browse the date folders of the base directory as thumbnails", None))
+#endif // QT_CONFIG(tooltip)
+        self.browse_library_button.setText(QCoreApplication.translate("Widget", u"Browse Library", None))
         self.startupadd_button.setText(QCoreApplication.translate("Widget", u"Add to Startup", None))
         self.startupremove_button.setText(QCoreApplication.translate("Widget", u"Remove from Startup", None))
         self.reset_all_button.setText(QCoreApplication.translate("Widget", u"Reset All Settings", None))
         self.start_button.setText(QCoreApplication.translate("Widget", u" Start", None))
+        self.pause_button.setText(QCoreApplication.translate("Widget", u" Pause", None))
+        self.cancel_button.setText(QCoreApplication.translate("Widget", u" Cancel", None))
         self.progress_bar.setFormat(QCoreApplication.translate("Widget", u"%p%", None))
         self.ExcludedFoldersPanel.setTitle(QCoreApplication.translate("Widget", u"Excluded Folders", None))
         self.add_excluded_button.setText(QCoreApplication.translate("Widget", u"Add Folder", None))